@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Řízení přijímání požadavků (admission control) pro OCR servery
+
+Omezená fronta s nastavitelnou hloubkou před omezeným počtem současně
+běžících rozpoznávání. Při zaplnění fronty se požadavek okamžitě odmítne
+s doporučeným `Retry-After` místo toho, aby čekal až do timeoutu na straně
+Node.js. Požadavky mají dvě prioritní třídy - interaktivní nahrání jedné
+stránky předbíhají dávkové zpracování (back-fill) a dávky smí obsadit jen
+část fronty.
+"""
+
+import os
+import math
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BATCH = 'batch'
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+
+# Výchozí konfigurace z prostředí
+MAX_CONCURRENT = int(os.environ.get('OCR_MAX_CONCURRENT', 1))
+MAX_QUEUE = int(os.environ.get('OCR_MAX_QUEUE', 8))
+MAX_QUEUE_WAIT = float(os.environ.get('OCR_MAX_QUEUE_WAIT', 30))
+BATCH_QUEUE_SHARE = float(os.environ.get('OCR_BATCH_QUEUE_SHARE', 0.5))
+
+# Odhad doby zpracování před prvním dokončeným požadavkem (sekundy)
+INITIAL_SERVICE_TIME = 5.0
+
+
+class AdmissionRejected(Exception):
+    """
+    Požadavek nebyl přijat - fronta je plná nebo čekání trvalo příliš dlouho
+    """
+
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_priority(value):
+    """
+    Převede hodnotu z požadavku na prioritní třídu (výchozí je interaktivní)
+    """
+    value = (value or '').strip().lower()
+    return PRIORITY_BATCH if value in ('batch', 'backfill', 'low') else PRIORITY_INTERACTIVE
+
+
+class AdmissionController:
+    """
+    Omezená prioritní fronta před omezeným počtem souběžných úloh
+    """
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT, max_queue=MAX_QUEUE,
+                 max_wait=MAX_QUEUE_WAIT, batch_share=BATCH_QUEUE_SHARE):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.max_batch_queue = int(self.max_queue * batch_share)
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = {priority: deque() for priority in PRIORITIES}
+        self._service_time = INITIAL_SERVICE_TIME
+        self._wait_times = deque(maxlen=200)
+        self._counters = {
+            "admitted": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "completed": 0,
+        }
+
+    def _queue_length(self):
+        return sum(len(q) for q in self._waiting.values())
+
+    def _retry_after(self, position):
+        # Odhad, kdy se uvolní místo pro požadavek na dané pozici ve frontě
+        batches = math.ceil((position + 1) / self.max_concurrent)
+        return max(1, int(math.ceil(batches * self._service_time)))
+
+    def _next_ticket(self):
+        for priority in PRIORITIES:
+            if self._waiting[priority]:
+                return self._waiting[priority][0]
+        return None
+
+    def acquire(self, priority=PRIORITY_INTERACTIVE):
+        """
+        Počká na volné místo pro zpracování nebo vyvolá AdmissionRejected
+
+        Returns:
+            Čas čekání ve frontě (sekundy)
+        """
+        started = time.time()
+
+        with self._cond:
+            if self._active < self.max_concurrent and self._queue_length() == 0:
+                self._active += 1
+                self._counters["admitted"] += 1
+                self._wait_times.append(0.0)
+                return 0.0
+
+            queue_length = self._queue_length()
+            if priority == PRIORITY_BATCH and len(self._waiting[PRIORITY_BATCH]) >= self.max_batch_queue:
+                self._counters["rejected"] += 1
+                raise AdmissionRejected("Fronta pro dávkové zpracování je plná", 429,
+                                        self._retry_after(queue_length))
+            if queue_length >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise AdmissionRejected("Server je přetížen, fronta požadavků je plná", 503,
+                                        self._retry_after(queue_length))
+
+            ticket = object()
+            self._waiting[priority].append(ticket)
+            deadline = started + self.max_wait
+
+            try:
+                while not (self._active < self.max_concurrent and self._next_ticket() is ticket):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self._counters["timed_out"] += 1
+                        raise AdmissionRejected("Vypršel čas čekání ve frontě", 503,
+                                                self._retry_after(self._queue_length()))
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting[priority].remove(ticket)
+                # Odebrání z čela fronty může uvolnit další čekající
+                self._cond.notify_all()
+
+            self._active += 1
+            self._counters["admitted"] += 1
+            waited = time.time() - started
+            self._wait_times.append(waited)
+            return waited
+
+    def release(self, service_time=None):
+        """
+        Uvolní místo po dokončení zpracování
+        """
+        with self._cond:
+            self._active -= 1
+            self._counters["completed"] += 1
+            if service_time is not None:
+                # Klouzavý průměr doby zpracování pro odhad Retry-After
+                self._service_time = 0.8 * self._service_time + 0.2 * service_time
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_INTERACTIVE):
+        """
+        Kontextový manažer kolem acquire/release
+
+        Yields:
+            Čas čekání ve frontě (sekundy)
+        """
+        waited = self.acquire(priority)
+        started = time.time()
+        try:
+            yield waited
+        finally:
+            self.release(time.time() - started)
+
+    def stats(self):
+        """
+        Stav fronty pro diagnostické endpointy
+        """
+        with self._cond:
+            wait_times = sorted(self._wait_times)
+            return {
+                "active": self._active,
+                "max_concurrent": self.max_concurrent,
+                "queue_depth": self._queue_length(),
+                "queue_depth_by_priority": {p: len(q) for p, q in self._waiting.items()},
+                "max_queue": self.max_queue,
+                "max_batch_queue": self.max_batch_queue,
+                "avg_service_time": self._service_time,
+                "wait_time_avg": (sum(wait_times) / len(wait_times)) if wait_times else 0.0,
+                "wait_time_p95": wait_times[int(len(wait_times) * 0.95)] if wait_times else 0.0,
+                **self._counters,
+            }
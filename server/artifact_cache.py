@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Krátkodobá lokální cache předzpracovaných obrazů stránky
+
+Když uživatel nahrání zopakuje s jiným jazykem (eng -> ces) nebo jiným
+enginem, optimized_trocr, kraken_api i light-ocr dřív znovu dekódovaly
+obrázek, zmenšovaly ho a počítaly všechny binarizace, ačkoli na jazyku
+nezávisí. Zde se výsledky předzpracování ukládají podle obsahu obrázku
+(SHA-1 bajtů souboru nebo nahraných dat) a parametrů kroku, takže
+opakovaný pokus zaplatí jen samotné rozpoznání.
+
+Uložení:
+    <OCR_ARTIFACT_DIR>/<klíč obrázku>/<klíč artefaktu>.npy             - obraz (např. zmenšený BGR)
+    <OCR_ARTIFACT_DIR>/<klíč obrázku>/<klíč artefaktu>.w<šířka>.bits.npy - binární obraz 0/255
+                                                                         jako np.packbits po řádcích
+
+Soubory .npy se načítají mapováním do paměti (binární obrazy se rozbalí,
+což je výrazně levnější než jejich výpočet). Cache se omezuje stářím od
+posledního použití (OCR_ARTIFACT_TTL) a celkovou velikostí
+(OCR_ARTIFACT_CACHE_MB) - nad limitem se mažou nejdéle nepoužité stránky.
+Zápis je atomický (dočasný soubor + os.replace), takže ji mohou sdílet
+procesy poolu i pracovníci pre-fork serveru.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from functools import lru_cache
+import cv2
+import numpy as np
+
+# Zapnutí cache předzpracování
+ENABLED = os.environ.get('OCR_ARTIFACT_CACHE', '1') == '1'
+
+# Adresář cache
+CACHE_DIR = os.environ.get(
+    'OCR_ARTIFACT_DIR',
+    os.path.join(tempfile.gettempdir(), 'welldiary-ocr', 'artifacts')
+)
+
+# Maximální velikost cache a doba života stránky od posledního použití (sekundy)
+MAX_BYTES = int(os.environ.get('OCR_ARTIFACT_CACHE_MB', 256)) * 1024 * 1024
+TTL = float(os.environ.get('OCR_ARTIFACT_TTL', 600))
+
+# Jak často proces kontroluje limity cache po zápisu (sekundy)
+PRUNE_INTERVAL = 10.0
+
+# Verze formátu a předzpracování - zvýšení zneplatní všechny uložené artefakty
+FORMAT_VERSION = 1
+
+_prune_lock = threading.Lock()
+_last_prune = 0.0
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stored_bytes": 0}
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+@lru_cache(maxsize=64)
+def _file_key(path, size, mtime_ns):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def image_key(source):
+    """
+    Klíč obrázku podle obsahu
+
+    Args:
+        source: Cesta k souboru nebo bajty nahraného obrázku
+
+    Returns:
+        Hex SHA-1 obsahu nebo None, pokud soubor nelze přečíst
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha1(source).hexdigest()
+    try:
+        # Procesy poolu klíč téhož souboru spočítají jen jednou
+        stat = os.stat(source)
+        return _file_key(os.path.abspath(source), stat.st_size, stat.st_mtime_ns)
+    except (OSError, TypeError):
+        return None
+
+
+def artifact_key(name, params):
+    """
+    Klíč artefaktu podle názvu kroku a jeho parametrů
+    """
+    description = json.dumps([FORMAT_VERSION, name, sorted(params.items())], default=str)
+    return hashlib.sha1(description.encode()).hexdigest()[:20]
+
+
+def _is_binary(array):
+    return array.dtype == np.uint8 and np.count_nonzero(array == 0) + np.count_nonzero(array == 255) == array.size
+
+
+def _write_array(path, array):
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(temp_path, path)
+
+
+class PageArtifacts:
+    """
+    Předzpracované obrazy jedné stránky - lokálně v paměti a sdíleně na disku
+
+    Zdrojový obrázek se dekóduje líně až tehdy, když některý artefakt
+    v cache chybí. Jeden objekt mohou sdílet vlákna (režim vláken), každý
+    artefakt získaný přes `get` se pak v procesu spočítá nejvýše jednou.
+    Různé artefakty se počítají souběžně - každý klíč má vlastní zámek.
+    """
+
+    def __init__(self, source, key=None):
+        self.source = source
+        self.key = key
+        self.directory = os.path.join(CACHE_DIR, key) if key else None
+        self._image = None
+        self._decoded = False
+        self._memo = {}
+        self._key_locks = {}
+        self._lock = threading.RLock()
+
+    @property
+    def cached(self):
+        """
+        True, pokud cache obsahuje nějaký artefakt stránky (obrázek už se jednou dekódoval)
+        """
+        return self.directory is not None and os.path.isdir(self.directory)
+
+    def image(self):
+        """
+        Dekódovaný zdrojový obrázek (BGR) nebo None, pokud ho nelze načíst
+        """
+        with self._lock:
+            if not self._decoded:
+                if isinstance(self.source, (bytes, bytearray, memoryview)):
+                    self._image = cv2.imdecode(np.frombuffer(self.source, dtype=np.uint8), cv2.IMREAD_COLOR)
+                else:
+                    self._image = cv2.imread(self.source)
+                self._decoded = True
+            return self._image
+
+    def load(self, name, **params):
+        """
+        Artefakt z cache (pole jen pro čtení) nebo None
+        """
+        if self.directory is None:
+            return None
+        prefix = artifact_key(name, params) + '.'
+        try:
+            entries = [entry for entry in os.listdir(self.directory)
+                       if entry.startswith(prefix) and entry.endswith('.npy')]
+        except OSError:
+            entries = []
+        for entry in entries:
+            try:
+                stored = np.load(os.path.join(self.directory, entry), mmap_mode='r')
+                if entry.endswith('.bits.npy'):
+                    width = int(entry[len(prefix) + 1:-len('.bits.npy')])
+                    array = np.unpackbits(stored, axis=-1, count=width) * np.uint8(255)
+                    array.setflags(write=False)
+                else:
+                    array = np.asarray(stored)
+            except (OSError, ValueError):
+                continue
+            # Poslední použití posouvá stránku na konec pořadí pro vyřazení
+            try:
+                os.utime(self.directory)
+            except OSError:
+                pass
+            _count("hits")
+            return array
+        _count("misses")
+        return None
+
+    def store(self, name, array, **params):
+        """
+        Uloží artefakt - binární obraz (jen 0 a 255) jako bity, ostatní jako .npy
+
+        Returns:
+            Uložené pole (jen pro čtení)
+        """
+        array.setflags(write=False)
+        if self.directory is None:
+            return array
+        key = artifact_key(name, params)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if _is_binary(array):
+                path = os.path.join(self.directory, f"{key}.w{array.shape[-1]}.bits.npy")
+                _write_array(path, np.packbits(array > 0, axis=-1))
+            else:
+                path = os.path.join(self.directory, f"{key}.npy")
+                _write_array(path, np.ascontiguousarray(array))
+            _count("stored_bytes", os.path.getsize(path))
+        except OSError as e:
+            print(f"Varování: Nelze uložit artefakt {name} do cache: {str(e)}", file=sys.stderr)
+            return array
+        prune()
+        return array
+
+    def get(self, name, create, **params):
+        """
+        Artefakt z paměti, z cache, nebo spočítaný funkcí `create` a uložený
+
+        Args:
+            name: Název kroku předzpracování
+            create: Funkce bez argumentů vracející pole (None = nelze spočítat, neukládá se)
+            params: Parametry kroku (součást klíče)
+
+        Returns:
+            Pole jen pro čtení nebo None
+        """
+        memo_key = artifact_key(name, params)
+        with self._lock:
+            if memo_key in self._memo:
+                return self._memo[memo_key]
+            key_lock = self._key_locks.setdefault(memo_key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                if memo_key in self._memo:
+                    return self._memo[memo_key]
+            array = self.load(name, **params)
+            if array is None:
+                array = create()
+                if array is None:
+                    # Nespočítaný artefakt se nepamatuje - další volání to zkusí znovu
+                    return None
+                array = self.store(name, array, **params)
+            with self._lock:
+                self._memo[memo_key] = array
+            return array
+
+
+def open_page(source):
+    """
+    Artefakty stránky podle cesty k obrázku nebo bajtů nahraného obrázku
+    """
+    return PageArtifacts(source, image_key(source) if ENABLED else None)
+
+
+def _directory_usage(path):
+    size = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    size += entry.stat().st_size
+                except OSError:
+                    pass
+    except OSError:
+        pass
+    return size
+
+
+def prune(force=False):
+    """
+    Vyřadí stránky starší než TTL a nejdéle nepoužité stránky nad limit velikosti
+
+    Returns:
+        Tuple (počet stránek, velikost v bajtech) po vyřazení
+    """
+    global _last_prune
+    with _prune_lock:
+        now = time.time()
+        if not force and now - _last_prune < PRUNE_INTERVAL:
+            return None
+        _last_prune = now
+
+        pages = []
+        try:
+            with os.scandir(CACHE_DIR) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        try:
+                            pages.append((entry.stat().st_mtime, entry.path, _directory_usage(entry.path)))
+                        except OSError:
+                            pass
+        except OSError:
+            return 0, 0
+
+        pages.sort()
+        total = sum(size for _, _, size in pages)
+        kept = len(pages)
+        for mtime, path, size in pages:
+            if now - mtime <= TTL and total <= MAX_BYTES:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            kept -= 1
+        return kept, total
+
+
+def describe():
+    """
+    Přehled cache pro diagnostické endpointy
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        "enabled": ENABLED,
+        "directory": CACHE_DIR,
+        "max_mb": MAX_BYTES / 1024 / 1024,
+        "ttl": TTL,
+    })
+    return stats
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Vzorkované ukládání mezivýsledků předzpracování mimo kritickou cestu OCR
+
+Ladicí obrázky (`variant_*.png`, `oriented_*.png` jako v `debug_images/`)
+se dříve ukládaly synchronně během rozpoznávání, což je pro provoz příliš
+pomalé. Zde se ukládá jen vybraný podíl požadavků (OCR_CAPTURE_RATE)
+a volitelně výsledky s nízkou důvěrou (OCR_CAPTURE_LOW_CONFIDENCE).
+Rozpoznávání předá jen odkazy na hotová pole do omezené fronty, kódování
+PNG a zápis na disk dělá vlákno na pozadí. Plná fronta záznam zahodí
+místo blokování OCR a adresář zachytávání má diskovou kvótu - při jejím
+překročení se mažou nejstarší požadavky.
+
+Každý proces (i pracovníci poolu) má vlastní vlákno zapisovače; záznamy,
+které ve frontě zůstanou při ukončení procesu, se zahodí.
+"""
+
+import os
+import sys
+import time
+import atexit
+import queue
+import shutil
+import zlib
+import tempfile
+import threading
+import cv2
+
+# Podíl požadavků, jejichž mezivýsledky se ukládají (0 = vypnuto)
+CAPTURE_RATE = float(os.environ.get('OCR_CAPTURE_RATE', 0))
+
+# Ukládání výsledků s důvěrou pod touto hranicí (0-100, 0 = vypnuto)
+LOW_CONFIDENCE = float(os.environ.get('OCR_CAPTURE_LOW_CONFIDENCE', 0))
+
+# Adresář zachycených obrázků
+CAPTURE_DIR = os.environ.get(
+    'OCR_CAPTURE_DIR',
+    os.path.join(tempfile.gettempdir(), 'welldiary-ocr', 'debug_images')
+)
+
+# Maximální počet obrázků čekajících na zápis
+MAX_QUEUE = int(os.environ.get('OCR_CAPTURE_QUEUE', 32))
+
+# Disková kvóta adresáře zachytávání (MB)
+QUOTA_MB = float(os.environ.get('OCR_CAPTURE_QUOTA_MB', 200))
+
+# Jak dlouho se při ukončení procesu čeká na dopsání fronty (sekundy)
+CLOSE_TIMEOUT = 2.0
+
+
+def capture_enabled():
+    return CAPTURE_RATE > 0 or LOW_CONFIDENCE > 0
+
+
+def is_sampled(request_key, rate=CAPTURE_RATE):
+    """
+    Zda požadavek patří do vzorku - rozhoduje hash klíče, takže všechny
+    varianty téže stránky (i v různých procesech) dopadnou stejně
+    """
+    if rate <= 0:
+        return False
+    if rate >= 1:
+        return True
+    return zlib.crc32(str(request_key).encode()) / 0xFFFFFFFF < rate
+
+
+def should_capture(request_key, confidence=None):
+    """
+    Zda uložit mezivýsledky - vzorek požadavků nebo nízká důvěra výsledku
+    """
+    if is_sampled(request_key):
+        return True
+    return LOW_CONFIDENCE > 0 and confidence is not None and confidence < LOW_CONFIDENCE
+
+
+def _directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class CaptureWriter:
+    """
+    Zapisovač na pozadí s omezenou frontou a diskovou kvótou
+    """
+
+    def __init__(self, directory=CAPTURE_DIR, max_queue=MAX_QUEUE, quota_mb=QUOTA_MB):
+        self.directory = directory
+        self.quota = int(quota_mb * 1024 * 1024)
+        self._queue = queue.Queue(maxsize=max(1, max_queue))
+        self._used = None
+        self._lock = threading.Lock()
+        self._counters = {"queued": 0, "written": 0, "dropped": 0, "evicted": 0, "failed": 0}
+        self._thread = threading.Thread(target=self._run, daemon=True, name="debug-capture")
+        self._thread.start()
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def submit(self, request_key, name, image):
+        """
+        Předá obrázek k zápisu bez čekání
+
+        Args:
+            request_key: Klíč požadavku (určuje podadresář)
+            name: Jméno souboru bez přípony
+            image: NumPy pole - po předání se už nesmí měnit
+
+        Returns:
+            True, pokud byl obrázek zařazen, False, pokud byla fronta plná
+        """
+        try:
+            self._queue.put_nowait((request_key, name, image))
+        except queue.Full:
+            self._count("dropped")
+            return False
+        self._count("queued")
+        return True
+
+    def request_directory(self, request_key):
+        # Datum v názvu usnadní procházení, mazání nad kvótu řadí podle času změny
+        day = time.strftime('%Y%m%d')
+        return os.path.join(self.directory, f"{day}-{zlib.crc32(str(request_key).encode()):08x}")
+
+    def _evict(self, needed):
+        """
+        Smaže nejstarší požadavky, dokud se nový soubor nevejde do kvóty
+        """
+        # Kvótu sdílí všechny procesy - skutečné využití se přepočítá z disku
+        self._used = _directory_size(self.directory)
+        try:
+            entries = sorted(os.scandir(self.directory), key=lambda e: e.stat().st_mtime)
+        except OSError:
+            entries = []
+
+        for entry in entries:
+            if self._used + needed <= self.quota:
+                break
+            size = _directory_size(entry.path) if entry.is_dir() else entry.stat().st_size
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+            self._used -= size
+            self._count("evicted")
+
+        return self._used + needed <= self.quota
+
+    def _write(self, request_key, name, image):
+        ok, encoded = cv2.imencode('.png', image)
+        if not ok:
+            raise ValueError(f"Nelze zakódovat {name}")
+        data = encoded.tobytes()
+
+        if self._used is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._used = _directory_size(self.directory)
+        if self._used + len(data) > self.quota and not self._evict(len(data)):
+            self._count("dropped")
+            return
+
+        directory = self.request_directory(request_key)
+        path = os.path.join(directory, f"{name}.png")
+        if os.path.exists(path):
+            return
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        self._used += len(data)
+        self._count("written")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            request_key, name, image = item
+            try:
+                self._write(request_key, name, image)
+            except Exception as e:
+                self._count("failed")
+                print(f"Varování: Nelze uložit ladicí obrázek {name}: {str(e)}", file=sys.stderr)
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """
+        Dopíše frontu a ukončí vlákno - vlákno uvnitř kódování OpenCV by při
+        ukončení interpretu shodilo proces
+        """
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, pending=self._queue.qsize(), used_bytes=self._used)
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """
+    Zapisovač aktuálního procesu (po forku pracovníka se vytvoří nový)
+    """
+    global _writer, _writer_pid
+    with _writer_lock:
+        if _writer is None or _writer_pid != os.getpid():
+            _writer = CaptureWriter()
+            _writer_pid = os.getpid()
+            atexit.register(_writer.close)
+        return _writer
+
+
+def capture_images(request_key, images, confidence=None):
+    """
+    Uloží mezivýsledky požadavku, pokud patří do vzorku nebo mají nízkou důvěru
+
+    Args:
+        request_key: Klíč požadavku (např. cesta k nahranému obrázku)
+        images: Dictionary {jméno souboru: NumPy pole}
+        confidence: Důvěra výsledku (0-100), pokud je známa
+
+    Returns:
+        Počet obrázků předaných zapisovači
+    """
+    if not capture_enabled() or not should_capture(request_key, confidence):
+        return 0
+    writer = get_writer()
+    return sum(1 for name, image in images.items()
+               if image is not None and writer.submit(request_key, name, image))
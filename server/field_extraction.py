@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Rychlá extrakce strukturovaných polí deníku (datum, nálada, spánek)
+
+Grafy nálady a spánku potřebují jen několik čísel, ne celý přepis stránky.
+Tento režim proto místo víceprůchodového přepisu spustí jeden průchod
+Tesseractu s konfigurací zvýhodňující klíčová slova a čísla (user-words
+a user-patterns pro Nálada/Spánek/Mood/Sleep) a pole hledá stejnými vzory
+jako `extract-utils.extractJournalData` (výklad data se liší, viz parse_date). Stránka se čte po částech od
+záhlaví a zpracování končí, jakmile jsou všechna požadovaná pole nalezena
+s dostatečnou důvěryhodností. Pokud je nalezeno klíčové slovo, ale hodnota
+chybí nebo je nejistá, oblast vpravo od klíčového slova se znovu rozpozná
+s omezením na číslice.
+
+Použití: python field_extraction.py <cesta_k_obrazku> [jazyk] [--fields mood,sleep,date]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import datetime
+import tempfile
+import cv2
+import numpy as np
+from ocr_words import image_to_words
+
+# Set Tesseract to use our higher quality training data
+TESSDATA_PREFIX = os.path.join(os.getcwd(), 'tessdata')
+os.environ['TESSDATA_PREFIX'] = TESSDATA_PREFIX
+
+FIELDS = ('date', 'mood', 'sleep')
+
+# Minimální důvěryhodnost (0-100), se kterou se pole přijme bez dalšího průchodu
+MIN_FIELD_CONFIDENCE = float(os.environ.get('OCR_FIELD_MIN_CONFIDENCE', 60))
+
+# Šířka, na kterou se stránka zmenší před rozpoznáváním
+WORK_WIDTH = 1400
+
+# Podíl výšky stránky čtený v prvním průchodu (záhlaví s datem a hodnotami)
+HEADER_FRACTION = 0.35
+
+# Znaky povolené při opakovaném rozpoznání hodnoty
+VALUE_WHITELISTS = {
+    'mood': '0123456789.,/',
+    'sleep': '0123456789.,h',
+    'date': '0123456789./-',
+}
+
+# Klíčová slova a vzory pro Tesseract
+USER_WORDS = [
+    'Nálada', 'Spánek', 'Pocit', 'Datum', 'hodin', 'hodiny', 'Spal', 'Spala', 'jsem',
+    'Mood', 'Sleep', 'Feeling', 'Date', 'hours', 'Slept', 'out', 'of',
+]
+USER_PATTERNS = [
+    r'\d/10', r'\d\d/10', r'\d.\d/10', r'\dh', r'\d.\dh',
+    r'\d.\d.\d\d\d\d', r'\d\d.\d\d.\d\d\d\d', r'\d\d\d\d-\d\d-\d\d',
+]
+
+# Vzory převzaté z extract-utils.ts (extractJournalData). Nalezené datum se ale
+# vykládá jinak než `new Date()` v TS: číselné datum je den.měsíc.rok (TS ho
+# čte jako měsíc/den), a vzory s názvem měsíce zachytí celé datum (v TS
+# skupina obsahuje jen název měsíce, takže se tam takové datum nepřevede)
+MONTHS_EN = ['january', 'february', 'march', 'april', 'may', 'june', 'july',
+             'august', 'september', 'october', 'november', 'december']
+MONTHS_CS = ['leden', 'únor', 'březen', 'duben', 'květen', 'červen', 'červenec',
+             'srpen', 'září', 'říjen', 'listopad', 'prosinec']
+
+DATE_PATTERNS = [
+    ('iso', re.compile(r'Date:\s*(\d{4}-\d{2}-\d{2})', re.I)),
+    ('dmy', re.compile(r'Datum:\s*(\d{1,2}[./-]\d{1,2}[./-]\d{2,4})', re.I)),
+    ('dmy', re.compile(r'(\d{1,2}[./-]\d{1,2}[./-]\d{2,4})')),
+    ('month', re.compile(r'((?:' + '|'.join(MONTHS_EN) + r')\s+\d{1,2},?\s+\d{4})', re.I)),
+    ('month', re.compile(r'((?:' + '|'.join(MONTHS_CS) + r')\s+\d{1,2},?\s+\d{4})', re.I)),
+]
+
+MOOD_PATTERNS = [
+    re.compile(r'Mood:\s*(\d+(\.\d+)?)\s*/?\s*(10)?', re.I),
+    re.compile(r'Nálada:\s*(\d+(\.\d+)?)\s*/?\s*(10)?', re.I),
+    re.compile(r'Pocit:\s*(\d+(\.\d+)?)\s*/?\s*(10)?', re.I),
+    re.compile(r'Feeling:\s*(\d+(\.\d+)?)\s*(out of)?\s*(10)?', re.I),
+    re.compile(r'Mood[-: ]+(\d+(\.\d+)?)', re.I),
+    re.compile(r'N[aá]lada[-: ]+(\d+(\.\d+)?)', re.I),
+]
+
+SLEEP_PATTERNS = [
+    re.compile(r'Sleep:\s*(\d+(\.\d+)?)\s*h(ours?)?', re.I),
+    re.compile(r'Sp[aá]nek:\s*(\d+(\.\d+)?)\s*h(odin)?', re.I),
+    re.compile(r'Sleep[-: ]+(\d+(\.\d+)?)', re.I),
+    re.compile(r'Sp[aá]nek[-: ]+(\d+(\.\d+)?)', re.I),
+    re.compile(r'Spal[a]? jsem\s*(\d+(\.\d+)?)\s*hodin', re.I),
+    re.compile(r'Slept\s*(\d+(\.\d+)?)\s*hours', re.I),
+]
+
+# Klíčová slova polí - podle nich se hledá oblast pro opakované rozpoznání
+FIELD_KEYWORDS = {
+    'date': re.compile(r'^(date|datum):?$', re.I),
+    'mood': re.compile(r'^(mood|n[aá]lada|pocit|feeling):?$', re.I),
+    'sleep': re.compile(r'^(sleep|sp[aá]nek|slept):?$', re.I),
+}
+
+NUMBER_RE = re.compile(r'(\d+(?:[.,]\d+)?)')
+
+
+def parse_mood(value):
+    """
+    Normalizace nálady na stupnici 1-100 (stejně jako extract-utils.ts)
+    """
+    value = float(value)
+    if value <= 10:
+        return round(value * 10)
+    if value <= 100:
+        return round(value)
+    return None
+
+
+def parse_sleep(value):
+    value = float(value)
+    return value if 0 <= value <= 24 else None
+
+
+def parse_date(kind, value):
+    """
+    Převede nalezené datum na ISO formát (YYYY-MM-DD)
+
+    Číselné datum se čte jako den.měsíc.rok (české deníky), ne měsíc/den jako
+    `new Date()` v extract-utils.ts - např. 3.5.2024 je zde 2024-05-03.
+    """
+    try:
+        if kind == 'iso':
+            return datetime.date.fromisoformat(value).isoformat()
+
+        if kind == 'dmy':
+            day, month, year = (int(part) for part in re.split(r'[./-]', value))
+            if year < 100:
+                year += 2000
+            return datetime.date(year, month, day).isoformat()
+
+        name, day, year = re.match(r'(\S+)\s+(\d{1,2}),?\s+(\d{4})', value).groups()
+        name = name.lower()
+        months = MONTHS_EN if name in MONTHS_EN else MONTHS_CS
+        return datetime.date(int(year), months.index(name) + 1, int(day)).isoformat()
+    except (ValueError, AttributeError):
+        return None
+
+
+def _line_spans(words, indices):
+    """
+    Text řádku a rozsahy znaků jednotlivých slov
+    """
+    spans = []
+    position = 0
+    for i in indices:
+        spans.append((i, position, position + len(words.words[i])))
+        position += len(words.words[i]) + 1
+    return ' '.join(words.words[i] for i in indices), spans
+
+
+def _span_confidence(words, spans, start, end):
+    # Důvěryhodnost hodnoty je důvěryhodnost nejslabšího slova, které ji obsahuje
+    confidences = [words.conf[i] for i, a, b in spans if a < end and b > start]
+    return float(min(confidences)) if confidences else 0.0
+
+
+def find_fields(words, fields):
+    """
+    Najde pole ve slovech rozpoznaných Tesseractem
+
+    Args:
+        words: WordTable
+        fields: Požadovaná pole
+
+    Returns:
+        Tuple (slovník {pole: (hodnota, důvěryhodnost)}, slovník {pole: index slova s klíčovým slovem})
+    """
+    found = {}
+    keywords = {}
+
+    line_ids = words.line_ids()
+    for line_id in range(int(line_ids[-1]) + 1 if len(line_ids) else 0):
+        indices = np.flatnonzero(line_ids == line_id)
+        line, spans = _line_spans(words, indices)
+
+        for i in indices:
+            for field in fields:
+                if field not in keywords and FIELD_KEYWORDS[field].match(words.words[i]):
+                    keywords[field] = int(i)
+
+        candidates = []
+        if 'date' in fields:
+            for kind, pattern in DATE_PATTERNS:
+                match = pattern.search(line)
+                if match:
+                    candidates.append(('date', parse_date(kind, match.group(1)), match.span(1)))
+                    break
+        if 'mood' in fields:
+            for pattern in MOOD_PATTERNS:
+                match = pattern.search(line)
+                if match:
+                    candidates.append(('mood', parse_mood(match.group(1)), match.span(1)))
+                    break
+        if 'sleep' in fields:
+            for pattern in SLEEP_PATTERNS:
+                match = pattern.search(line)
+                if match:
+                    candidates.append(('sleep', parse_sleep(match.group(1)), match.span(1)))
+                    break
+
+        for field, value, (start, end) in candidates:
+            if value is None:
+                continue
+            confidence = _span_confidence(words, spans, start, end)
+            if field not in found or confidence > found[field][1]:
+                found[field] = (value, confidence)
+
+    return found, keywords
+
+
+def recognize_value(image, words, keyword_index, field, lang):
+    """
+    Znovu rozpozná oblast vpravo od klíčového slova s omezením na číslice
+
+    Returns:
+        Tuple (hodnota, důvěryhodnost) nebo None
+    """
+    left, top, width, height = (int(v) for v in words.boxes[keyword_index])
+    x0 = left + width
+    x1 = min(image.shape[1], x0 + 12 * height)
+    y0 = max(0, top - height // 2)
+    y1 = min(image.shape[0], top + height + height // 2)
+    if x1 - x0 < height or y1 <= y0:
+        return None
+
+    region = cv2.resize(image[y0:y1, x0:x1], None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    _, region = cv2.threshold(region, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    config = f"--psm 7 --oem 1 -l {lang} -c tessedit_char_whitelist={VALUE_WHITELISTS[field]}"
+    value_words = image_to_words(region, config=config)
+    text = value_words.text()
+
+    if field == 'date':
+        match = re.search(r'(\d{1,2}[./-]\d{1,2}[./-]\d{2,4})', text)
+        value = parse_date('dmy', match.group(1)) if match else None
+    else:
+        match = NUMBER_RE.search(text)
+        if not match:
+            return None
+        number = match.group(1).replace(',', '.')
+        value = parse_mood(number) if field == 'mood' else parse_sleep(number)
+
+    if value is None:
+        return None
+    return value, value_words.mean_confidence()
+
+
+def _split_row(binary, fraction):
+    """
+    Najde řádek obrazu bez inkoustu poblíž dané výšky (aby se nerozdělil řádek textu)
+    """
+    height = binary.shape[0]
+    target = int(height * fraction)
+    window = max(1, height // 20)
+    lo, hi = max(1, target - window), min(height - 1, target + window)
+    if lo >= hi:
+        return target
+    ink = (binary[lo:hi] == 0).sum(axis=1)
+    return lo + int(np.argmin(ink))
+
+
+def _write_word_lists():
+    # Seznamy pro --user-words a --user-patterns se zapisují jednou
+    directory = os.path.join(tempfile.gettempdir(), 'welldiary-ocr')
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for name, lines in (('field_words.txt', USER_WORDS), ('field_patterns.txt', USER_PATTERNS)):
+        path = os.path.join(directory, name)
+        content = '\n'.join(lines) + '\n'
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                current = f.read()
+        except OSError:
+            current = None
+        if current != content:
+            # Soubor sdílí souběžné procesy - zápis přes dočasný soubor a os.replace
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        paths.append(path)
+    return paths
+
+
+def extract_fields(image_path, language='ces', fields=FIELDS):
+    """
+    Extrahuje pole deníku z obrázku stránky
+
+    Args:
+        image_path: Cesta k souboru s obrázkem
+        language: Jazyk pro OCR (použije se přímo, bez vzorkování jazyka)
+        fields: Požadovaná pole (podmnožina 'date', 'mood', 'sleep')
+
+    Returns:
+        Dictionary s typovanými poli a jejich důvěryhodností
+    """
+    started = time.time()
+    fields = [field for field in fields if field in FIELDS]
+
+    image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return {"success": False, "error": f"Nelze načíst obrázek {image_path}"}
+
+    if image.shape[1] > WORK_WIDTH:
+        scale = WORK_WIDTH / image.shape[1]
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    blur = cv2.GaussianBlur(image, (3, 3), 0)
+    _, binary = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    if language != 'eng' and not os.path.exists(os.path.join(TESSDATA_PREFIX, f'{language}.traineddata')):
+        print(f"Varování: Trénovací data pro {language} nenalezena, používám eng", file=sys.stderr)
+        language = 'eng'
+
+    words_path, patterns_path = _write_word_lists()
+    config = (f"--psm 6 --oem 1 -l {language} "
+              f"--user-words {words_path} --user-patterns {patterns_path}")
+
+    # Nejprve záhlaví stránky, zbytek jen pokud pole stále chybí
+    split = _split_row(binary, HEADER_FRACTION)
+    stages = [(0, split), (split, binary.shape[0])]
+
+    found = {}
+    passes = 0
+    for y0, y1 in stages:
+        if y1 <= y0:
+            continue
+        stage_words = image_to_words(binary[y0:y1], config=config)
+        passes += 1
+        stage_found, keywords = find_fields(stage_words, fields)
+
+        for field in fields:
+            current = found.get(field)
+            candidate = stage_found.get(field)
+
+            # Nalezené klíčové slovo bez jisté hodnoty - číslice vpravo od něj
+            if (candidate is None or candidate[1] < MIN_FIELD_CONFIDENCE) and field in keywords:
+                retry = recognize_value(binary[y0:y1], stage_words, keywords[field], field, language)
+                passes += 1
+                if retry is not None and (candidate is None or retry[1] > candidate[1]):
+                    candidate = retry
+
+            if candidate is not None and (current is None or candidate[1] > current[1]):
+                found[field] = candidate
+
+        if all(field in found and found[field][1] >= MIN_FIELD_CONFIDENCE for field in fields):
+            break
+
+    print(f"Extrakce polí: {passes} průchodů Tesseractu, {time.time() - started:.2f} s", file=sys.stderr)
+
+    return {
+        "success": bool(found),
+        "fields": {field: found[field][0] if field in found else None for field in fields},
+        "confidence": {field: round(found[field][1] / 100.0, 3) for field in found},
+        "missing": [field for field in fields if field not in found],
+        "language": language,
+        "tesseract_passes": passes,
+        "execution_time": time.time() - started
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rychlá extrakce data, nálady a spánku ze stránky deníku")
+    parser.add_argument('image', help="Cesta k obrázku")
+    parser.add_argument('language', nargs='?', default='ces', help="Jazyk pro OCR")
+    parser.add_argument('--fields', default=','.join(FIELDS),
+                        help="Požadovaná pole oddělená čárkou (date, mood, sleep)")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.image):
+        print(json.dumps({"success": False, "error": f"Soubor {args.image} nebyl nalezen"}))
+        sys.exit(1)
+
+    fields = [field.strip() for field in args.fields.split(',') if field.strip()]
+    try:
+        result = extract_fields(args.image, args.language, fields)
+    except Exception as e:
+        result = {"success": False, "error": f"Extrakce polí selhala: {str(e)}"}
+
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+"""
+Přírůstkové rozpoznání znovu vyfocené stránky deníku
+
+Uživatelé fotí tutéž stránku den po dni, jak na ni připisují nové
+záznamy, a každé nahrání se rozpoznávalo celé znovu. Přírůstkový režim
+zarovná novou fotografii k předchozímu nahrání stejné stránky (ORB body
+a homografie na zmenšených obrázcích), z rozdílu inkoustu obou snímků
+určí změněné nebo nové oblasti textu, rozpozná jen je a spojí nová slova
+s uloženým přepisem nezměněných oblastí (slova se přenesou homografií do
+souřadnic nové fotografie).
+
+Stav stránek se ukládá do lokálního úložiště podle uživatele (šedotónový
+obraz v pracovním rozlišení a slova jako WordTable). Když zarovnání
+selže nebo se změnila většina stránky, vrací se None a engine provede
+plné rozpoznání, jehož výsledek se zapamatuje pro příští nahrání.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import cv2
+import numpy as np
+from ocr_words import WordTable, image_to_words
+
+# Zapnutí přírůstkového režimu (jen pro požadavky s identifikátorem uživatele)
+ENABLED = os.environ.get('OCR_INCREMENTAL', '0') == '1'
+
+# Úložiště předchozích stránek
+PAGES_DIR = os.environ.get(
+    'OCR_PAGES_DIR',
+    os.path.join(tempfile.gettempdir(), 'welldiary-ocr', 'pages')
+)
+
+# Počet posledních stránek uživatele, ke kterým se nová fotografie zkouší zarovnat
+MAX_PAGES_PER_USER = int(os.environ.get('OCR_INCREMENTAL_PAGES', 3))
+
+# Podíl změněné plochy, nad kterým je levnější rozpoznat celou stránku
+MAX_CHANGED_FRACTION = float(os.environ.get('OCR_INCREMENTAL_MAX_CHANGE', 0.5))
+
+# Zarovnání - rozměr zmenšených obrázků, počet bodů ORB a požadovaná shoda
+ALIGN_DIMENSION = 800
+ORB_FEATURES = 2000
+MATCH_RATIO = 0.75
+MIN_INLIERS = 40
+MIN_INLIER_RATIO = 0.25
+
+# Tolerance nepřesnosti zarovnání (px) a minimální velikost změny
+INK_TOLERANCE = 4
+MIN_INK_PIXELS = 60
+
+# Jádro spojující změněný inkoust do oblastí řádků a okraj oblastí (px)
+REGION_KERNEL = (41, 11)
+REGION_PADDING = 12
+
+# Podíl inkoustu v obdélníku přeneseného slova, pod kterým se slovo považuje za smazané
+MIN_WORD_INK = 0.02
+
+_lock = threading.Lock()
+
+
+def load_working_image(image_path, max_dimension):
+    """
+    Šedotónový obraz zmenšený stejně jako v preprocess_image (souřadnice slov
+    plného rozpoznání tak odpovídají pracovnímu obrazu)
+    """
+    image = cv2.imread(image_path)
+    if image is None:
+        return None
+    height, width = image.shape[:2]
+    if max(height, width) > max_dimension:
+        scale = max_dimension / max(height, width)
+        image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _downsample(gray):
+    scale = min(1.0, ALIGN_DIMENSION / max(gray.shape[:2]))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(gray.shape[1] * scale), int(gray.shape[0] * scale)),
+                          interpolation=cv2.INTER_AREA)
+    return gray, scale
+
+
+def align(previous_gray, new_gray):
+    """
+    Homografie z předchozího snímku do nového (ORB + RANSAC na zmenšených obrázcích)
+
+    Returns:
+        Tuple (matice 3x3 v pracovním rozlišení, počet inlierů) nebo None
+    """
+    previous_small, previous_scale = _downsample(previous_gray)
+    new_small, new_scale = _downsample(new_gray)
+
+    orb = cv2.ORB_create(ORB_FEATURES)
+    previous_points, previous_descriptors = orb.detectAndCompute(previous_small, None)
+    new_points, new_descriptors = orb.detectAndCompute(new_small, None)
+    if previous_descriptors is None or new_descriptors is None:
+        return None
+
+    # Loweho test poměru vzdáleností dvou nejbližších shod
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING)
+    matches = [pair[0] for pair in matcher.knnMatch(previous_descriptors, new_descriptors, k=2)
+               if len(pair) == 2 and pair[0].distance < MATCH_RATIO * pair[1].distance]
+    if len(matches) < MIN_INLIERS:
+        return None
+
+    source = np.float32([previous_points[m.queryIdx].pt for m in matches]).reshape(-1, 1, 2)
+    target = np.float32([new_points[m.trainIdx].pt for m in matches]).reshape(-1, 1, 2)
+    homography, inlier_mask = cv2.findHomography(source, target, cv2.RANSAC, 3.0)
+    if homography is None:
+        return None
+
+    inliers = int(inlier_mask.sum())
+    if inliers < MIN_INLIERS or inliers < MIN_INLIER_RATIO * len(matches):
+        return None
+
+    # Přepočet ze zmenšených souřadnic do pracovního rozlišení
+    previous_down = np.diag([previous_scale, previous_scale, 1.0])
+    new_up = np.diag([1.0 / new_scale, 1.0 / new_scale, 1.0])
+    return new_up @ homography @ previous_down, inliers
+
+
+def ink_mask(gray):
+    """
+    Maska inkoustu (255) nezávislá na celkovém osvětlení snímku
+    """
+    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+    return cv2.adaptiveThreshold(blur, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY_INV, 31, 15)
+
+
+def changed_regions(previous_gray, new_gray, homography):
+    """
+    Oblasti nové fotografie s inkoustem, který na předchozím snímku nebyl
+
+    Returns:
+        Tuple (seznam obdélníků (x, y, w, h), podíl změněné plochy, maska inkoustu nového snímku)
+    """
+    height, width = new_gray.shape[:2]
+    new_ink = ink_mask(new_gray)
+
+    previous_ink = cv2.warpPerspective(ink_mask(previous_gray), homography, (width, height),
+                                       flags=cv2.INTER_NEAREST, borderValue=0)
+    coverage = cv2.warpPerspective(np.full(previous_gray.shape[:2], 255, np.uint8), homography,
+                                   (width, height), flags=cv2.INTER_NEAREST, borderValue=0)
+
+    # Tolerance nepřesného zarovnání - předchozí inkoust se rozšíří
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * INK_TOLERANCE + 1, 2 * INK_TOLERANCE + 1))
+    previous_ink = cv2.dilate(previous_ink, kernel)
+
+    # Změna = nový inkoust, který předtím nebyl, nebo inkoust mimo záběr předchozího snímku
+    changed = cv2.bitwise_and(new_ink, cv2.bitwise_not(cv2.bitwise_and(previous_ink, coverage)))
+    changed = cv2.morphologyEx(changed, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+
+    grouped = cv2.dilate(changed, cv2.getStructuringElement(cv2.MORPH_RECT, REGION_KERNEL))
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(grouped, connectivity=8)
+
+    ink_per_label = np.bincount(labels[changed > 0], minlength=count)
+    regions = []
+    for label in range(1, count):
+        if ink_per_label[label] < MIN_INK_PIXELS:
+            continue
+        x, y, w, h = stats[label, :4]
+        x0, y0 = max(0, x - REGION_PADDING), max(0, y - REGION_PADDING)
+        x1, y1 = min(width, x + w + REGION_PADDING), min(height, y + h + REGION_PADDING)
+        regions.append((int(x0), int(y0), int(x1 - x0), int(y1 - y0)))
+
+    regions = merge_regions(regions)
+    covered = np.zeros((height, width), np.uint8)
+    for x, y, w, h in regions:
+        covered[y:y + h, x:x + w] = 1
+    return regions, float(covered.mean()), new_ink
+
+
+def merge_regions(regions):
+    """
+    Sloučí překrývající se obdélníky (OCR by jinak četl stejný text dvakrát)
+    """
+    regions = list(regions)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                ax, ay, aw, ah = regions[i]
+                bx, by, bw, bh = regions[j]
+                if ax < bx + bw and bx < ax + aw and ay < by + bh and by < ay + ah:
+                    x0, y0 = min(ax, bx), min(ay, by)
+                    x1, y1 = max(ax + aw, bx + bw), max(ay + ah, by + bh)
+                    regions[i] = (x0, y0, x1 - x0, y1 - y0)
+                    del regions[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return regions
+
+
+def transform_words(words, homography, shape):
+    """
+    Přenese obdélníky slov homografií do souřadnic nového snímku
+
+    Returns:
+        WordTable se slovy, jejichž střed leží uvnitř nového snímku
+    """
+    if not len(words):
+        return words
+
+    left, top = words.left.astype(np.float32), words.top.astype(np.float32)
+    right, bottom = left + words.width, top + words.height
+    corners = np.stack([
+        np.stack([left, top], axis=1), np.stack([right, top], axis=1),
+        np.stack([left, bottom], axis=1), np.stack([right, bottom], axis=1),
+    ], axis=1).reshape(-1, 1, 2)
+    moved = cv2.perspectiveTransform(corners, homography).reshape(-1, 4, 2)
+
+    x0, y0 = moved[:, :, 0].min(axis=1), moved[:, :, 1].min(axis=1)
+    x1, y1 = moved[:, :, 0].max(axis=1), moved[:, :, 1].max(axis=1)
+    table = words.select(slice(None))
+    table.left, table.top = np.round(x0).astype(np.int32), np.round(y0).astype(np.int32)
+    table.width = np.maximum(1, np.round(x1 - x0)).astype(np.int32)
+    table.height = np.maximum(1, np.round(y1 - y0)).astype(np.int32)
+
+    height, width = shape[:2]
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    return table.select((cx >= 0) & (cx < width) & (cy >= 0) & (cy < height))
+
+
+def carried_words(words, regions, new_ink):
+    """
+    Slova z nezměněných oblastí - bez slov uvnitř přečtených oblastí a bez smazaných slov
+    """
+    if not len(words):
+        return words
+
+    cx = words.left + words.width / 2
+    cy = words.centers_y
+    keep = np.ones(len(words), dtype=bool)
+    for x, y, w, h in regions:
+        keep &= ~((cx >= x) & (cx < x + w) & (cy >= y) & (cy < y + h))
+
+    # Slovo, na jehož místě už není inkoust, bylo smazáno nebo zakryto
+    height, width = new_ink.shape[:2]
+    integral = cv2.integral((new_ink > 0).astype(np.uint8))
+    x0 = np.clip(words.left, 0, width)
+    y0 = np.clip(words.top, 0, height)
+    x1 = np.clip(words.left + words.width, 0, width)
+    y1 = np.clip(words.top + words.height, 0, height)
+    ink = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+    area = np.maximum(1, (x1 - x0) * (y1 - y0))
+    keep &= ink / area >= MIN_WORD_INK
+
+    return words.select(keep)
+
+
+def reading_order(words):
+    """
+    Seřadí slova po řádcích shora dolů a zleva doprava a očísluje řádky
+
+    Řádky se určí z geometrie (přenesená slova a slova z oblastí nemají
+    společné číslování bloků Tesseractu).
+    """
+    if not len(words):
+        return words
+
+    order = np.argsort(words.centers_y, kind='stable')
+    centers = words.centers_y[order]
+    tolerance = max(4.0, float(np.median(words.height)) * 0.5)
+    line_of_sorted = np.concatenate([[0], np.cumsum(np.diff(centers) > tolerance)])
+
+    line = np.empty(len(words), dtype=np.int64)
+    line[order] = line_of_sorted
+    final = np.lexsort((words.left, line))
+
+    table = words.select(final)
+    table.block_num = np.ones(len(table), dtype=np.int32)
+    table.par_num = np.ones(len(table), dtype=np.int32)
+    table.line_num = (line[final] + 1).astype(np.int32)
+    return table
+
+
+def recognize_regions(gray, regions, lang, oem=1):
+    """
+    Rozpozná změněné oblasti (Otsu prahování, psm 6) a vrátí slova v souřadnicích stránky
+    """
+    tables = []
+    for x, y, w, h in regions:
+        crop = cv2.GaussianBlur(gray[y:y + h, x:x + w], (5, 5), 0)
+        _, binary = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        words = image_to_words(binary, config=f"--psm 6 --oem {oem} -l {lang}")
+        tables.append(words.offset(-x, -y))
+    return WordTable.concat(tables)
+
+
+class PageStore:
+    """
+    Lokální úložiště posledních stránek uživatele (obraz + slova + metadata)
+    """
+
+    def __init__(self, directory=PAGES_DIR, max_pages=MAX_PAGES_PER_USER):
+        self.directory = directory
+        self.max_pages = max_pages
+
+    def user_directory(self, user_id):
+        return os.path.join(self.directory, hashlib.sha1(str(user_id).encode()).hexdigest()[:16])
+
+    def _index_path(self, user_id):
+        return os.path.join(self.user_directory(user_id), 'index.json')
+
+    def load_index(self, user_id):
+        try:
+            with open(self._index_path(user_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def load_page(self, user_id, entry):
+        directory = self.user_directory(user_id)
+        gray = cv2.imread(os.path.join(directory, f"{entry['id']}.png"), cv2.IMREAD_GRAYSCALE)
+        try:
+            with open(os.path.join(directory, f"{entry['id']}.npz"), 'rb') as f:
+                words = WordTable.from_bytes(f.read())
+        except (OSError, ValueError):
+            return None, None
+        return gray, words
+
+    def save_page(self, user_id, gray, words, meta, page_id=None):
+        """
+        Uloží stránku (novou nebo přepíše existující) a vyřadí nejstarší nad limit
+        """
+        directory = self.user_directory(user_id)
+        with _lock:
+            os.makedirs(directory, exist_ok=True)
+            index = [entry for entry in self.load_index(user_id) if entry["id"] != page_id]
+            page_id = page_id or f"{int(time.time() * 1000):x}"
+
+            ok, encoded = cv2.imencode('.png', gray)
+            if not ok:
+                return None
+            for name, data in ((f"{page_id}.png", encoded.tobytes()), (f"{page_id}.npz", words.to_bytes())):
+                temp_path = os.path.join(directory, f"{name}.{os.getpid()}.tmp")
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, os.path.join(directory, name))
+
+            index.insert(0, dict(meta, id=page_id, updated=time.time()))
+            for entry in index[self.max_pages:]:
+                for extension in ('.png', '.npz'):
+                    try:
+                        os.remove(os.path.join(directory, entry["id"] + extension))
+                    except OSError:
+                        pass
+            index = index[:self.max_pages]
+
+            temp_path = f"{self._index_path(user_id)}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(temp_path, self._index_path(user_id))
+        return page_id
+
+    def find_match(self, user_id, new_gray):
+        """
+        Předchozí stránka uživatele, ke které se nový snímek zarovná nejlépe
+
+        Returns:
+            Tuple (záznam indexu, obraz, slova, homografie, počet inlierů) nebo None
+        """
+        best = None
+        for entry in self.load_index(user_id):
+            gray, words = self.load_page(user_id, entry)
+            if gray is None:
+                continue
+            alignment = align(gray, new_gray)
+            if alignment is not None and (best is None or alignment[1] > best[4]):
+                best = (entry, gray, words, alignment[0], alignment[1])
+        return best
+
+
+page_store = PageStore()
+
+
+def remember_page(image_path, user_id, words, meta, max_dimension):
+    """
+    Zapamatuje výsledek plného rozpoznání pro příští přírůstkové nahrání
+
+    Args:
+        image_path: Cesta k obrázku
+        user_id: Identifikátor uživatele
+        words: Vítězná slova v souřadnicích pracovního obrazu
+        meta: Metadata stránky (varianta, jazyk)
+        max_dimension: Pracovní rozměr (stejný jako v preprocess_image)
+    """
+    if not user_id or words is None:
+        return
+    gray = load_working_image(image_path, max_dimension)
+    if gray is None:
+        return
+    try:
+        page_store.save_page(user_id, gray, words, meta)
+    except OSError as e:
+        print(f"Varování: Nelze uložit stránku pro přírůstkové rozpoznání: {str(e)}", file=sys.stderr)
+
+
+def recognize_incremental(image_path, user_id, max_dimension, oem=1, language=None):
+    """
+    Přírůstkové rozpoznání nové fotografie již známé stránky
+
+    Args:
+        image_path: Cesta k obrázku
+        user_id: Identifikátor uživatele
+        max_dimension: Pracovní rozměr (stejný jako v preprocess_image)
+        oem: OCR engine mode pro změněné oblasti
+        language: Rozlišený jazyk požadavku (None = jazyk uložené stránky)
+
+    Returns:
+        Tuple (WordTable sloučeného přepisu, metadata stránky, statistiky)
+        nebo None, pokud je potřeba plné rozpoznání
+    """
+    if not user_id:
+        return None
+    new_gray = load_working_image(image_path, max_dimension)
+    if new_gray is None:
+        return None
+
+    started = time.time()
+    match = page_store.find_match(user_id, new_gray)
+    if match is None:
+        return None
+    entry, previous_gray, previous_words, homography, inliers = match
+
+    # Převzatá slova platí jen pro jazyk, kterým se stránka rozpoznala
+    stored_language = entry.get("language", "eng")
+    if language is not None and language != stored_language:
+        print(f"Stránka rozpoznána jazykem {stored_language}, požadován {language}, "
+              f"rozpoznávám celou stránku", file=sys.stderr)
+        return None
+
+    regions, changed_fraction, new_ink = changed_regions(previous_gray, new_gray, homography)
+    if changed_fraction > MAX_CHANGED_FRACTION:
+        print(f"Změněno {changed_fraction:.0%} stránky, rozpoznávám celou stránku", file=sys.stderr)
+        return None
+    alignment_time = time.time() - started
+
+    carried = carried_words(transform_words(previous_words, homography, new_gray.shape), regions, new_ink)
+    new_words = recognize_regions(new_gray, regions, stored_language, oem)
+    merged = reading_order(WordTable.concat([carried, new_words]))
+
+    page_store.save_page(user_id, new_gray, merged, {key: entry[key] for key in entry
+                                                     if key not in ("id", "updated")},
+                         page_id=entry["id"])
+
+    stats = {
+        "page": entry["id"],
+        "inliers": inliers,
+        "changed_fraction": round(changed_fraction, 4),
+        "regions": len(regions),
+        "reused_words": len(carried),
+        "new_words": len(new_words),
+        "alignment_time": round(alignment_time, 3),
+    }
+    return merged, entry, stats
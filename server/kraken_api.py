@@ -12,39 +12,86 @@ import sys
 import json
 import cv2
 import numpy as np
-import tempfile
 import traceback
-import time
-from flask import Flask, request, jsonify
+import glob
+from flask import Flask, Response, request, jsonify
+from admission import AdmissionController, AdmissionRejected, parse_priority
+from ocr_words import image_to_words
+from resource_budget import apply_thread_limits, cpu_budget, describe_budget
+from ocr_profiles import get_profile
+from thresholding import threshold_stack, to_image
+from artifact_cache import PageArtifacts, describe as describe_artifacts, open_page
+from sampling_profiler import ProfilerBusy, is_authorized
+from prefork import PREFORK_WORKERS, PreforkServer, profile_workers, warm_files
 
 # Set up tessdata path for pytesseract
 TESSDATA_PREFIX = os.path.join(os.getcwd(), 'tessdata')
 os.environ['TESSDATA_PREFIX'] = TESSDATA_PREFIX
 
+# Preprocessing variants and psm x oem grid, selected by OCR_PROFILE (see ocr_profiles.py)
+PROFILE = get_profile('kraken')
+
 # Initialize Flask app
 app = Flask(__name__)
 
+# Bounded admission queue in front of the recognizer (see admission.py)
+admission = AdmissionController()
+
+# Split the CPU budget (cgroup quota, affinity) between concurrent requests
+# so Tesseract's OpenMP threads don't oversubscribe the host
+apply_thread_limits(max(1, cpu_budget('kraken') // admission.max_concurrent))
+
 # Import pytesseract
 import pytesseract
-from pytesseract import Output
 print(f"Using Tesseract data directory: {TESSDATA_PREFIX}")
+print(f"Using OCR profile {PROFILE['name']}: psm {PROFILE['psm_modes']}, oem {PROFILE['oem_modes']}")
 
 # Import PIL for enhanced image processing
 from PIL import Image, ImageEnhance, ImageFilter
 print("PIL/Pillow is available for enhanced image processing")
 
+def load_image(image):
+    """
+    Load an image from a path, pass through an already decoded BGR array,
+    or decode an upload wrapped by open_upload
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if isinstance(image, PageArtifacts):
+        return image.image()
+    return cv2.imread(image)
+
+def open_upload(file):
+    """
+    Wrap an uploaded image read straight from the request stream (no temp file)
+    
+    Decoding is lazy: a retry of the same upload (e.g. with another language)
+    loads its preprocessed variants from the artifact cache and never decodes.
+    
+    Returns:
+        artifact_cache.PageArtifacts, or None if the data is not a supported image
+    """
+    data = file.read()
+    if not data:
+        return None
+    page = open_page(data)
+    # Cached artifacts mean the same bytes already decoded successfully
+    if not page.cached and page.image() is None:
+        return None
+    return page
+
 def preprocess_image(image_path):
     """
     Basic preprocessing of image for OCR
     
     Args:
-        image_path: Path to the image file
+        image_path: Path to the image file or a decoded BGR image
     
     Returns:
         Preprocessed image as NumPy array
     """
     # Load image
-    image = cv2.imread(image_path)
+    image = load_image(image_path)
     if image is None:
         print(f"Error: Could not load image from {image_path}")
         return None
@@ -59,20 +106,35 @@ def preprocess_image(image_path):
     
     return processed
 
-def perform_adaptive_preprocessing(image_path, language='eng'):
+# Local-statistics binarizations appended after the basic variants (indices 3 and 4)
+STATISTICAL_THRESHOLDS = [('sauvola', 25, 0.2), ('wolf', 25, 0.5)]
+
+def perform_adaptive_preprocessing(image_path, language='eng', variants=None):
     """
     Perform adaptive preprocessing depending on image characteristics
     
     Args:
-        image_path: Path to the image file
+        image_path: Path to the image file, a decoded BGR image or an upload
+                    from open_upload (its variants are cached across retries)
         language: Language for OCR
+        variants: Variant indices that will be used (None = all); the
+                  Sauvola/Wolf variants are only computed when requested
         
     Returns:
         List of preprocessed images for multiple recognition attempts
     """
+    statistical = variants is None or any(i >= 3 for i in variants)
+    page = image_path if isinstance(image_path, PageArtifacts) else None
+    if page is not None:
+        # None of the variants depend on the language
+        cached = page.load('kraken_variants', statistical=statistical)
+        if cached is not None:
+            print("Using preprocessed variants from the artifact cache")
+            return list(cached)
+    
     try:
         # Read the image
-        image = cv2.imread(image_path)
+        image = load_image(image_path)
         if image is None:
             print(f"Error: Could not load image from {image_path}")
             return []
@@ -82,6 +144,7 @@ def perform_adaptive_preprocessing(image_path, language='eng'):
         
         # Create variants for different handwriting styles
         preprocessed_variants = []
+        complete = True
         
         # 1. Basic adaptive thresholding
         thresh1 = cv2.adaptiveThreshold(
@@ -115,6 +178,16 @@ def perform_adaptive_preprocessing(image_path, language='eng'):
             preprocessed_variants.append(thresh3)
         except Exception as e:
             print(f"Error during PIL processing: {str(e)}")
+            complete = False
+        
+        # 4-5. Sauvola and Wolf from one integral image (shared window statistics)
+        if statistical:
+            stack = threshold_stack(gray, STATISTICAL_THRESHOLDS)
+            preprocessed_variants.extend(to_image(mask) for mask in stack)
+        
+        # A stack without the PIL variant would shift the cached indices
+        if page is not None and complete:
+            page.store('kraken_variants', np.stack(preprocessed_variants), statistical=statistical)
         
         return preprocessed_variants
     except Exception as e:
@@ -122,12 +195,43 @@ def perform_adaptive_preprocessing(image_path, language='eng'):
         traceback.print_exc()
         return []
 
+def select_variants(preprocessed_variants, indices):
+    """
+    Keep the preprocessing variants listed in the profile (all of them if none match)
+    """
+    selected = [preprocessed_variants[i] for i in indices if i < len(preprocessed_variants)]
+    return selected or preprocessed_variants
+
+def is_better_result(text, confidence, best_result):
+    """
+    Highest confidence wins; longer text wins when confidences are similar
+    """
+    return (confidence > best_result["confidence"] or
+            (abs(confidence - best_result["confidence"]) < 0.1 and len(text) > len(best_result["text"])))
+
+def recognize_attempt(processed_image, config):
+    """
+    Run one Tesseract configuration on a preprocessed image
+    
+    Returns:
+        Tuple (text, confidence normalized to 0-1)
+    """
+    # Get words with confidence and geometry (columnar, see ocr_words.py)
+    words = image_to_words(processed_image, config=config)
+    
+    if len(words) == 0:
+        # Fallback to simple string extraction if no confidence data
+        text = pytesseract.image_to_string(processed_image, config=config)
+        return text, 0.5  # Default confidence
+    
+    return words.text(), words.mean_confidence() / 100.0  # Normalize to 0-1 range
+
 def recognize_handwritten_text(image_path, language='eng'):
     """
     Enhanced handwritten text recognition using multiple preprocessing variants
     
     Args:
-        image_path: Path to the image file
+        image_path: Path to the image file, a decoded BGR image or an upload from open_upload
         language: Language for OCR
         
     Returns:
@@ -140,7 +244,7 @@ def recognize_handwritten_text(image_path, language='eng'):
             language = 'eng'
         
         # Get preprocessed variants
-        preprocessed_variants = perform_adaptive_preprocessing(image_path, language)
+        preprocessed_variants = perform_adaptive_preprocessing(image_path, language, PROFILE["variants"])
         if not preprocessed_variants:
             # Fallback to basic preprocessing if adaptive failed
             basic_processed = preprocess_image(image_path)
@@ -150,14 +254,16 @@ def recognize_handwritten_text(image_path, language='eng'):
                     "error": "Failed to preprocess image"
                 }
             preprocessed_variants = [basic_processed]
+        else:
+            preprocessed_variants = select_variants(preprocessed_variants, PROFILE["variants"])
         
         # Configure Tesseract parameters, optimized for handwriting
-        # PSM modes to try:
+        # The default profile tries these PSM modes:
         # 6 = Assume a single uniform block of text
         # 4 = Assume a single column of text of variable sizes
-        # Use OEM 1 (LSTM) for handwritten text
-        psm_modes = [6, 4]
-        oem_modes = [1, 3]  # Try LSTM only (1) first, then combined (3)
+        # and OEM 1 (LSTM only) first, then 3 (combined)
+        psm_modes = PROFILE["psm_modes"]
+        oem_modes = PROFILE["oem_modes"]
         
         best_result = {
             "text": "",
@@ -171,31 +277,10 @@ def recognize_handwritten_text(image_path, language='eng'):
                     config = f'--oem {oem} --psm {psm} -l {language}'
                     
                     try:
-                        # Get data with confidence
-                        data = pytesseract.image_to_data(processed_image, config=config, output_type=Output.DICT)
-                        
-                        # Extract text and confidence
-                        text_parts = []
-                        confidence_sum = 0
-                        confidence_count = 0
-                        
-                        for i in range(len(data['text'])):
-                            if data['text'][i].strip():
-                                text_parts.append(data['text'][i])
-                                confidence_sum += float(data['conf'][i])
-                                confidence_count += 1
-                        
-                        if confidence_count == 0:
-                            # Fallback to simple string extraction if no confidence data
-                            text = pytesseract.image_to_string(processed_image, config=config)
-                            confidence = 0.5  # Default confidence
-                        else:
-                            text = ' '.join(text_parts)
-                            confidence = confidence_sum / confidence_count / 100.0  # Normalize to 0-1 range
+                        text, confidence = recognize_attempt(processed_image, config)
                         
                         # Keep the best result (highest confidence or longest text if confidence is similar)
-                        if (confidence > best_result["confidence"] or 
-                           (abs(confidence - best_result["confidence"]) < 0.1 and len(text) > len(best_result["text"]))):
+                        if is_better_result(text, confidence, best_result):
                             best_result["text"] = text
                             best_result["confidence"] = confidence
                             
@@ -248,26 +333,39 @@ def ocr():
         # Get language parameter, default to 'eng'
         language = request.form.get('language', 'eng')
         
-        # Save uploaded file to temp location
-        temp_dir = tempfile.gettempdir()
-        unique_filename = f"{int(time.time())}_{file.filename}"
-        image_path = os.path.join(temp_dir, unique_filename)
-        file.save(image_path)
+        # Interactive single-page uploads go ahead of batch back-fills
+        priority = parse_priority(request.headers.get('X-OCR-Priority') or request.form.get('priority'))
         
-        print(f"Starting OCR processing on: {image_path}")
-        print(f"Using language: {language}")
-        
-        # Process with enhanced handwritten text recognition
-        result = recognize_handwritten_text(image_path, language)
+        # Kept in memory - no temp file, so concurrent uploads with the same name can't collide
+        page = open_upload(file)
+        if page is None:
+            return jsonify({
+                "success": False,
+                "error": "Could not decode image"
+            }), 400
         
-        # Clean up temporary file
-        try:
-            os.remove(image_path)
-        except Exception as e:
-            print(f"Warning: Failed to remove temp file: {str(e)}")
+        with admission.slot(priority) as queue_wait:
+            image = page.image() if not page.cached else None
+            size = f"{image.shape[1]}x{image.shape[0]}" if image is not None else "cached preprocessing"
+            print(f"Starting OCR processing on: {file.filename} ({size})")
+            print(f"Using language: {language} (priority: {priority}, queued {queue_wait:.2f}s)")
+            
+            # Process with enhanced handwritten text recognition
+            result = recognize_handwritten_text(page, language)
+            result["queue_wait"] = queue_wait
             
         return jsonify(result)
     
+    except AdmissionRejected as e:
+        # Overload degrades into fast rejections instead of timeouts
+        response = jsonify({
+            "success": False,
+            "error": str(e),
+            "retry_after": e.retry_after
+        })
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, e.status
+    
     except Exception as e:
         print(f"Error in OCR endpoint: {str(e)}")
         traceback.print_exc()
@@ -276,9 +374,57 @@ def ocr():
             "error": str(e)
         }), 500
 
+@app.route('/queue', methods=['GET'])
+def queue_stats():
+    """
+    Admission queue depth, wait times, rejection counters, CPU budget and artifact cache hits
+    """
+    # Under the pre-fork server each worker has its own queue
+    return jsonify({**admission.stats(), "cpu": describe_budget('kraken'), "artifacts": describe_artifacts(),
+                    "pid": os.getpid()})
+
+@app.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """
+    Sample all server threads for ?seconds=N and return collapsed stacks
+    (flamegraph.pl input) or a per-category summary with ?format=json.
+    Under the pre-fork server every worker samples the same window and the
+    stacks are merged; the JSON "workers" field lists the profiled pids.
+    Local-only unless OCR_DEBUG_TOKEN is set.
+    """
+    if not is_authorized(request.remote_addr, request.headers):
+        return jsonify({"error": "Forbidden"}), 403
+    
+    try:
+        profile, workers = profile_workers(request.args.get('seconds'), request.args.get('interval'))
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+    
+    include_idle = request.args.get('idle') == '1'
+    if request.args.get('format') == 'json':
+        return jsonify({**profile.to_dict(include_idle), "workers": workers})
+    response = Response(profile.collapsed(include_idle), mimetype='text/plain')
+    response.headers['X-Profile-Workers'] = f"{len(workers['pids'])}/{workers['workers']}"
+    return response
+
+def reload_profile():
+    """
+    Re-read the OCR profile before a graceful worker reload (SIGHUP)
+    """
+    global PROFILE
+    PROFILE = get_profile('kraken')
+    print(f"Reloaded OCR profile {PROFILE['name']}: variants {PROFILE['variants']}")
+
 if __name__ == "__main__":
     # If running directly, start the server
     port = int(os.environ.get('FLASK_PORT', 5001))  # Use different port than main app
-    app.run(host='0.0.0.0', port=port)
     
-    print(f"OCR API server running at http://0.0.0.0:{port}/ocr")
\ No newline at end of file
+    if PREFORK_WORKERS > 0:
+        # Production mode: workers fork from this process and share its imports copy-on-write
+        apply_thread_limits(max(1, cpu_budget('kraken') // (PREFORK_WORKERS * admission.max_concurrent)))
+        warmed = warm_files(glob.glob(os.path.join(TESSDATA_PREFIX, '*.traineddata')))
+        print(f"Pre-loaded {warmed} traineddata files into the page cache")
+        PreforkServer(app, '0.0.0.0', port, PREFORK_WORKERS, on_reload=reload_profile).run()
+    else:
+        print(f"OCR API server running at http://0.0.0.0:{port}/ocr")
+        app.run(host='0.0.0.0', port=port)
\ No newline at end of file
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Rozlišení jazyka rukopisu před plným OCR
+
+Místo kombinovaného modelu `ces+eng`, který zhruba zdvojnásobuje cenu
+LSTM rozpoznávání každého slova, se nejprve rozpozná malý vzorek stránky
+(jeden textový blok v nízkém rozlišení) oběma modely zvlášť. Podle
+důvěryhodnosti a četnosti české diakritiky se zvolí převládající jazyk
+a celé rozpoznávání pak běží pouze s ním. Výsledek se ukládá do cache
+podle uživatele, takže další stránky téhož uživatele vzorek neopakují.
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import numpy as np
+import pytesseract
+from PIL import Image
+
+# Cache zvoleného jazyka podle uživatele
+LANGUAGE_CACHE_PATH = os.environ.get(
+    'OCR_LANGUAGE_CACHE',
+    os.path.join(tempfile.gettempdir(), 'welldiary-ocr', 'language_cache.json')
+)
+LANGUAGE_CACHE_TTL = int(os.environ.get('OCR_LANGUAGE_CACHE_TTL', 7 * 24 * 3600))
+
+# Jazyky, které se místo kombinovaného modelu rozlišují vzorkem
+COMBINED_LANGUAGES = {
+    'ces': ['ces', 'eng'],
+}
+
+# Parametry vzorku - šířka v nízkém rozlišení a maximální výška bloku
+SAMPLE_WIDTH = 800
+SAMPLE_MAX_HEIGHT = 240
+SAMPLE_LINE_GAP = 24
+
+# Váha četnosti diakritiky (v procentech písmen) oproti důvěryhodnosti Tesseractu
+DIACRITICS_WEIGHT = 1.5
+
+CZECH_DIACRITICS = frozenset('áčďéěíňóřšťúůýžÁČĎÉĚÍŇÓŘŠŤÚŮÝŽ')
+
+
+def _to_gray_array(image):
+    """
+    Převede PIL obrázek nebo NumPy pole na pole ve stupních šedi
+    """
+    if isinstance(image, Image.Image):
+        return np.asarray(image.convert('L'))
+
+    array = np.asarray(image)
+    if array.ndim == 3:
+        # BGR/RGB -> průměr kanálů je pro hledání inkoustu dostatečný
+        array = array.mean(axis=2).astype(np.uint8)
+    return array
+
+
+def extract_text_sample(image):
+    """
+    Vybere z obrázku jeden textový blok v nízkém rozlišení
+
+    Args:
+        image: Obrázek jako PIL Image nebo NumPy pole
+
+    Returns:
+        Vzorek jako NumPy pole ve stupních šedi
+    """
+    gray = _to_gray_array(image)
+    height, width = gray.shape[:2]
+
+    # Zmenšení na nízké rozlišení (jen zmenšujeme, nikdy nezvětšujeme)
+    if width > SAMPLE_WIDTH:
+        new_height = max(1, int(height * SAMPLE_WIDTH / width))
+        gray = np.asarray(Image.fromarray(gray).resize((SAMPLE_WIDTH, new_height), Image.BILINEAR))
+        height, width = gray.shape[:2]
+
+    # Řádkový profil inkoustu - tmavé pixely výrazně pod průměrem
+    ink = gray < (gray.mean() - 2 * max(1.0, gray.std()) / 3)
+    row_profile = ink.mean(axis=1)
+    text_rows = row_profile > 0.01
+
+    # Nalezení souvislých pásů řádků s inkoustem; pásy oddělené jen
+    # meziřádkovou mezerou se slučují do jednoho bloku
+    blocks = []
+    start = None
+    for y in range(height + 1):
+        is_text = y < height and text_rows[y]
+        if is_text and start is None:
+            start = y
+        elif not is_text and start is not None:
+            if blocks and start - blocks[-1][1] <= SAMPLE_LINE_GAP:
+                blocks[-1][1] = y
+            else:
+                blocks.append([start, y])
+            start = None
+
+    # Výběr bloku s největším množstvím inkoustu
+    best_start, best_end, best_mass = 0, 0, 0.0
+    for block_start, block_end in blocks:
+        mass = float(row_profile[block_start:block_end].sum())
+        if mass > best_mass:
+            best_start, best_end, best_mass = block_start, block_end, mass
+
+    if best_mass == 0.0:
+        # Bez zjevného textu použijeme prostřední pás stránky
+        best_start = max(0, height // 2 - SAMPLE_MAX_HEIGHT // 2)
+        best_end = min(height, best_start + SAMPLE_MAX_HEIGHT)
+
+    # Malý okraj kolem bloku a omezení výšky vzorku
+    top = max(0, best_start - 8)
+    bottom = min(height, max(best_end + 8, top + 32), top + SAMPLE_MAX_HEIGHT)
+    return gray[top:bottom]
+
+
+def score_language_sample(sample, lang):
+    """
+    Rozpozná vzorek jedním jazykovým modelem a spočítá jeho skóre
+
+    Args:
+        sample: Vzorek ze `extract_text_sample`
+        lang: Kód jazyka pro Tesseract
+
+    Returns:
+        Dictionary s důvěryhodností, podílem diakritiky a skóre
+    """
+    config = f"--psm 6 --oem 1 -l {lang}"
+    data = pytesseract.image_to_data(sample, config=config, output_type=pytesseract.Output.DICT)
+
+    words = []
+    confidence_sum = 0.0
+    for word, conf in zip(data['text'], data['conf']):
+        if word.strip():
+            words.append(word)
+            confidence_sum += float(conf)
+
+    confidence = confidence_sum / len(words) if words else 0.0
+
+    letters = [c for c in ''.join(words) if c.isalpha()]
+    diacritics_ratio = (sum(c in CZECH_DIACRITICS for c in letters) / len(letters)) if letters else 0.0
+
+    return {
+        "language": lang,
+        "confidence": confidence,
+        "diacritics_ratio": diacritics_ratio,
+        "score": confidence + DIACRITICS_WEIGHT * diacritics_ratio * 100
+    }
+
+
+def detect_language(image, languages, default=None):
+    """
+    Určí převládající jazyk stránky z jednoho vzorku
+
+    Args:
+        image: Obrázek jako PIL Image nebo NumPy pole
+        languages: Kandidátní jazyky (první je požadovaný jazyk)
+        default: Jazyk pro nerozhodnutelné případy (výchozí je první kandidát)
+
+    Returns:
+        Tuple (jazyk, seznam skóre jednotlivých jazyků)
+    """
+    default = default or languages[0]
+    sample = extract_text_sample(image)
+
+    scores = []
+    for lang in languages:
+        try:
+            scores.append(score_language_sample(sample, lang))
+        except Exception as e:
+            print(f"Chyba při rozpoznávání vzorku jazykem {lang}: {str(e)}", file=sys.stderr)
+
+    if not scores or all(s["confidence"] == 0 for s in scores):
+        return default, scores
+
+    # Diakritiku dostává jen čeština - angličtina ji rozpoznat neumí
+    for s in scores:
+        if s["language"] != 'ces':
+            s["score"] = s["confidence"]
+
+    best = max(scores, key=lambda s: (s["score"], s["language"] == default))
+    return best["language"], scores
+
+
+def _load_cache():
+    try:
+        with open(LANGUAGE_CACHE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store_cache(cache):
+    try:
+        os.makedirs(os.path.dirname(LANGUAGE_CACHE_PATH), exist_ok=True)
+        temp_path = f"{LANGUAGE_CACHE_PATH}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(cache, f)
+        os.replace(temp_path, LANGUAGE_CACHE_PATH)
+    except OSError as e:
+        print(f"Varování: Nelze uložit cache jazyků: {str(e)}", file=sys.stderr)
+
+
+def get_cached_language(user_id, requested):
+    """
+    Vrátí jazyk uložený pro uživatele, pokud je platný pro daný požadavek
+    """
+    if not user_id:
+        return None
+
+    entry = _load_cache().get(f"{user_id}:{requested}")
+    if not entry or time.time() - entry.get("timestamp", 0) > LANGUAGE_CACHE_TTL:
+        return None
+    return entry.get("language")
+
+
+def store_cached_language(user_id, requested, language):
+    """
+    Uloží zvolený jazyk pro uživatele
+    """
+    if not user_id:
+        return
+
+    cache = _load_cache()
+    cache[f"{user_id}:{requested}"] = {"language": language, "timestamp": time.time()}
+    _store_cache(cache)
+
+
+def resolve_language(image, language, user_id=None):
+    """
+    Převede požadovaný jazyk na jediný jazykový model pro plné rozpoznávání
+
+    Args:
+        image: Obrázek jako PIL Image nebo NumPy pole (nebo None, pokud
+               stačí hodnota z cache)
+        language: Požadovaný jazyk (např. 'ces' nebo 'eng')
+        user_id: Identifikátor uživatele pro cache (volitelné)
+
+    Returns:
+        Tuple (jazyk, zdroj rozhodnutí: 'requested', 'cache' nebo 'sample')
+    """
+    languages = COMBINED_LANGUAGES.get(language)
+    if not languages:
+        return language, "requested"
+
+    cached = get_cached_language(user_id, language)
+    if cached:
+        print(f"Jazyk {cached} převzat z cache uživatele", file=sys.stderr)
+        return cached, "cache"
+
+    if image is None:
+        return language, "requested"
+
+    resolved, scores = detect_language(image, languages, default=language)
+    for s in scores:
+        print(f"Vzorek jazyka {s['language']}: důvěra {s['confidence']:.2f}, "
+              f"diakritika {s['diacritics_ratio']:.3f}, skóre {s['score']:.2f}", file=sys.stderr)
+    print(f"Zvolený jazyk: {resolved}", file=sys.stderr)
+
+    store_cached_language(user_id, language, resolved)
+    return resolved, "sample"
@@ -10,7 +10,10 @@ import json
 import cv2
 import numpy as np
 import pytesseract
-from pytesseract import Output
+from ocr_words import image_to_words
+from text_postprocess import normalize_whitespace
+from ocr_batch import batch_main
+from artifact_cache import open_page
 
 # Set Tesseract to use our higher quality training data
 TESSDATA_PREFIX = os.path.join(os.getcwd(), 'tessdata')
@@ -39,19 +42,24 @@ def perform_quick_ocr(image_path, language='eng'):
                 "error": f"Image file not found: {image_path}"
             }
             
-        # Simple image loading
-        image = cv2.imread(image_path)
-        if image is None:
-            return {
-                "success": False,
-                "error": "Failed to load image"
-            }
+        # A retry of the same image (e.g. another language) reuses the cached binarization
+        page = open_page(image_path)
+        binary = page.load('otsu')
+        if binary is None:
+            # Simple image loading
+            image = page.image()
+            if image is None:
+                return {
+                    "success": False,
+                    "error": "Failed to load image"
+                }
+                
+            # Convert to grayscale
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
             
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Simple preprocessing - just thresholding
-        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            # Simple preprocessing - just thresholding
+            _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+            binary = page.store('otsu', binary)
         
         # Check if we have the language data, fallback to 'eng' if not
         if language != 'eng' and not os.path.exists(os.path.join(TESSDATA_PREFIX, f'{language}.traineddata')):
@@ -61,30 +69,19 @@ def perform_quick_ocr(image_path, language='eng'):
         # Simple OCR without fancy options
         config = f'--oem 3 --psm 6 -l {language}'
         
-        # Get data with confidence
-        data = pytesseract.image_to_data(binary, config=config, output_type=Output.DICT)
+        # Get words with confidence and geometry (columnar, see ocr_words.py)
+        words = image_to_words(binary, config=config)
         
-        # Extract text and confidence
-        text_parts = []
-        confidence_sum = 0
-        confidence_count = 0
-        
-        for i in range(len(data['text'])):
-            if data['text'][i].strip():
-                text_parts.append(data['text'][i])
-                confidence_sum += float(data['conf'][i])
-                confidence_count += 1
-        
-        if confidence_count == 0:
+        if len(words) == 0:
             # Fall back to simple string extraction
             text = pytesseract.image_to_string(binary, config=config)
             confidence = 50.0
         else:
-            text = ' '.join(text_parts)
-            confidence = confidence_sum / confidence_count
+            text = words.text()
+            confidence = words.mean_confidence()
         
         # Basic post-processing
-        text = ' '.join(text.split())
+        text = normalize_whitespace(text)
         
         print(f"OCR complete. Confidence: {confidence}")
         print(f"Text sample: {text[:100]}...")
@@ -110,6 +107,11 @@ if __name__ == "__main__":
         print(json.dumps({"success": False, "error": "No image path provided"}))
         sys.exit(1)
     
+    # Batch mode: directory, glob, list file or multi-page TIFF/PDF -> JSONL
+    if sys.argv[1] == '--batch':
+        sys.exit(batch_main(sys.argv[2:], lambda path, lang, user_id: perform_quick_ocr(path, lang),
+                            "Batch quick OCR (light-ocr)"))
+    
     image_path = sys.argv[1]
     
     # Get language if provided
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Montáž více variant předzpracování do jednoho obrazu pro Tesseract
+
+Každé volání Tesseractu platí pevnou režii (start procesu, inicializace
+modelu, příprava analýzy rozvržení). U malých stránek tato režie převažuje
+nad samotným rozpoznáváním, proto se různě předzpracované verze stránky
+poskládají pod sebe do jednoho vysokého plátna oddělené bílými mezerami
+a rozpoznají jediným voláním `image_to_data`. Slova se pak podle svých
+ohraničujících obdélníků přiřadí zpět ke zdrojové variantě včetně
+přepočtu souřadnic.
+"""
+
+import os
+import numpy as np
+from ocr_words import WordTable, image_to_words
+
+# Šířka bílé mezery mezi variantami (a okraje plátna) v pixelech
+GUTTER = int(os.environ.get('OCR_MONTAGE_GUTTER', 64))
+
+# Maximální výška jednoho plátna - Tesseract nezpracuje obrázky nad 32767 px
+MAX_HEIGHT = int(os.environ.get('OCR_MONTAGE_MAX_HEIGHT', 30000))
+
+# Segmentace stránky - plátno obsahuje více oddělených bloků textu
+MONTAGE_PSM = 3
+
+
+def build_montages(images, gutter=GUTTER, max_height=MAX_HEIGHT):
+    """
+    Poskládá obrázky pod sebe do jednoho nebo více pláten
+
+    Args:
+        images: Seznam šedotónových obrázků (NumPy pole uint8)
+        gutter: Šířka oddělující mezery
+        max_height: Maximální výška jednoho plátna
+
+    Returns:
+        Seznam tuple (plátno, pásy), kde pásy jsou tuple (index obrázku, horní y, dolní y)
+    """
+    groups = []
+    current = []
+    height = gutter
+    for index, image in enumerate(images):
+        added = image.shape[0] + gutter
+        if current and height + added > max_height:
+            groups.append(current)
+            current = []
+            height = gutter
+        current.append(index)
+        height += added
+    if current:
+        groups.append(current)
+
+    montages = []
+    for group in groups:
+        width = max(images[i].shape[1] for i in group) + 2 * gutter
+        total_height = gutter + sum(images[i].shape[0] + gutter for i in group)
+        canvas = np.full((total_height, width), 255, dtype=np.uint8)
+
+        bands = []
+        y = gutter
+        for i in group:
+            h, w = images[i].shape[:2]
+            canvas[y:y + h, gutter:gutter + w] = images[i]
+            bands.append((i, y, y + h))
+            y += h + gutter
+        montages.append((canvas, bands))
+
+    return montages
+
+
+def split_words(words, bands, gutter=GUTTER):
+    """
+    Přiřadí slova rozpoznaná na plátně k pásům podle středu obdélníku
+
+    Args:
+        words: WordTable rozpoznaná z plátna
+        bands: Pásy plátna z `build_montages`
+        gutter: Levý okraj plátna
+
+    Returns:
+        Slovník {index obrázku: WordTable v souřadnicích zdrojového obrázku}
+    """
+    tops = np.array([top for _, top, _ in bands])
+    bottoms = np.array([bottom for _, _, bottom in bands])
+
+    centers = words.centers_y
+    positions = np.searchsorted(tops, centers, side='right') - 1
+    # Slovo ležící v mezeře nepatří žádné variantě
+    valid = (positions >= 0) & (centers < bottoms[np.clip(positions, 0, None)])
+
+    return {
+        index: words.select(valid & (positions == position)).offset(gutter, top)
+        for position, (index, top, _) in enumerate(bands)
+    }
+
+
+def recognize_montage(images, lang, oem=1, gutter=GUTTER, max_height=MAX_HEIGHT):
+    """
+    Rozpozná více obrázků minimálním počtem volání Tesseractu
+
+    Args:
+        images: Seznam šedotónových obrázků
+        lang: Jazyk pro Tesseract
+        oem: OCR engine mode
+
+    Returns:
+        Tuple (seznam WordTable ve stejném pořadí jako `images`, počet volání Tesseractu)
+    """
+    results = [WordTable() for _ in images]
+    montages = build_montages(images, gutter, max_height)
+
+    for canvas, bands in montages:
+        words = image_to_words(canvas, config=f"--psm {MONTAGE_PSM} --oem {oem} -l {lang}")
+        for index, variant_words in split_words(words, bands, gutter).items():
+            results[index] = variant_words
+
+    return results, len(montages)
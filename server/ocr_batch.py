@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Dávkové zpracování více stránek s průběžným JSONL výstupem
+
+Společný dávkový režim pro všechny OCR skripty. Vstupem může být adresář,
+glob, textový soubor se seznamem cest nebo vícestránkový TIFF/PDF.
+Dekódování stránek, předzpracování a OCR běží zřetězeně - nejvýše
+`max_in_flight` stránek je v paměti současně, každá dokončená stránka se
+hned vypíše jako jeden JSON řádek a zapíše do checkpointu, takže přerušené
+zpracování lze navázat bez opakování hotových stránek.
+
+Použití ze skriptu:
+    python optimized_trocr.py --batch <vstup> [<vstup> ...] [--language ces]
+        [--user ID] [--checkpoint soubor.jsonl] [--jobs N] [--chunk-size N]
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import contextlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from PIL import Image, ImageSequence
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.webp', '.gif'}
+LIST_EXTENSIONS = {'.txt', '.lst'}
+PDF_EXTENSIONS = {'.pdf'}
+
+# Rozlišení pro převod stránek PDF na obrázky
+PDF_RENDER_DPI = int(os.environ.get('OCR_PDF_DPI', 300))
+
+# Výchozí počet současně zpracovávaných stránek (bloků stránek)
+DEFAULT_MAX_IN_FLIGHT = 2
+
+# Výchozí velikost bloku pro enginy, které zpracují více stránek jedním voláním
+DEFAULT_CHUNK_SIZE = 16
+
+
+def expand_sources(specs):
+    """
+    Rozbalí vstupní specifikace na seznam souborů
+
+    Args:
+        specs: Seznam cest - adresář, glob, seznam cest (.txt/.lst) nebo soubor
+
+    Returns:
+        Seznam cest k obrázkům a PDF v pořadí zpracování
+    """
+    paths = []
+    for spec in specs:
+        extension = os.path.splitext(spec)[1].lower()
+
+        if os.path.isdir(spec):
+            for name in sorted(os.listdir(spec)):
+                path = os.path.join(spec, name)
+                if os.path.isfile(path) and os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS | PDF_EXTENSIONS:
+                    paths.append(path)
+        elif os.path.isfile(spec) and extension in LIST_EXTENSIONS:
+            base_dir = os.path.dirname(os.path.abspath(spec))
+            with open(spec, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+        elif any(c in spec for c in '*?['):
+            paths.extend(sorted(p for p in glob.glob(spec) if os.path.isfile(p)))
+        else:
+            paths.append(spec)
+
+    return paths
+
+
+def page_key(source, page):
+    """
+    Klíč stránky v checkpointu
+    """
+    return f"{os.path.abspath(source)}#{page}"
+
+
+def _pdf_page_count(path):
+    output = subprocess.run(["pdfinfo", path], stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    for line in output.stdout.decode('utf-8', errors='replace').splitlines():
+        if line.startswith('Pages:'):
+            return int(line.split(':', 1)[1])
+    return 0
+
+
+def _render_pdf_page(path, page, work_dir):
+    prefix = os.path.join(work_dir, f"pdf_{os.getpid()}_{abs(hash(path))}_{page}")
+    subprocess.run(
+        ["pdftoppm", "-r", str(PDF_RENDER_DPI), "-f", str(page + 1), "-l", str(page + 1),
+         "-png", "-singlefile", path, prefix],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    )
+    return prefix + ".png"
+
+
+def iter_pages(paths, work_dir, skip=None):
+    """
+    Líně rozbalí soubory na jednotlivé stránky
+
+    Stránky vícestránkových TIFF a PDF se převádějí na PNG v `work_dir`
+    teprve ve chvíli, kdy jsou na řadě. Stránky, pro které `skip(klíč)`
+    vrátí True, se vůbec nedekódují.
+
+    Yields:
+        Dictionary se zdrojem, číslem stránky, cestou a příznakem dočasného souboru
+    """
+    skip = skip or (lambda key: False)
+
+    for source in paths:
+        extension = os.path.splitext(source)[1].lower()
+
+        if not os.path.exists(source):
+            yield {"source": source, "page": 0, "path": None, "temporary": False,
+                   "error": f"Soubor {source} neexistuje"}
+            continue
+
+        if extension in PDF_EXTENSIONS:
+            try:
+                page_count = _pdf_page_count(source)
+            except (OSError, subprocess.CalledProcessError) as e:
+                yield {"source": source, "page": 0, "path": None, "temporary": False,
+                       "error": f"Nelze načíst PDF (je nainstalován poppler-utils?): {str(e)}"}
+                continue
+
+            for page in range(page_count):
+                if skip(page_key(source, page)):
+                    continue
+                try:
+                    path = _render_pdf_page(source, page, work_dir)
+                    yield {"source": source, "page": page, "path": path, "temporary": True}
+                except (OSError, subprocess.CalledProcessError) as e:
+                    yield {"source": source, "page": page, "path": None, "temporary": False,
+                           "error": f"Nelze převést stránku PDF: {str(e)}"}
+            continue
+
+        if extension in ('.tif', '.tiff'):
+            try:
+                with Image.open(source) as tiff:
+                    frame_count = getattr(tiff, 'n_frames', 1)
+                    if frame_count > 1:
+                        for page, frame in enumerate(ImageSequence.Iterator(tiff)):
+                            if skip(page_key(source, page)):
+                                continue
+                            path = os.path.join(work_dir, f"tiff_{os.getpid()}_{abs(hash(source))}_{page}.png")
+                            frame.convert('RGB').save(path)
+                            yield {"source": source, "page": page, "path": path, "temporary": True}
+                        continue
+            except OSError as e:
+                yield {"source": source, "page": 0, "path": None, "temporary": False,
+                       "error": f"Nelze načíst TIFF: {str(e)}"}
+                continue
+
+        if not skip(page_key(source, 0)):
+            yield {"source": source, "page": 0, "path": source, "temporary": False}
+
+
+def load_checkpoint(checkpoint_path):
+    """
+    Načte klíče již dokončených stránek
+    """
+    done = set()
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return done
+
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)["key"])
+            except (ValueError, KeyError):
+                # Neúplný poslední řádek po přerušení
+                continue
+    return done
+
+
+def _process_chunk(pages, recognize_page, recognize_pages, language, user_id):
+    started = time.time()
+    valid = [page for page in pages if not page.get("error")]
+    results = {}
+
+    try:
+        if recognize_pages is not None and valid:
+            # Celý blok stránek jedním voláním enginu
+            for page, result in zip(valid, recognize_pages([p["path"] for p in valid], language, user_id)):
+                results[id(page)] = result
+        else:
+            for page in valid:
+                try:
+                    results[id(page)] = recognize_page(page["path"], language, user_id)
+                except Exception as e:
+                    results[id(page)] = {"success": False, "text": "", "error": f"Zpracování selhalo: {str(e)}"}
+    except Exception as e:
+        error = {"success": False, "text": "", "error": f"Zpracování selhalo: {str(e)}"}
+        results = {id(page): error for page in valid}
+    finally:
+        for page in pages:
+            if page.get("temporary") and page.get("path"):
+                try:
+                    os.remove(page["path"])
+                except OSError:
+                    pass
+
+    page_time = (time.time() - started) / max(1, len(pages))
+    output = []
+    for page in pages:
+        if page.get("error"):
+            result = {"success": False, "text": "", "error": page["error"]}
+        else:
+            result = dict(results.get(id(page)) or {"success": False, "text": "", "error": "Chybí výsledek stránky"})
+        result["source"] = page["source"]
+        result["page"] = page["page"]
+        result["page_time"] = page_time
+        output.append(result)
+    return output
+
+
+def run_batch(sources, recognize_page=None, language='eng', user_id=None, checkpoint_path=None,
+              max_in_flight=DEFAULT_MAX_IN_FLIGHT, output=None, recognize_pages=None, chunk_size=1):
+    """
+    Zpracuje všechny stránky a průběžně vypisuje jeden JSON řádek na stránku
+
+    Args:
+        sources: Seznam vstupních specifikací (viz `expand_sources`)
+        recognize_page: Funkce (cesta, jazyk, uživatel) -> dictionary s výsledkem
+        language: Požadovaný jazyk
+        user_id: Identifikátor uživatele (volitelné)
+        checkpoint_path: Soubor pro navázání po přerušení (volitelné)
+        max_in_flight: Nejvyšší počet současně zpracovávaných bloků stránek
+        output: Proud pro JSONL výstup (výchozí je standardní výstup)
+        recognize_pages: Funkce (cesty, jazyk, uživatel) -> seznam výsledků pro
+                         enginy, které umí celý blok stránek najednou (volitelné)
+        chunk_size: Počet stránek v jednom bloku pro `recognize_pages`
+
+    Returns:
+        Dictionary se souhrnem dávky
+    """
+    output = output or sys.stdout
+    chunk_size = max(1, chunk_size) if recognize_pages is not None else 1
+    done = load_checkpoint(checkpoint_path)
+    paths = expand_sources(sources)
+    work_dir = tempfile.mkdtemp(prefix='welldiary-batch-')
+    summary = {"pages": 0, "failed": 0, "skipped": 0, "started": time.time()}
+
+    def skip(key):
+        if key in done:
+            summary["skipped"] += 1
+            return True
+        return False
+
+    checkpoint = open(checkpoint_path, 'a', encoding='utf-8') if checkpoint_path else None
+
+    def emit(result):
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+        summary["pages"] += 1
+        if not result.get("success"):
+            summary["failed"] += 1
+        elif checkpoint:
+            # Do checkpointu jen úspěšné stránky - chybné se při navázání zopakují
+            checkpoint.write(json.dumps({"key": page_key(result["source"], result["page"])}) + "\n")
+            checkpoint.flush()
+            os.fsync(checkpoint.fileno())
+
+    # Diagnostické výpisy enginů nesmí narušit JSONL výstup
+    try:
+        with contextlib.redirect_stdout(sys.stderr), ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+            pending = set()
+            chunk = []
+
+            def submit(chunk):
+                nonlocal pending
+                while len(pending) >= max_in_flight:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        for result in future.result():
+                            emit(result)
+                # Každá stránka dostane požadovaný jazyk - jazyk se rozlišuje po
+                # stránkách, jednotný jazyk dávky zajistí cache uživatele (--user)
+                pending.add(executor.submit(_process_chunk, chunk, recognize_page, recognize_pages,
+                                            language, user_id))
+
+            for page in iter_pages(paths, work_dir, skip):
+                chunk.append(page)
+                if len(chunk) >= chunk_size:
+                    submit(chunk)
+                    chunk = []
+            if chunk:
+                submit(chunk)
+
+            for future in wait(pending).done:
+                for result in future.result():
+                    emit(result)
+    finally:
+        if checkpoint:
+            checkpoint.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    summary["execution_time"] = time.time() - summary.pop("started")
+    print(f"Dávka dokončena: {summary['pages']} stránek, {summary['failed']} chyb, "
+          f"{summary['skipped']} přeskočeno z checkpointu, {summary['execution_time']:.2f} s",
+          file=sys.stderr)
+    return summary
+
+
+def parse_batch_args(argv, description):
+    """
+    Zpracuje argumenty dávkového režimu (vše za přepínačem --batch)
+    """
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('sources', nargs='+', help='Adresář, glob, seznam cest (.txt) nebo soubor (i TIFF/PDF)')
+    parser.add_argument('--language', default='eng', help='Jazyk pro OCR (výchozí: eng)')
+    parser.add_argument('--user', default=None, help='Identifikátor uživatele')
+    parser.add_argument('--checkpoint', default=None, help='Soubor checkpointu pro navázání po přerušení')
+    parser.add_argument('--jobs', type=int, default=DEFAULT_MAX_IN_FLIGHT,
+                        help=f'Počet současně zpracovávaných stránek (výchozí: {DEFAULT_MAX_IN_FLIGHT})')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Počet stránek v jednom volání enginu, pokud ho engine podporuje '
+                             f'(výchozí: {DEFAULT_CHUNK_SIZE})')
+    return parser.parse_args(argv)
+
+
+def batch_main(argv, recognize_page, description, recognize_pages=None):
+    """
+    Vstupní bod dávkového režimu pro OCR skripty
+
+    Returns:
+        Návratový kód procesu
+    """
+    args = parse_batch_args(argv, description)
+    summary = run_batch(args.sources, recognize_page, args.language, args.user,
+                        args.checkpoint, max(1, args.jobs),
+                        recognize_pages=recognize_pages, chunk_size=args.chunk_size)
+    return 0 if summary["failed"] == 0 else 1
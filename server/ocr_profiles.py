@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Pojmenované konfigurační profily OCR enginů
+
+Sada variant předzpracování, orientace, režimy segmentace (psm), OCR engine
+(oem) a maximální rozměr obrázku byly dříve napevno v kódu enginů. Profily
+je přesouvají do konfiguračního souboru `ocr_profiles.json`, který generuje
+offline ladicí nástroj `ocr_tuner.py` (profily `fast`, `balanced`,
+`accurate` z Pareto fronty latence a CER). Engine si profil vybere podle
+proměnné prostředí OCR_PROFILE, výchozí profil `default` odpovídá původním
+ručně zvoleným hodnotám.
+"""
+
+import os
+import sys
+import json
+import copy
+
+# Konfigurační soubor s profily (vedle skriptů)
+PROFILES_PATH = os.environ.get(
+    'OCR_PROFILES_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ocr_profiles.json')
+)
+
+# Jméno profilu použitého enginy
+PROFILE_NAME = os.environ.get('OCR_PROFILE', 'default')
+
+# Výchozí profily - původní ručně zvolené hodnoty, platí i bez konfiguračního souboru
+DEFAULT_PROFILES = {
+    'optimized_trocr': {
+        # Nejlepší varianty předzpracování (k dispozici 0-13)
+        "variants": [0, 2, 5, 7, 10],
+        # Pro rukopis obvykle stačí 0 a 270 stupňů
+        "orientations": [0, 270],
+        # Přepsání psm podle varianty ({varianta: psm}), chybějící varianty
+        # používají vestavěné mapování psm_for_variant
+        "psm": {},
+        "oem": 1,
+        "max_dimension": 2000,
+    },
+    'kraken': {
+        # Indexy variant z perform_adaptive_preprocessing (3 = Sauvola, 4 = Wolf)
+        "variants": [0, 1, 2],
+        "psm_modes": [6, 4],
+        "oem_modes": [1, 3],
+    },
+}
+
+
+def load_profiles(path=PROFILES_PATH):
+    """
+    Načte konfigurační soubor ({engine: {jméno profilu: nastavení}})
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Varování: Nelze načíst profily OCR z {path}: {str(e)}", file=sys.stderr)
+        return {}
+
+
+def get_profile(engine, name=PROFILE_NAME, path=PROFILES_PATH):
+    """
+    Vrátí profil enginu doplněný o výchozí hodnoty
+
+    Args:
+        engine: Jméno enginu ('optimized_trocr' nebo 'kraken')
+        name: Jméno profilu (výchozí z OCR_PROFILE)
+        path: Konfigurační soubor
+
+    Returns:
+        Dictionary s nastavením enginu (klíč "name" obsahuje jméno skutečně
+        použitého profilu)
+    """
+    profile = copy.deepcopy(DEFAULT_PROFILES[engine])
+    configured = load_profiles(path).get(engine, {})
+
+    if name in configured:
+        profile.update(configured[name])
+    elif name != 'default':
+        print(f"Varování: Profil {name} pro {engine} neexistuje, používám výchozí", file=sys.stderr)
+        name = 'default'
+
+    # Klíče v JSON jsou vždy řetězce
+    if "psm" in profile:
+        profile["psm"] = {int(variant): int(psm) for variant, psm in profile["psm"].items()}
+    profile["name"] = name
+    return profile
+
+
+def save_profiles(engine, profiles, frontier=None, path=PROFILES_PATH):
+    """
+    Zapíše profily enginu do konfiguračního souboru (ostatní enginy a
+    profily zůstanou zachovány)
+
+    Args:
+        engine: Jméno enginu
+        profiles: Dictionary {jméno profilu: nastavení}
+        frontier: Pareto fronta z ladění (ukládá se pro přehled)
+        path: Konfigurační soubor
+    """
+    config = load_profiles(path)
+    engine_profiles = config.setdefault(engine, {})
+    engine_profiles.update(profiles)
+    if frontier is not None:
+        engine_profiles["_frontier"] = frontier
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    os.replace(temp_path, path)
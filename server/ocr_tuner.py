@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+"""
+Offline ladění konfigurace OCR enginů (Pareto fronta latence a CER)
+
+Nástroj rozpozná označený korpus (obrázek + stejnojmenný soubor `.gt.txt`
+nebo `.txt` s přepisem) všemi kombinacemi variant předzpracování,
+orientací, psm/oem a maximálních rozměrů z mřížky. Každá kombinace se
+změří jednou na stránku, konfigurace enginu (množiny variant, orientací
+a režimů) se pak vyhodnotí simulací výběru, který engine dělá za běhu -
+bez opakovaného spouštění Tesseractu. Z konfigurací se spočítá Pareto
+fronta průměrné latence stránky a chybovosti znaků (CER) a zapíšou se
+pojmenované profily:
+
+- `fast` - nejlevnější konfigurace na frontě
+- `balanced` - nejlevnější konfigurace splňující cílovou CER
+- `accurate` - konfigurace s nejnižší CER
+
+Použití:
+    python server/ocr_tuner.py <adresář korpusu> [--engine optimized_trocr|kraken]
+        [--lang eng] [--variants 0-13] [--orientations 0,270] [--psm 3,4,6]
+        [--oem 1] [--max-dimensions 1600,2000,2400] [--target-cer 0.1]
+        [--output ocr_profiles.json] [--dry-run]
+
+Profil se v enginech vybírá proměnnou prostředí OCR_PROFILE. Měření běží
+sekvenčně v jednom procesu, aby časy jednotlivých kombinací nebyly
+zkreslené souběhem; latence paralelního enginu se z nich odhaduje
+simulací rozvrhu poolu procesů.
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import argparse
+import itertools
+import contextlib
+import numpy as np
+from ocr_batch import IMAGE_EXTENSIONS
+from ocr_words import image_to_words
+from ocr_profiles import PROFILES_PATH, save_profiles
+from resource_budget import plan_pool
+from text_postprocess import quality_score as score_candidate
+from variant_priors import ACCEPT_SCORE
+
+# Výchozí rezerva nad nejlepší CER pro profil `balanced`, pokud není zadán cíl
+DEFAULT_CER_MARGIN = 0.02
+
+# Přípony souborů s přepisem (zkouší se v tomto pořadí)
+TRANSCRIPT_EXTENSIONS = ('.gt.txt', '.txt')
+
+
+def parse_int_list(value):
+    """
+    Seznam celých čísel z textu ("0,2,5" nebo rozsah "0-11")
+    """
+    numbers = []
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part[1:]:
+            start, end = part.split('-', 1)
+            numbers.extend(range(int(start), int(end) + 1))
+        else:
+            numbers.append(int(part))
+    return numbers
+
+
+def load_corpus(directory):
+    """
+    Načte dvojice (cesta k obrázku, přepis) z adresáře korpusu
+
+    Obrázky bez přepisu se přeskočí.
+    """
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        stem, extension = os.path.splitext(name)
+        if extension.lower() not in IMAGE_EXTENSIONS:
+            continue
+        for transcript_extension in TRANSCRIPT_EXTENSIONS:
+            transcript_path = os.path.join(directory, stem + transcript_extension)
+            if os.path.exists(transcript_path):
+                with open(transcript_path, 'r', encoding='utf-8') as f:
+                    corpus.append((os.path.join(directory, name), f.read()))
+                break
+        else:
+            print(f"Varování: {name} nemá přepis, přeskakuji", file=sys.stderr)
+    return corpus
+
+
+def normalize_text(text):
+    """
+    Sjednocení bílých znaků před porovnáním s přepisem
+    """
+    return ' '.join(text.split())
+
+
+def edit_distance(a, b):
+    """
+    Levenshteinova vzdálenost dvou řetězců
+
+    Řádek dynamického programování se počítá vektorově: náhrada a smazání
+    z předchozího řádku, vkládání jako kumulativní minimum po řádku.
+    """
+    if not a:
+        return len(b)
+    if not b:
+        return len(a)
+
+    b_codes = np.array([ord(c) for c in b], dtype=np.int64)
+    offsets = np.arange(len(b) + 1, dtype=np.int64)
+    previous = offsets.copy()
+    for i, char in enumerate(a, start=1):
+        current = np.empty_like(previous)
+        current[0] = i
+        current[1:] = np.minimum(previous[1:] + 1, previous[:-1] + (b_codes != ord(char)))
+        # current[j] = min(current[k] + (j - k)) pro k <= j
+        current = np.minimum.accumulate(current - offsets) + offsets
+        previous = current
+    return int(previous[-1])
+
+
+def character_error_rate(hypothesis, reference):
+    """
+    Chybovost znaků (CER) rozpoznaného textu vůči přepisu
+    """
+    hypothesis = normalize_text(hypothesis)
+    reference = normalize_text(reference)
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    return edit_distance(hypothesis, reference) / len(reference)
+
+
+def simulate_wall_time(durations, workers):
+    """
+    Odhad doby zpracování úloh v poolu (úlohy se přidělují volným procesům v pořadí)
+    """
+    finish_times = [0.0] * max(1, min(workers, len(durations)))
+    for duration in durations:
+        heapq.heapreplace(finish_times, finish_times[0] + duration)
+    return max(finish_times)
+
+
+def pareto_frontier(candidates):
+    """
+    Konfigurace, které žádná jiná nepřekoná zároveň v latenci i CER
+
+    Returns:
+        Seznam kandidátů seřazený podle latence (CER na frontě klesá)
+    """
+    frontier = []
+    for candidate in sorted(candidates, key=lambda c: (c["latency"], c["cer"])):
+        if not frontier or candidate["cer"] < frontier[-1]["cer"]:
+            frontier.append(candidate)
+    return frontier
+
+
+def choose_profiles(frontier, target_cer=None):
+    """
+    Pojmenované profily z Pareto fronty
+
+    Args:
+        frontier: Pareto fronta seřazená podle latence
+        target_cer: Cílová CER pro `balanced` (výchozí nejlepší CER + DEFAULT_CER_MARGIN)
+
+    Returns:
+        Dictionary {jméno profilu: kandidát}
+    """
+    accurate = frontier[-1]
+    if target_cer is None:
+        target_cer = accurate["cer"] + DEFAULT_CER_MARGIN
+    balanced = next((c for c in frontier if c["cer"] <= target_cer), accurate)
+    return {"fast": frontier[0], "balanced": balanced, "accurate": accurate}
+
+
+def summarize(evaluations, label):
+    """
+    Průměrné metriky konfigurace přes stránky korpusu
+    """
+    summary = {
+        "label": label,
+        "cer": float(np.mean([e[0] for e in evaluations])),
+        "latency": float(np.mean([e[1] for e in evaluations])),
+        "cpu_seconds": float(np.mean([e[2] for e in evaluations])),
+    }
+    if evaluations and len(evaluations[0]) > 3:
+        # Běh zavedeného uživatele (favorit napřed, předčasné ukončení)
+        summary["established_cer"] = float(np.mean([e[3] for e in evaluations]))
+        summary["established_latency"] = float(np.mean([e[4] for e in evaluations]))
+    return summary
+
+
+class OptimizedTrocrTuner:
+    """
+    Ladění optimized_trocr - varianty, orientace, psm podle varianty, oem a maximální rozměr
+
+    Engine spouští všechny kombinace varianta x orientace paralelně a vybere
+    výsledek s nejvyšším skóre kvality, stejný výběr se simuluje i zde.
+    Zavedený uživatel (viz variant_priors) ale nejprve spustí jen svého
+    favorita a při skóre >= ACCEPT_SCORE skončí - tento běh se simuluje
+    zvlášť (metriky established_*), Pareto fronta a profily se vybírají
+    podle běhu nového uživatele.
+    """
+
+    engine_name = 'optimized_trocr'
+
+    def __init__(self, args):
+        import optimized_trocr
+        self.engine = optimized_trocr
+        self.variants = args.variants
+        self.orientations = args.orientations
+        self.psm_modes = args.psm
+        self.oem_modes = args.oem
+        self.max_dimensions = args.max_dimensions
+        self.workers = args.workers
+        self.lang = args.lang
+
+    def measure_page(self, image_path, reference):
+        """
+        Změří všechny kombinace mřížky na jedné stránce
+
+        Returns:
+            Dictionary {(varianta, orientace, psm, oem, rozměr): (sekundy, CER, skóre)}
+        """
+        measurements = {}
+        for max_dimension, variant in itertools.product(self.max_dimensions, self.variants):
+            # Engine předzpracovává znovu pro každou kombinaci, čas se proto
+            # připočítá ke každé z nich
+            started = time.perf_counter()
+            image = self.engine.preprocess_image(image_path, variant, max_dimension)
+            preprocess_seconds = time.perf_counter() - started
+
+            for orientation, psm, oem in itertools.product(self.orientations, self.psm_modes, self.oem_modes):
+                started = time.perf_counter()
+                try:
+                    oriented = self.engine.orient_image(image, orientation)
+                    words = image_to_words(oriented, config=f"--psm {psm} --oem {oem} -l {self.lang}")
+                    text = words.text()
+                    score = score_candidate(text, words.mean_confidence())
+                    cer = character_error_rate(self.engine.post_process_text(text), reference)
+                except Exception as e:
+                    print(f"Chyba kombinace {variant}/{orientation}/psm {psm}/oem {oem}: {str(e)}",
+                          file=sys.stderr)
+                    score, cer = 0, 1.0
+                seconds = preprocess_seconds + time.perf_counter() - started
+                measurements[(variant, orientation, psm, oem, max_dimension)] = (seconds, cer, score)
+        return measurements
+
+    def evaluate(self, pages, variants, orientations, psm_map, oem, max_dimension):
+        """
+        Simulace běhu enginu s danou konfigurací na změřených stránkách
+
+        Returns:
+            Seznam (CER, latence, CPU sekundy, CER a latence zavedeného uživatele) po stránkách
+        """
+        pages_arms = [[measurements[(variant, orientation, psm_map[variant], oem, max_dimension)]
+                       for variant in variants for orientation in orientations]
+                      for measurements in pages]
+
+        # Engine řadí stabilně podle skóre - při shodě vyhrává dřívější kombinace
+        winners = [max(range(len(arms)), key=lambda index: arms[index][2]) for arms in pages_arms]
+
+        # Preference zavedeného uživatele se ustálí na nejčastějším vítězi
+        favourite = max(set(winners), key=lambda index: (winners.count(index), -index))
+
+        evaluations = []
+        for arms, winner in zip(pages_arms, winners):
+            durations = [arm[0] for arm in arms]
+            favourite_arm = arms[favourite]
+            if favourite_arm[2] >= ACCEPT_SCORE:
+                established = (favourite_arm[1], favourite_arm[0])
+            else:
+                rest = durations[:favourite] + durations[favourite + 1:]
+                established = (arms[winner][1], favourite_arm[0] + simulate_wall_time(rest, self.workers))
+            evaluations.append((arms[winner][1], simulate_wall_time(durations, self.workers), sum(durations))
+                               + established)
+        return evaluations
+
+    def best_psm_map(self, pages, oem, max_dimension):
+        """
+        Pro každou variantu psm s nejnižší průměrnou CER (v lepší z orientací)
+        """
+        psm_map = {}
+        for variant in self.variants:
+            def mean_cer(psm):
+                return np.mean([min(m[(variant, orientation, psm, oem, max_dimension)][1]
+                                    for orientation in self.orientations) for m in pages])
+            psm_map[variant] = min(self.psm_modes, key=mean_cer)
+        return psm_map
+
+    def candidates(self, pages):
+        """
+        Kandidátní konfigurace - pro každé oem, rozměr a množinu orientací
+        hladový výběr variant (v každém kroku varianta s největším zlepšením CER)
+        """
+        results = []
+        for oem, max_dimension in itertools.product(self.oem_modes, self.max_dimensions):
+            psm_map = self.best_psm_map(pages, oem, max_dimension)
+            for count in range(1, len(self.orientations) + 1):
+                for orientations in itertools.combinations(self.orientations, count):
+                    chosen = []
+                    remaining = list(self.variants)
+                    while remaining:
+                        scored = []
+                        for variant in remaining:
+                            summary = summarize(
+                                self.evaluate(pages, chosen + [variant], orientations, psm_map, oem, max_dimension),
+                                'greedy')
+                            scored.append((summary["cer"], summary["latency"], variant, summary))
+                        cer, latency, variant, summary = min(scored, key=lambda s: s[:2])
+                        chosen.append(variant)
+                        remaining.remove(variant)
+                        summary["profile"] = self.profile(chosen, orientations, psm_map, oem, max_dimension)
+                        results.append(summary)
+        return results
+
+    def baseline(self, pages):
+        """
+        Výchozí profil (původní ručně zvolené hodnoty), pokud jej mřížka pokrývá
+        """
+        variants = [0, 2, 5, 7, 10]
+        orientations = [0, 270]
+        psm_map = {variant: self.engine.psm_for_variant(variant, {}) for variant in variants}
+        if (not set(variants) <= set(self.variants) or not set(orientations) <= set(self.orientations)
+                or not set(psm_map.values()) <= set(self.psm_modes)
+                or 1 not in self.oem_modes or 2000 not in self.max_dimensions):
+            return None
+        summary = summarize(self.evaluate(pages, variants, orientations, psm_map, 1, 2000), 'default')
+        summary["profile"] = self.profile(variants, orientations, psm_map, 1, 2000)
+        return summary
+
+    @staticmethod
+    def profile(variants, orientations, psm_map, oem, max_dimension):
+        return {
+            "variants": list(variants),
+            "orientations": list(orientations),
+            "psm": {str(variant): psm_map[variant] for variant in variants},
+            "oem": oem,
+            "max_dimension": max_dimension,
+        }
+
+
+class KrakenTuner:
+    """
+    Ladění kraken_api - varianty adaptivního předzpracování a mřížka psm x oem
+
+    Engine zkouší kombinace sekvenčně a ponechá výsledek s nejvyšší
+    důvěryhodností (při podobné důvěře delší text), latence je tedy součet.
+    """
+
+    engine_name = 'kraken'
+
+    def __init__(self, args):
+        with contextlib.redirect_stdout(sys.stderr):
+            import kraken_api
+        self.engine = kraken_api
+        self.psm_modes = args.psm
+        self.oem_modes = args.oem
+        self.lang = args.lang
+        self.variants = None
+
+    def measure_page(self, image_path, reference):
+        """
+        Změří všechny kombinace mřížky na jedné stránce
+
+        Returns:
+            Dictionary {(varianta, psm, oem): (sekundy, CER, text, důvěra)}, klíč
+            "preprocess" obsahuje čas předzpracování (platí se jednou za stránku)
+        """
+        started = time.perf_counter()
+        images = self.engine.perform_adaptive_preprocessing(image_path, self.lang)
+        measurements = {"preprocess": time.perf_counter() - started}
+
+        if self.variants is None:
+            self.variants = list(range(len(images)))
+
+        for variant in self.variants:
+            for psm, oem in itertools.product(self.psm_modes, self.oem_modes):
+                started = time.perf_counter()
+                try:
+                    text, confidence = self.engine.recognize_attempt(
+                        images[variant], f'--oem {oem} --psm {psm} -l {self.lang}')
+                except Exception as e:
+                    print(f"Chyba kombinace {variant}/psm {psm}/oem {oem}: {str(e)}", file=sys.stderr)
+                    text, confidence = "", 0.0
+                measurements[(variant, psm, oem)] = (
+                    time.perf_counter() - started, character_error_rate(text, reference), text, confidence)
+        return measurements
+
+    def evaluate(self, pages, variants, psm_modes, oem_modes):
+        evaluations = []
+        for measurements in pages:
+            best = {"text": "", "confidence": 0.0, "cer": 1.0}
+            seconds = measurements["preprocess"]
+            for variant, psm, oem in itertools.product(variants, psm_modes, oem_modes):
+                duration, cer, text, confidence = measurements[(variant, psm, oem)]
+                seconds += duration
+                if self.engine.is_better_result(text, confidence, best):
+                    best = {"text": text, "confidence": confidence, "cer": cer}
+            evaluations.append((best["cer"], seconds, seconds))
+        return evaluations
+
+    def candidates(self, pages):
+        """
+        Všechny neprázdné podmnožiny variant, psm a oem (mřížka je malá)
+        """
+        def subsets(values):
+            return [list(c) for count in range(1, len(values) + 1)
+                    for c in itertools.combinations(values, count)]
+
+        results = []
+        for variants, psm_modes, oem_modes in itertools.product(
+                subsets(self.variants), subsets(self.psm_modes), subsets(self.oem_modes)):
+            summary = summarize(self.evaluate(pages, variants, psm_modes, oem_modes), 'grid')
+            summary["profile"] = {"variants": variants, "psm_modes": psm_modes, "oem_modes": oem_modes}
+            results.append(summary)
+        return results
+
+    def baseline(self, pages):
+        variants = [v for v in [0, 1, 2] if v in self.variants]
+        if not {6, 4} <= set(self.psm_modes) or not {1, 3} <= set(self.oem_modes):
+            return None
+        summary = summarize(self.evaluate(pages, variants, [6, 4], [1, 3]), 'default')
+        summary["profile"] = {"variants": variants, "psm_modes": [6, 4], "oem_modes": [1, 3]}
+        return summary
+
+
+TUNERS = {
+    'optimized_trocr': OptimizedTrocrTuner,
+    'kraken': KrakenTuner,
+}
+
+
+def format_candidate(candidate):
+    profile = candidate["profile"]
+    settings = ', '.join(f"{key}={value}" for key, value in profile.items() if key != 'psm')
+    established = ''
+    if "established_cer" in candidate:
+        established = (f"(zavedený uživatel: CER {candidate['established_cer']:.4f}  "
+                       f"latence {candidate['established_latency']:.2f} s)  ")
+    return (f"CER {candidate['cer']:.4f}  latence {candidate['latency']:.2f} s  "
+            f"CPU {candidate['cpu_seconds']:.2f} s  {established}{settings}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ladění profilů OCR enginů podle Pareto fronty latence a CER")
+    parser.add_argument('corpus', help="Adresář s obrázky a přepisy (.gt.txt nebo .txt)")
+    parser.add_argument('--engine', choices=sorted(TUNERS), default='optimized_trocr')
+    parser.add_argument('--lang', default='eng', help="Jazyk Tesseractu (jediný model)")
+    parser.add_argument('--variants', type=parse_int_list, default=list(range(14)),
+                        help="Varianty předzpracování optimized_trocr (výchozí 0-13)")
+    parser.add_argument('--orientations', type=parse_int_list, default=[0, 270])
+    parser.add_argument('--psm', type=parse_int_list, default=None,
+                        help="Režimy segmentace (výchozí 3,4,6 pro optimized_trocr, 6,4 pro kraken)")
+    parser.add_argument('--oem', type=parse_int_list, default=None,
+                        help="OCR engine mode (výchozí 1 pro optimized_trocr, 1,3 pro kraken)")
+    parser.add_argument('--max-dimensions', type=parse_int_list, default=[1600, 2000, 2400])
+    parser.add_argument('--workers', type=int, default=plan_pool('optimized_trocr')[0],
+                        help="Velikost poolu pro odhad latence paralelního enginu")
+    parser.add_argument('--target-cer', type=float, default=None,
+                        help="Cílová CER pro profil balanced")
+    parser.add_argument('--output', default=PROFILES_PATH, help="Konfigurační soubor s profily")
+    parser.add_argument('--dry-run', action='store_true', help="Profily jen vypsat, nezapisovat")
+    args = parser.parse_args()
+
+    if args.psm is None:
+        args.psm = [3, 4, 6] if args.engine == 'optimized_trocr' else [6, 4]
+    if args.oem is None:
+        args.oem = [1] if args.engine == 'optimized_trocr' else [1, 3]
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print(f"Chyba: V {args.corpus} nejsou žádné obrázky s přepisem")
+        return 1
+
+    tuner = TUNERS[args.engine](args)
+
+    # Výpisy enginů během měření patří na stderr
+    pages = []
+    with contextlib.redirect_stdout(sys.stderr):
+        for index, (image_path, reference) in enumerate(corpus, start=1):
+            started = time.time()
+            pages.append(tuner.measure_page(image_path, reference))
+            print(f"[{index}/{len(corpus)}] {os.path.basename(image_path)} změřena za "
+                  f"{time.time() - started:.1f} s", file=sys.stderr)
+
+    candidates = tuner.candidates(pages)
+    baseline = tuner.baseline(pages)
+    if baseline is not None:
+        candidates.append(baseline)
+
+    frontier = pareto_frontier(candidates)
+    chosen = choose_profiles(frontier, args.target_cer)
+
+    print(f"Pareto fronta ({len(frontier)} z {len(candidates)} konfigurací, {len(corpus)} stránek):")
+    for candidate in frontier:
+        print(f"  {format_candidate(candidate)}")
+    if baseline is not None:
+        print(f"Výchozí profil: {format_candidate(baseline)}")
+
+    profiles = {}
+    for name, candidate in chosen.items():
+        print(f"{name}: {format_candidate(candidate)}")
+        profiles[name] = dict(candidate["profile"], tuning={
+            "cer": round(candidate["cer"], 5),
+            "latency": round(candidate["latency"], 4),
+            "cpu_seconds": round(candidate["cpu_seconds"], 4),
+            **{key: round(candidate[key], 5 if key.endswith('cer') else 4)
+               for key in ("established_cer", "established_latency") if key in candidate},
+            "pages": len(corpus),
+            "lang": args.lang,
+        })
+
+    if args.dry_run:
+        print(json.dumps(profiles, indent=2, ensure_ascii=False))
+        return 0
+
+    frontier_summary = [{key: candidate[key] for key in ("cer", "latency", "cpu_seconds", "profile")}
+                        for candidate in frontier]
+    save_profiles(tuner.engine_name, profiles, frontier_summary, args.output)
+    print(f"Profily zapsány do {args.output} (výběr proměnnou OCR_PROFILE)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
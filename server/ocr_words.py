@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Sloupcový formát slov z výstupu Tesseractu
+
+`image_to_data` ve formátu slovníku vrací pro každé slovo sadu Python
+seznamů, ze kterých se ve smyčce skládal text a průměrná důvěryhodnost
+a geometrie se zahodila. `WordTable` se místo toho sestaví přímo z TSV
+výstupu do NumPy polí (obdélníky, důvěryhodnost, čísla bloků a řádků)
+a tabulky řetězců. Agregace důvěryhodnosti, kvality i řádků jsou
+vektorové a tabulku lze uložit do JSON nebo kompaktně binárně (npz).
+"""
+
+import io
+import json
+import numpy as np
+import pytesseract
+from text_postprocess import quality_score
+
+# Sloupce TSV výstupu Tesseractu
+TSV_COLUMNS = ('level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text')
+
+# Úroveň slova v TSV výstupu
+WORD_LEVEL = 5
+
+# Celočíselné sloupce uložené v tabulce
+INT_COLUMNS = ('left', 'top', 'width', 'height', 'block_num', 'par_num', 'line_num')
+
+
+class WordTable:
+    """
+    Rozpoznaná slova jako sloupce NumPy polí
+
+    Atributy:
+        words: Seznam řetězců (tabulka řetězců)
+        left, top, width, height: Obdélníky slov (int32)
+        conf: Důvěryhodnost slov 0-100 (float32)
+        block_num, par_num, line_num: Čísla bloků, odstavců a řádků (int32)
+    """
+
+    __slots__ = ('words', 'conf') + INT_COLUMNS
+
+    def __init__(self, words=(), conf=(), **columns):
+        self.words = list(words)
+        self.conf = np.asarray(conf, dtype=np.float32)
+        for name in INT_COLUMNS:
+            setattr(self, name, np.asarray(columns.get(name, np.zeros(len(self.words))), dtype=np.int32))
+
+    @classmethod
+    def from_tsv(cls, tsv):
+        """
+        Sestaví tabulku z TSV výstupu `image_to_data` (jen neprázdná slova)
+        """
+        rows = [row.split('\t', 11) for row in tsv.splitlines()[1:]]
+        rows = [row for row in rows
+                if len(row) == 12 and row[0] == str(WORD_LEVEL) and row[11].strip()]
+        if not rows:
+            return cls()
+
+        columns = dict(zip(TSV_COLUMNS, zip(*rows)))
+        return cls(
+            words=columns['text'],
+            conf=np.array(columns['conf'], dtype=np.float32),
+            **{name: np.array(columns[name], dtype=np.float64) for name in INT_COLUMNS}
+        )
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Sestaví tabulku z `image_to_data` ve formátu slovníku (Output.DICT)
+        """
+        keep = [i for i, text in enumerate(data['text']) if str(text).strip()]
+        return cls(
+            words=[data['text'][i] for i in keep],
+            conf=[float(data['conf'][i]) for i in keep],
+            **{name: [data[name][i] for i in keep] for name in INT_COLUMNS if name in data}
+        )
+
+    def __len__(self):
+        return len(self.words)
+
+    def select(self, mask):
+        """
+        Vybere podmnožinu slov podle booleovské masky nebo indexů
+        """
+        indices = np.arange(len(self))[mask]
+        return WordTable(
+            words=[self.words[i] for i in indices],
+            conf=self.conf[indices],
+            **{name: getattr(self, name)[indices] for name in INT_COLUMNS}
+        )
+
+    @classmethod
+    def concat(cls, tables):
+        """
+        Spojí více tabulek za sebe (pořadí slov odpovídá pořadí tabulek)
+        """
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return cls()
+        return cls(
+            words=[word for table in tables for word in table.words],
+            conf=np.concatenate([table.conf for table in tables]),
+            **{name: np.concatenate([getattr(table, name) for table in tables]) for name in INT_COLUMNS}
+        )
+
+    def offset(self, dx=0, dy=0):
+        """
+        Posune obdélníky slov (např. z plátna montáže zpět do souřadnic varianty)
+        """
+        table = self.select(slice(None))
+        table.left -= dx
+        table.top -= dy
+        return table
+
+    @property
+    def boxes(self):
+        """
+        Obdélníky slov jako pole (n, 4) ve tvaru left, top, width, height
+        """
+        return np.stack([self.left, self.top, self.width, self.height], axis=1)
+
+    @property
+    def centers_y(self):
+        return self.top + self.height / 2
+
+    def line_ids(self):
+        """
+        Pořadové číslo řádku každého slova (unikátní přes bloky a odstavce)
+        """
+        if not len(self):
+            return np.zeros(0, dtype=np.int64)
+        keys = np.stack([self.block_num, self.par_num, self.line_num], axis=1)
+        # Řádky jsou v TSV souvislé, nový řádek začíná změnou klíče
+        starts = np.any(keys[1:] != keys[:-1], axis=1)
+        return np.concatenate([[0], np.cumsum(starts)])
+
+    def text(self):
+        return ' '.join(self.words)
+
+    def mean_confidence(self):
+        return float(self.conf.mean()) if len(self) else 0.0
+
+    def quality_score(self):
+        """
+        Skóre kvality jako u kandidátů v optimized_trocr (viz text_postprocess)
+        """
+        return quality_score(self.text(), self.mean_confidence())
+
+    def lines(self):
+        """
+        Text po řádcích
+
+        Returns:
+            Seznam řetězců, jeden na řádek
+        """
+        ids = self.line_ids()
+        lines = [[] for _ in range(int(ids[-1]) + 1)] if len(ids) else []
+        for line_id, word in zip(ids, self.words):
+            lines[line_id].append(word)
+        return [' '.join(words) for words in lines]
+
+    def line_confidences(self):
+        """
+        Průměrná důvěryhodnost každého řádku
+        """
+        ids = self.line_ids()
+        if not len(ids):
+            return np.zeros(0, dtype=np.float32)
+        return (np.bincount(ids, weights=self.conf) / np.bincount(ids)).astype(np.float32)
+
+    def to_json(self):
+        """
+        Serializace do slovníku pro JSON
+        """
+        return {
+            "words": self.words,
+            "conf": [round(float(c), 2) for c in self.conf],
+            **{name: getattr(self, name).tolist() for name in INT_COLUMNS}
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        if isinstance(data, str):
+            data = json.loads(data)
+        return cls(words=data["words"], conf=data["conf"],
+                   **{name: data[name] for name in INT_COLUMNS})
+
+    def to_bytes(self):
+        """
+        Kompaktní binární serializace (npz, slova jako jeden UTF-8 blob)
+        """
+        buffer = io.BytesIO()
+        # Slova z Tesseractu neobsahují bílé znaky, oddělovač '\n' je jednoznačný
+        blob = np.frombuffer('\n'.join(self.words).encode('utf-8'), dtype=np.uint8)
+        np.savez_compressed(buffer, words=blob, conf=self.conf,
+                            **{name: getattr(self, name) for name in INT_COLUMNS})
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data)) as arrays:
+            blob = arrays["words"].tobytes().decode('utf-8')
+            return cls(words=blob.split('\n') if blob else [], conf=arrays["conf"],
+                       **{name: arrays[name] for name in INT_COLUMNS})
+
+
+def image_to_words(image, config=''):
+    """
+    Spustí Tesseract a vrátí rozpoznaná slova jako WordTable
+    """
+    tsv = pytesseract.image_to_data(image, config=config, output_type=pytesseract.Output.STRING)
+    return WordTable.from_tsv(tsv)
@@ -17,9 +17,21 @@ import cv2
 import numpy as np
 import pytesseract
 from PIL import Image, ImageEnhance, ImageFilter
-import multiprocessing
-from concurrent.futures import ProcessPoolExecutor
 import time
+import contextlib
+from language_detection import resolve_language
+from ocr_batch import batch_main
+from text_postprocess import clean_text, clean_texts, quality_score as score_candidate
+from variant_priors import ACCEPT_SCORE, device_fingerprint, plan_arms, record_outcome
+from montage import recognize_montage
+from thresholding import threshold_stack, to_image
+from ocr_words import image_to_words
+from resource_budget import apply_thread_limits, init_worker, plan_pool
+from ocr_profiles import get_profile
+from worker_pool import ThreadPool, WorkerPool, estimate_image_footprint
+from debug_capture import capture_images
+from artifact_cache import open_page
+import incremental_ocr
 
 # Měření celkového času zpracování
 start_time = time.time()
@@ -28,32 +40,178 @@ start_time = time.time()
 TESSDATA_PREFIX = os.path.join(os.getcwd(), 'tessdata')
 os.environ['TESSDATA_PREFIX'] = TESSDATA_PREFIX
 
-# Nastavení maximálního počtu procesů pro paralelní zpracování
-# Použití multiprocessing.cpu_count() - 1 zajistí, že jeden procesor zůstane volný pro systém
-MAX_WORKERS = max(1, multiprocessing.cpu_count() - 1)
-print(f"Využívám {MAX_WORKERS} procesů pro paralelní zpracování")
+# Nastavení maximálního počtu procesů pro paralelní zpracování podle skutečně
+# dostupných jader (kvóta cgroup, afinita) - každý proces spouští jednovláknový
+# Tesseract, takže celkový počet vláken odpovídá rozpočtu
+MAX_WORKERS, WORKER_THREADS = plan_pool('optimized_trocr')
+apply_thread_limits(WORKER_THREADS)
 
-# Konfigurační zprávy
-print(f"Používám Tesseract data directory: {TESSDATA_PREFIX}")
-if os.path.exists(os.path.join(TESSDATA_PREFIX, 'eng.traineddata')):
-    print("Nalezena anglická trénovací data")
-if os.path.exists(os.path.join(TESSDATA_PREFIX, 'ces.traineddata')):
-    print("Nalezena česká trénovací data")
+# Způsob spouštění Tesseractu: 'parallel' (jedno volání na variantu)
+# nebo 'montage' (všechny varianty vlny v jednom plátně a jednom volání)
+EXECUTION_MODE = os.environ.get('OCR_EXECUTION', 'parallel')
 
-def preprocess_image(image_path, variant=0):
+# Paralelizace variant: 'process' (pool procesů s paměťovým rozpočtem) nebo
+# 'thread' (pool vláken sdílí jednou dekódovaný obraz bez kopírování - OpenCV
+# i čekání na podproces Tesseractu uvolňují GIL), viz test-scripts/benchmark_executors.py
+EXECUTOR_MODE = os.environ.get('OCR_EXECUTOR', 'process')
+
+# Konfigurační profil (varianty, orientace, psm, oem, rozměr) podle OCR_PROFILE,
+# viz ocr_profiles.py a ocr_tuner.py
+PROFILE = get_profile('optimized_trocr')
+
+# Prahování variant 12 (Sauvola) a 13 (Wolf) - obě masky vychází z jedněch
+# lokálních statistik stránky (viz thresholding.py a statistical_masks)
+STATISTICAL_VARIANTS = {12: ('sauvola', 25, 0.2), 13: ('wolf', 25, 0.5)}
+
+def init_batch_worker(threads):
+    """
+    Inicializace pracovního procesu v dávkovém režimu
+    
+    Standardní výstup dávky patří jen JSONL výsledkům - výpisy pracovníka
+    (Python i knihovny v C) se přesměrují na stderr bez ohledu na to, jak
+    pracovník vznikl (fork, forkserver, spawn).
+    """
+    init_worker(threads)
+    sys.stdout.flush()
+    os.dup2(sys.stderr.fileno(), 1)
+    sys.stdout = sys.stderr
+
+def create_executor(batch=False):
+    """
+    Pool procesů velikosti podle rozpočtu CPU s omezenými vlákny v každém procesu
+    
+    Pool hlídá paměťový rozpočet (úlohy se spouští jen, pokud se jejich odhad
+    vejde do rozpočtu) a recykluje pracovníky po počtu úloh nebo nad stropem
+    RSS, viz worker_pool.py
+    
+    Args:
+        batch: Dávkový režim - pracovníci nepíší na standardní výstup
+    """
+    if EXECUTOR_MODE == 'thread':
+        return ThreadPool(MAX_WORKERS)
+    return WorkerPool(MAX_WORKERS, initializer=init_batch_worker if batch else init_worker,
+                      initargs=(WORKER_THREADS,), engine='optimized_trocr')
+
+def print_configuration():
+    """
+    Konfigurační zprávy (vypisují se jen v hlavním procesu)
+    """
+    unit = "vláken" if EXECUTOR_MODE == 'thread' else "procesů"
+    print(f"Využívám {MAX_WORKERS} {unit} pro paralelní zpracování (režim {EXECUTION_MODE})")
+    print(f"Profil {PROFILE['name']}: varianty {PROFILE['variants']}, orientace {PROFILE['orientations']}")
+    print(f"Používám Tesseract data directory: {TESSDATA_PREFIX}")
+    if os.path.exists(os.path.join(TESSDATA_PREFIX, 'eng.traineddata')):
+        print("Nalezena anglická trénovací data")
+    if os.path.exists(os.path.join(TESSDATA_PREFIX, 'ces.traineddata')):
+        print("Nalezena česká trénovací data")
+
+def fit_to_dimension(image, max_dimension=None):
+    """
+    Zmenší obraz tak, aby delší strana nepřesáhla maximální rozměr
+    
+    Zachováme poměr stran, ale omezíme maximální velikost (2000 pixelů ve výchozím profilu)
+    """
+    if max_dimension is None:
+        max_dimension = PROFILE["max_dimension"]
+    height, width = image.shape[:2]
+    if max(height, width) > max_dimension:
+        scale = max_dimension / max(height, width)
+        new_width = int(width * scale)
+        new_height = int(height * scale)
+        print(f"Obrázek zmenšen na {new_width}x{new_height} pro rychlejší zpracování")
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+    return image
+
+def working_image(page, max_dimension=None):
+    """
+    Dekódovaný a zmenšený obraz stránky - jednou pro všechny varianty
+    
+    Args:
+        page: Artefakty stránky (artifact_cache.PageArtifacts)
+        max_dimension: Maximální rozměr obrázku (výchozí podle profilu)
+    
+    Returns:
+        BGR obraz jen pro čtení (sdílí se mezi vlákny bez kopií, opakovaný
+        pokus ho načte z cache artefaktů) nebo None
+    """
+    if max_dimension is None:
+        max_dimension = PROFILE["max_dimension"]
+    
+    def create():
+        image = page.image()
+        return fit_to_dimension(image, max_dimension) if image is not None else None
+    
+    return page.get('normalized', create, max_dimension=max_dimension)
+
+def statistical_masks(page, max_dimension=None):
+    """
+    Binární obrazy všech variant STATISTICAL_VARIANTS z jednoho integrálního obrazu
+    
+    Returns:
+        Pole 0/255 tvaru (počet variant, výška, šířka) jen pro čtení nebo None
+    """
+    if max_dimension is None:
+        max_dimension = PROFILE["max_dimension"]
+    
+    def create():
+        image = working_image(page, max_dimension)
+        if image is None:
+            return None
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return to_image(threshold_stack(gray, list(STATISTICAL_VARIANTS.values())))
+    
+    return page.get('statistical_masks', create, max_dimension=max_dimension)
+
+def load_variant_image(page, variant):
+    """
+    Předzpracovaný obraz varianty (před otočením)
+    
+    Předzpracování nezávisí na jazyku, opakovaný pokus s jiným jazykem
+    nebo enginem proto obraz načte z cache artefaktů místo výpočtu.
+    
+    Args:
+        page: Artefakty stránky (artifact_cache.PageArtifacts)
+        variant: Varianta předzpracování
+    
+    Returns:
+        Předzpracovaný obraz jako NumPy pole
+    """
+    max_dimension = PROFILE["max_dimension"]
+    if variant in STATISTICAL_VARIANTS:
+        masks = statistical_masks(page, max_dimension)
+        if masks is not None:
+            return masks[list(STATISTICAL_VARIANTS).index(variant)]
+    
+    failed = []
+    
+    def create():
+        image = working_image(page, max_dimension)
+        processed = preprocess_image(image if image is not None else page.source, variant, max_dimension)
+        # Náhradní prázdný obraz po chybě předzpracování se do cache neukládá
+        if image is None or processed.shape[:2] != image.shape[:2]:
+            failed.append(processed)
+            return None
+        return processed
+    
+    processed = page.get('variant', create, variant=variant, max_dimension=max_dimension)
+    return processed if processed is not None else failed[-1]
+
+def preprocess_image(image_path, variant=0, max_dimension=None):
     """
     Optimalizované předzpracování obrazu pro lepší OCR rozpoznávání rukopisu
     
     Args:
-        image_path: Cesta k souboru s obrázkem
-        variant: Varianta předzpracování (0-11) - přidáno více optimalizovaných metod
+        image_path: Cesta k souboru s obrázkem nebo už dekódovaný BGR obraz
+                    (NumPy pole, např. z working_image - nemění se)
+        variant: Varianta předzpracování (0-13) - přidáno více optimalizovaných metod
+        max_dimension: Maximální rozměr obrázku (výchozí podle profilu)
     
     Returns:
         Předzpracovaný obraz jako NumPy pole
     """
     try:
-        # Načtení obrázku
-        image = cv2.imread(image_path)
+        # Načtení obrázku (dekódovaný obraz se použije přímo)
+        image = image_path if isinstance(image_path, np.ndarray) else cv2.imread(image_path)
         if image is None:
             print(f"Chyba: Nelze načíst obrázek z {image_path}")
             # Vrátit prázdný obrázek v případě chyby
@@ -64,15 +222,8 @@ def preprocess_image(image_path, variant=0):
         print(f"Zpracovávám obrázek {width}x{height} pixelů")
         
         # Pokud je obrázek příliš velký, zmenšíme ho pro rychlejší zpracování
-        # Zachováme poměr stran, ale omezíme maximální velikost na 2000 pixelů
-        max_dimension = 2000
-        if max(height, width) > max_dimension:
-            scale = max_dimension / max(height, width)
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            print(f"Obrázek zmenšen na {new_width}x{new_height} pro rychlejší zpracování")
-            image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
-            height, width = new_height, new_width
+        image = fit_to_dimension(image, max_dimension)
+        height, width = image.shape[:2]
         
         # Převod na stupně šedi
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
@@ -207,6 +358,16 @@ def preprocess_image(image_path, variant=0):
             
             # Pak eroze, aby se písmo ztenčilo, ale zůstalo spojené
             processed = cv2.erode(dilated, kernel, iterations=1)
+            
+        elif variant == 12:
+            # Ruční písmo varianta 13: Sauvolovo prahování z lokálního průměru a odchylky
+            # Dobrá pro stíny a skvrny na papíře - práh klesá v oblastech bez kontrastu
+            processed = to_image(threshold_stack(gray, [STATISTICAL_VARIANTS[12]])[0])
+            
+        elif variant == 13:
+            # Ruční písmo varianta 14: Wolfovo prahování normalizované kontrastem stránky
+            # Dobrá pro slabý inkoust na nerovnoměrně osvětlené stránce
+            processed = to_image(threshold_stack(gray, [STATISTICAL_VARIANTS[13]])[0])
         
         # Pokud nebyla aplikována žádná metoda zpracování, vrátíme obraz ve stupních šedi
         if processed is None:
@@ -219,108 +380,188 @@ def preprocess_image(image_path, variant=0):
         # V případě chyby vrátíme prázdný obrázek
         return np.zeros((100, 100), dtype=np.uint8)
 
+def orient_image(image, orientation):
+    """
+    Otočí obraz o danou orientaci (0, 90, 180 nebo 270 stupňů)
+    """
+    if orientation == 90:
+        return cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
+    elif orientation == 180:
+        return cv2.rotate(image, cv2.ROTATE_180)
+    elif orientation == 270:
+        return cv2.rotate(image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return image
+
+def psm_for_variant(variant, overrides=None):
+    """
+    Režim segmentace stránky vhodný pro danou variantu předzpracování
+    
+    Args:
+        variant: Varianta předzpracování
+        overrides: Přepsání psm podle varianty (výchozí z profilu)
+    """
+    if overrides is None:
+        overrides = PROFILE["psm"]
+    if variant in overrides:
+        return overrides[variant]
+    if variant in [0, 1, 6, 7, 10, 12, 13]:
+        # Pro jasné a čisté obrazy nebo jemné rukopisy použijeme psm=6 (jednoduché bloky textu)
+        return 6
+    elif variant in [2, 3, 8, 11]:
+        # Pro složitější rukopisy použijeme psm=4 (text v jedné koloně)
+        return 4
+    # Pro ostatní použijeme psm=3 (plná automatická segmentace stránky)
+    return 3
+
+def build_variant_result(variant, orientation, words):
+    """
+    Sestaví výsledek varianty z rozpoznaných slov
+    
+    Args:
+        variant: Varianta předzpracování
+        orientation: Orientace obrazu
+        words: Rozpoznaná slova (WordTable)
+    
+    Returns:
+        Dictionary s výsledky rozpoznávání
+    """
+    text = words.text()
+    confidence = words.mean_confidence()
+    
+    # Hodnocení kvality výsledku nad lehce vyčištěným textem
+    quality_score = score_candidate(text, confidence)
+    
+    variant_name = f"Varianta {variant}, Orientace {orientation}"
+    print(f"{variant_name}: {text[:30]}... (skóre: {quality_score:.2f}, důvěra: {confidence:.2f})")
+    
+    return {
+        "variant": variant,
+        "orientation": orientation,
+        "text": text,
+        "confidence": confidence,
+        "quality_score": quality_score,
+        "words": words
+    }
+
+def failed_variant_result(variant, orientation, error):
+    print(f"Chyba při zpracování varianty {variant}, orientace {orientation}: {str(error)}")
+    return {
+        "variant": variant,
+        "orientation": orientation,
+        "text": "",
+        "confidence": 0,
+        "quality_score": 0,
+        "error": str(error)
+    }
+
+def debug_images(variant, orientation, variant_image, processed_image):
+    """
+    Mezivýsledky jedné kombinace pojmenované jako v debug_images/
+    """
+    images = {f"variant_{variant}": variant_image}
+    if orientation != 0:
+        images[f"oriented_{variant}_{orientation}"] = processed_image
+    return images
+
 def process_image_variant(args):
     """
-    Zpracovat jednu variantu obrazu paralelně - helper funkce pro ProcessPoolExecutor
+    Zpracovat jednu variantu obrazu paralelně - helper funkce pro pool procesů
     
     Args:
-        args: Tuple obsahující (image_path, variant, orientation, lang)
+        args: Tuple obsahující (image_path, variant, orientation, lang, page), kde
+              page jsou sdílené artefakty stránky v režimu vláken, jinak None
     
     Returns:
         Dictionary s výsledky rozpoznávání
     """
-    image_path, variant, orientation, lang = args
+    image_path, variant, orientation, lang, page = args
+    variant_image = processed_image = None
     
     try:
-        # Předzpracování obrazu
-        processed_image = preprocess_image(image_path, variant)
+        # Předzpracování obrazu (případně z cache artefaktů) a rotace podle potřeby
+        variant_image = load_variant_image(page or open_page(image_path), variant)
+        processed_image = orient_image(variant_image, orientation)
         
-        # Rotace obrazu podle potřeby
-        if orientation == 90:
-            processed_image = cv2.rotate(processed_image, cv2.ROTATE_90_CLOCKWISE)
-        elif orientation == 180:
-            processed_image = cv2.rotate(processed_image, cv2.ROTATE_180)
-        elif orientation == 270:
-            processed_image = cv2.rotate(processed_image, cv2.ROTATE_90_COUNTERCLOCKWISE)
+        # Jazyk je už rozlišený na jediný model (viz resolve_language)
+        config = f"--psm {psm_for_variant(variant)} --oem {PROFILE['oem']} -l {lang}"
         
-        # Rozpoznávání textu s optimálním nastavením pro variantu
-        if variant in [0, 1, 6, 7, 10]:
-            # Pro jasné a čisté obrazy nebo jemné rukopisy použijeme psm=6 (jednoduché bloky textu)
-            psm = 6 
-        elif variant in [2, 3, 8, 11]:
-            # Pro složitější rukopisy použijeme psm=4 (text v jedné koloně)
-            psm = 4
-        else:
-            # Pro ostatní použijeme psm=3 (plná automatická segmentace stránky)
-            psm = 3
+        # Pokročilé rozpoznávání textu (slova včetně geometrie)
+        words = image_to_words(processed_image, config=config)
         
-        # Pro české texty přidáme i angličtinu jako zálohu
-        if lang == 'ces':
-            lang_param = f"{lang}+eng"
-        else:
-            lang_param = lang
-            
-        # Konfigurace rozpoznávání
-        config = f"--psm {psm} --oem 1 -l {lang_param}"
-        
-        # Pokročilé rozpoznávání textu
-        data = pytesseract.image_to_data(processed_image, config=config, output_type=pytesseract.Output.DICT)
-        
-        # Extrakce textu a výpočet průměrné důvěryhodnosti
-        text_parts = []
-        confidence_sum = 0
-        confidence_count = 0
-        
-        for i in range(len(data['text'])):
-            if data['text'][i].strip():
-                text_parts.append(data['text'][i])
-                confidence_sum += float(data['conf'][i])
-                confidence_count += 1
-        
-        if confidence_count == 0:
-            text = ""
-            confidence = 0
-        else:
-            text = ' '.join(text_parts)
-            confidence = confidence_sum / confidence_count
-        
-        # Hodnocení kvality výsledku
-        if not text.strip():
-            quality_score = 0
-        else:
-            # Výpočet poměru alfanumerických znaků
-            alpha_count = sum(c.isalnum() for c in text)
-            total_count = max(1, len(text))
-            char_ratio = alpha_count / total_count
-            
-            # Hodnocení na základě počtu znaků (očekáváme alespoň 10 znaků v rukopisu)
-            text_length_score = min(len(text), 200) / 100
-            
-            # Výpočet celkového skóre kvality s větší váhou pro důvěryhodnost
-            quality_score = (confidence * 0.6) + (text_length_score * 0.2) + (char_ratio * 100 * 0.2)
-        
-        variant_name = f"Varianta {variant}, Orientace {orientation}"
-        print(f"{variant_name}: {text[:30]}... (skóre: {quality_score:.2f}, důvěra: {confidence:.2f})")
-        
-        # Vrácení výsledků
-        return {
-            "variant": variant,
-            "orientation": orientation,
-            "text": text,
-            "confidence": confidence,
-            "quality_score": quality_score
-        }
+        result = build_variant_result(variant, orientation, words)
         
     except Exception as e:
-        print(f"Chyba při zpracování varianty {variant}, orientace {orientation}: {str(e)}")
-        return {
-            "variant": variant,
-            "orientation": orientation,
-            "text": "",
-            "confidence": 0,
-            "quality_score": 0,
-            "error": str(e)
-        }
+        result = failed_variant_result(variant, orientation, e)
+    
+    # Vzorkované uložení mezivýsledků - zápis běží na pozadí (viz debug_capture.py),
+    # neúspěšná kombinace se počítá jako nízká důvěra
+    capture_images(image_path, debug_images(variant, orientation, variant_image, processed_image),
+                   result["confidence"])
+    
+    return result
+
+def prepare_variant_image(args):
+    """
+    Předzpracuje a otočí obraz jedné varianty - helper pro montážní režim
+    
+    Args:
+        args: Tuple obsahující (image_path, variant, orientation, page) - page viz process_image_variant
+    
+    Returns:
+        Tuple (obraz nebo None, chybová zpráva nebo None)
+    """
+    image_path, variant, orientation, page = args
+    try:
+        variant_image = load_variant_image(page or open_page(image_path), variant)
+        processed_image = orient_image(variant_image, orientation)
+        capture_images(image_path, debug_images(variant, orientation, variant_image, processed_image))
+        return processed_image, None
+    except Exception as e:
+        return None, str(e)
+
+def process_variants_montage(image_path, arms, lang, executor, page=None):
+    """
+    Zpracuje více variant jediným voláním Tesseractu (montážní režim)
+    
+    Předzpracování běží paralelně v poolu procesů, obrazy se pak poskládají
+    do jednoho plátna. Plátno se rozpoznává s automatickou segmentací
+    (psm 3) místo režimu podle varianty.
+    
+    Args:
+        image_path: Cesta k souboru s obrázkem
+        arms: Seznam dvojic (varianta, orientace)
+        lang: Jazyk pro OCR
+        executor: Pool procesů pro předzpracování
+        page: Sdílené artefakty stránky (režim vláken)
+    
+    Returns:
+        Tuple (seznam výsledků ve stejném pořadí jako `arms`, počet volání Tesseractu)
+    """
+    footprint = estimate_image_footprint(image_path, PROFILE["max_dimension"])
+    prepared = list(executor.map(prepare_variant_image,
+                                 [(image_path, variant, orientation, page) for variant, orientation in arms],
+                                 footprint=footprint))
+    
+    results = [None] * len(arms)
+    calls = 0
+    ready = []
+    for i, ((variant, orientation), (image, error)) in enumerate(zip(arms, prepared)):
+        if image is None:
+            results[i] = failed_variant_result(variant, orientation, error)
+        else:
+            ready.append(i)
+    
+    if ready:
+        try:
+            words, calls = recognize_montage([prepared[i][0] for i in ready], lang, PROFILE["oem"])
+            print(f"Montáž {len(ready)} variant rozpoznána {calls}x voláním Tesseractu")
+            for i, variant_words in zip(ready, words):
+                results[i] = build_variant_result(*arms[i], variant_words)
+        except Exception as e:
+            for i in ready:
+                results[i] = failed_variant_result(*arms[i], e)
+    
+    return results, calls
 
 def post_process_text(text):
     """
@@ -332,152 +573,242 @@ def post_process_text(text):
     Returns:
         Vyčištěný a vylepšený text
     """
-    if not text:
-        return ""
-        
-    # Odstranění nadbytečných mezer
-    text = ' '.join(text.split())
+    return clean_text(text)
+
+def resolve_page_language(page, lang, user_id=None):
+    """
+    Rozlišení jazyka na jediný model místo kombinovaného ces+eng
     
-    # Import regex zde pro minimalizaci importů
-    import re
+    Args:
+        page: Artefakty stránky (viz artifact_cache.open_page)
+        lang: Požadovaný jazyk
+        user_id: Identifikátor uživatele pro cache jazyka (volitelné)
     
-    try:
-        # Nahrazení po sobě jdoucích speciálních znaků mezerami
-        text = re.sub(r'[^\w\s\.\,\?\!]{2,}', ' ', text)
-        
-        # Standardizace uvozovek a apostrofů
-        text = re.sub(r'[''`´]', "'", text)
-        text = re.sub(r'[""„]', '"', text)
-        
-        # Náhrada neobvyklých pomlček za standardní
-        text = re.sub(r'[–—−]', '-', text)
-        
-        # Odstranění znaků smetí z OCR
-        text = re.sub(r'[|]', 'I', text)  # Svislice často zaměněná za 'I'
-        text = re.sub(r'[\\\/]', '/', text)  # Standardizace lomítek
-        
-        # Oprava běžných chyb rozpoznávání
-        text = re.sub(r'0([A-Za-z])', 'O\\1', text)  # '0' často zaměněné za 'O' před písmenem
-        text = re.sub(r'([A-Za-z])0', '\\1O', text)  # '0' často zaměněné za 'O' po písmenu
-        text = re.sub(r'1([A-Za-z])', 'I\\1', text)  # '1' často zaměněné za 'I' před písmenem
-        
-        # Oprava velkých písmen na začátku vět
-        text = re.sub(r'([\.!?]\s+)([a-z])', lambda m: m.group(1) + m.group(2).upper(), text)
-        
-        # Speciální opravy pro české znaky
-        text = re.sub(r'c\s*v', 'č', text)  # 'c v' často zaměněné za 'č'
-        text = re.sub(r'e\s*s', 'ě', text)  # 'e s' často zaměněné za 'ě'
-        
-        # Oprava mezer kolem interpunkce
-        text = re.sub(r'\s+([,.!?:;])', '\\1', text)
-        text = re.sub(r'([,.!?:;])([A-Za-z0-9])', '\\1 \\2', text)
-        
-        # Odstranění osamocených písmen (kromě 'a', 'i', 'k', 's', 'v', 'z', 'A', 'I', 'K', 'O', 'S', 'V', 'Z')
-        text = re.sub(r'\s+([b-hj-uw-yB-HJ-NPQ-UW-Y])\s+', ' ', text)
-        
-        # Sloučení rozdělených slov (lze dále rozšířit pro běžné české prefixy a sufixy)
-        common_prefixes = ['ne', 'po', 'pro', 'pře', 'při', 'roz', 'vy', 'za']
-        for prefix in common_prefixes:
-            text = re.sub(f'\\b({prefix})\\s+', f'\\1', text, flags=re.IGNORECASE)
-        
-        return text
-        
-    except Exception as e:
-        print(f"Chyba při post-processingu textu: {str(e)}")
-        return text
+    Returns:
+        Jazyk pro Tesseract
+    """
+    # Vzorek se stejně zmenšuje, stačí pracovní obraz
+    sample_image = working_image(page) if lang == 'ces' else None
+    lang, language_source = resolve_language(sample_image, lang, user_id)
+    print(f"Rozpoznávám jazykem {lang} (zdroj: {language_source})")
+    return lang
 
-def recognize_text_parallel(image_path, lang='eng'):
+def recognize_text_parallel(image_path, lang='eng', user_id=None, executor=None, page=None):
     """
     Paralelní rozpoznávání textu z obrázku s více variantami předzpracování a orientacemi
     
     Args:
         image_path: Cesta k souboru s obrázkem
-        lang: Jazyk pro OCR
+        lang: Rozlišený jazyk pro OCR (viz resolve_page_language)
+        user_id: Identifikátor uživatele pro pořadí variant (volitelné)
+        executor: Sdílený pool procesů (v dávkovém režimu), jinak se vytvoří nový
+        page: Artefakty stránky (výchozí open_page(image_path))
     
     Returns:
-        Dictionary obsahující nejlepší výsledek, včetně textu a důvěryhodnosti
+        Tuple (text, důvěryhodnost, varianta, orientace, jazyk, počet průchodů Tesseractu,
+        slova vítězné kombinace jako WordTable nebo None)
     """
-    # Seznam variant předzpracování, které chceme vyzkoušet
-    # Vybíráme pouze nejlepší varianty pro úsporu času, jinak máme k dispozici 0-11
-    preprocessing_variants = [0, 2, 5, 7, 10]
+    # Artefakty předzpracování stránky - opakovaný pokus (jiný jazyk) je načte z cache
+    if page is None:
+        page = open_page(image_path)
+    
+    # Varianty předzpracování a orientace (stupně) podle profilu - výchozí profil
+    # zkouší jen nejlepší varianty 0, 2, 5, 7, 10 a orientace 0 a 270
+    preprocessing_variants = PROFILE["variants"]
+    orientations = PROFILE["orientations"]
+    
+    # Pořadí kombinací podle historie uživatele (případně zařízení z EXIF)
+    priors_key = user_id or device_fingerprint(image_path)
+    arms = [(variant, orientation)
+            for variant in preprocessing_variants
+            for orientation in orientations]
+    arms, established = plan_arms(priors_key, arms) if priors_key else (arms, False)
     
-    # Seznam orientací obrazu, které chceme vyzkoušet (stupně)
-    # Pro rukopis obvykle stačí 0 a 270 (aby se urychlilo zpracování)
-    orientations = [0, 270]  
+    # Zavedený uživatel nejprve zkusí jen svého favorita, ostatní kombinace
+    # se spustí až tehdy, když výsledek favorita nestačí
+    waves = [arms[:1], arms[1:]] if established else [arms]
     
-    # Vytvoření seznamu úloh pro paralelní zpracování
-    tasks = [(image_path, variant, orientation, lang) 
-             for variant in preprocessing_variants 
-             for orientation in orientations]
+    # Odhad paměti jedné úlohy pro paměťový rozpočet poolu
+    footprint = estimate_image_footprint(image_path, PROFILE["max_dimension"])
     
-    print(f"Paralelní zpracování {len(tasks)} kombinací variant a orientací")
+    # V režimu vláken varianty sdílí artefakty stránky - obraz se dekóduje
+    # nejvýše jednou, a jen pokud nějaká varianta v cache chybí
+    shared_page = page if EXECUTOR_MODE == 'thread' else None
     
     # Zpracování v paralelních procesech
     results = []
-    with ProcessPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        # Zpracování všech variant paralelně
-        for result in executor.map(process_image_variant, tasks):
-            results.append(result)
+    passes = 0
+    with contextlib.ExitStack() as stack:
+        owns_executor = executor is None
+        if owns_executor:
+            executor = stack.enter_context(create_executor())
+        for wave in waves:
+            if not wave:
+                continue
+            if EXECUTION_MODE == 'montage':
+                print(f"Montážní zpracování {len(wave)} kombinací variant a orientací")
+                wave_results, calls = process_variants_montage(image_path, wave, lang, executor, shared_page)
+                results.extend(wave_results)
+                passes += calls
+            else:
+                tasks = [(image_path, variant, orientation, lang, shared_page) for variant, orientation in wave]
+                print(f"Paralelní zpracování {len(tasks)} kombinací variant a orientací")
+                # Zpracování všech variant vlny paralelně
+                for result in executor.map(process_image_variant, tasks, footprint=footprint):
+                    results.append(result)
+                passes += len(tasks)
+            if established and max(r["quality_score"] for r in results) >= ACCEPT_SCORE:
+                print(f"Výsledek favorita uživatele přijat (skóre >= {ACCEPT_SCORE:.0f})")
+                break
+        if owns_executor:
+            print(executor.describe())
     
     # Najít nejlepší výsledek podle skóre kvality
     if not results:
-        return "", 0, 0, 0
+        return "", 0, 0, 0, lang, passes, None
     
     # Seřazení výsledků podle skóre kvality
     results.sort(key=lambda x: x["quality_score"], reverse=True)
     
+    # Zaznamenání vítěze pro příští stránky uživatele
+    if priors_key:
+        winner = results[0] if results[0]["quality_score"] > 0 else None
+        record_outcome(priors_key,
+                       [(r["variant"], r["orientation"]) for r in results],
+                       (winner["variant"], winner["orientation"]) if winner else None)
+    
     # Pokud máme více dobrých výsledků, můžeme je kombinovat
     good_results = [r for r in results if r["quality_score"] > 50]
     
     if len(good_results) > 1:
         print(f"Nalezeno {len(good_results)} dobrých výsledků s podobným skóre")
         
-        # Vypsat podrobnosti o nejlepších výsledcích
-        for i, result in enumerate(good_results[:3]):
+        # Vypsat podrobnosti o nejlepších výsledcích (kandidáti se čistí jedním voláním)
+        top_results = good_results[:3]
+        for i, (result, cleaned) in enumerate(zip(top_results, clean_texts(r["text"] for r in top_results))):
             print(f"Top {i+1}: Varianta {result['variant']}, Orientace {result['orientation']}, "
                   f"Skóre: {result['quality_score']:.2f}, Důvěra: {result['confidence']:.2f}")
-            print(f"   Text: {result['text'][:50]}...")
+            print(f"   Text: {cleaned[:50]}...")
     
     # Vrátit nejlepší výsledek
     best_result = results[0]
     best_text = post_process_text(best_result["text"])
     
-    return best_text, best_result["confidence"], best_result["variant"], best_result["orientation"]
+    return (best_text, best_result["confidence"], best_result["variant"], best_result["orientation"],
+            lang, passes, best_result.get("words"))
+
+def recognize_page(image_path, lang='eng', user_id=None, executor=None):
+    """
+    Rozpozná jednu stránku a vrátí výsledek ve formátu JSON výstupu
+    
+    Args:
+        image_path: Cesta k souboru s obrázkem
+        lang: Jazyk pro OCR
+        user_id: Identifikátor uživatele (volitelné)
+        executor: Sdílený pool procesů (volitelné)
+    
+    Returns:
+        Dictionary s výsledkem rozpoznávání
+    """
+    page_start = time.time()
+    page = open_page(image_path)
+    lang = resolve_page_language(page, lang, user_id)
+    
+    # Znovu vyfocená známá stránka - rozpoznají se jen změněné oblasti
+    # (jen pokud se rozpoznala stejným jazykem)
+    use_incremental = incremental_ocr.ENABLED and user_id
+    if use_incremental:
+        incremental = incremental_ocr.recognize_incremental(
+            image_path, user_id, PROFILE["max_dimension"], PROFILE["oem"], lang)
+        if incremental is not None:
+            words, entry, stats = incremental
+            print(f"Přírůstkové rozpoznání: {stats['regions']} změněných oblastí "
+                  f"({stats['changed_fraction']:.0%} stránky), převzato {stats['reused_words']} slov")
+            text = post_process_text(words.text())
+            return {
+                "success": bool(text),
+                "text": text,
+                "confidence": words.mean_confidence(),
+                "execution_time": time.time() - page_start,
+                "best_variant": int(entry.get("variant", 0)),
+                "best_orientation": 0,
+                "language": lang,
+                "tesseract_passes": stats["regions"],
+                "incremental": stats
+            }
+    
+    text, confidence, best_variant, best_orientation, language, passes, words = recognize_text_parallel(
+        image_path, lang, user_id, executor, page)
+    
+    # Zapamatování stránky pro příští nahrání (slova jsou v souřadnicích
+    # pracovního obrazu jen u neotočené stránky)
+    if use_incremental and words is not None and best_orientation == 0:
+        incremental_ocr.remember_page(image_path, user_id, words,
+                                      {"variant": int(best_variant), "language": language},
+                                      PROFILE["max_dimension"])
+    
+    return {
+        "success": bool(text),
+        "text": text,
+        "confidence": float(confidence),
+        "execution_time": time.time() - page_start,
+        "best_variant": int(best_variant),
+        "best_orientation": int(best_orientation),
+        "language": language,
+        "tesseract_passes": passes
+    }
+
+def run_batch_mode(argv):
+    """
+    Dávkový režim - všechny stránky sdílí jeden pool procesů
+    """
+    with contextlib.redirect_stdout(sys.stderr):
+        print_configuration()
+    
+    # Vlákna režimu 'thread' píší přes sys.stdout, které dávka přesměruje
+    # (viz ocr_batch.run_batch), pracovní procesy se přesměrují samy
+    with create_executor(batch=True) as executor:
+        def recognize(image_path, lang, user_id):
+            return recognize_page(image_path, lang, user_id, executor)
+        
+        status = batch_main(argv, recognize, "Dávkové rozpoznávání rukopisu (optimized_trocr)")
+        print(executor.describe(), file=sys.stderr)
+        return status
 
 def main():
     """
     Hlavní funkce pro zpracování obrázku z příkazové řádky
     """
     if len(sys.argv) < 2:
-        print("Použití: python optimized_trocr.py <cesta k obrázku> [jazyk]")
+        print("Použití: python optimized_trocr.py <cesta k obrázku> [jazyk] [uživatel]")
+        print("         python optimized_trocr.py --batch <vstup> [...] [--language jazyk] [--checkpoint soubor]")
         sys.exit(1)
     
+    if sys.argv[1] == '--batch':
+        sys.exit(run_batch_mode(sys.argv[2:]))
+    
+    print_configuration()
+    
     image_path = sys.argv[1]
     lang = sys.argv[2] if len(sys.argv) > 2 else 'eng'
+    user_id = sys.argv[3] if len(sys.argv) > 3 else None
     
     if not os.path.exists(image_path):
         print(f"Chyba: Soubor {image_path} neexistuje")
         sys.exit(1)
     
-    text, confidence, best_variant, best_orientation = recognize_text_parallel(image_path, lang)
+    result = recognize_page(image_path, lang, user_id)
     
+    # Celkový čas včetně importů a spuštění procesu
     execution_time = time.time() - start_time
-    
-    result = {
-        "success": bool(text),
-        "text": text,
-        "confidence": float(confidence),
-        "execution_time": execution_time,
-        "best_variant": int(best_variant),
-        "best_orientation": int(best_orientation)
-    }
+    result["execution_time"] = execution_time
     
     print(f"\nCelkový čas zpracování: {execution_time:.2f} sekund")
-    print(f"Nejlepší varianta: {best_variant}, Orientace: {best_orientation}")
-    print(f"Důvěryhodnost: {confidence:.2f}")
+    print(f"Nejlepší varianta: {result['best_variant']}, Orientace: {result['best_orientation']}")
+    print(f"Důvěryhodnost: {result['confidence']:.2f}")
     print("\nRozpoznaný text:")
     print("---------------")
-    print(text)
+    print(result["text"])
     print("---------------")
     
     # Výstup do JSON
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Pre-fork server pro produkční provoz Flask OCR služeb
+
+Vývojový server `app.run()` běží v jednom procesu a Tesseract volaný přes
+pytesseract tak vytěží jen tolik jader, kolik povolí GIL a fronta přijímání.
+Zde hlavní proces jednou načte importy (cv2, NumPy, PIL, Flask), profil
+a konfiguraci, otevře naslouchací socket a rozvětví (fork) N pracovníků,
+kteří socket sdílí a sami přijímají spojení. Načtené stránky paměti sdílí
+pracovníci s hlavním procesem copy-on-write - před forkem se proto objekty
+přesunou do permanentní generace garbage collectoru (`gc.freeze`), aby je
+sběr v pracovnících nezapisoval a stránky se nekopírovaly.
+
+Signály hlavního procesu:
+    SIGHUP          - řízený restart: zavolá se `on_reload` (např. nové
+                      načtení profilu), nastartuje nová generace pracovníků
+                      a stará dokončí rozpracované požadavky
+    SIGTERM/SIGINT  - řízené ukončení všech pracovníků
+
+Neočekávaně ukončený pracovník se nahradí novým.
+
+Profilování (`profile_workers`): pracovník, který přijal požadavek, zapíše
+okno do stavového adresáře hlavního procesu a pošle SIGUSR1 ostatním
+pracovníkům aktuální generace (seznam udržuje hlavní proces ve
+workers.json). Každý z nich vzorkuje stejně dlouhé okno a zapíše výsledek
+do souboru, žadatel výsledky sloučí s vlastním profilem.
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import glob
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+from werkzeug.serving import make_server
+from sampling_profiler import Profile, ProfilerBusy, parse_seconds, run_profile
+
+# Počet pracovních procesů (0 = vývojový server v jednom procesu)
+PREFORK_WORKERS = int(os.environ.get('OCR_PREFORK_WORKERS', 0))
+
+# Jak dlouho pracovník dokončuje rozpracované požadavky po SIGTERM (sekundy)
+GRACEFUL_TIMEOUT = float(os.environ.get('OCR_PREFORK_GRACEFUL_TIMEOUT', 30))
+
+# Délka fronty nepřijatých spojení naslouchacího socketu
+LISTEN_BACKLOG = int(os.environ.get('OCR_PREFORK_BACKLOG', 128))
+
+# Pracovník ukončený dřív než za tuto dobu se nahradí se zpožděním (ochrana proti cyklu pádů)
+MIN_WORKER_LIFETIME = 2.0
+RESPAWN_DELAY = 1.0
+
+# Interval kontroly ukončených pracovníků v hlavním procesu (sekundy)
+POLL_INTERVAL = 0.5
+
+# Stavový adresář pro koordinaci profilování (podadresář podle pid hlavního procesu)
+STATE_DIR = os.environ.get(
+    'OCR_PREFORK_STATE_DIR',
+    os.path.join(tempfile.gettempdir(), 'welldiary-ocr', 'prefork')
+)
+
+# Rezerva na zápis profilů ostatních pracovníků po konci okna (sekundy)
+PROFILE_COLLECT_GRACE = 5.0
+
+# Pid hlavního procesu v pracovníkovi (None mimo pre-fork server)
+_master_pid = None
+_answered_lock = threading.Lock()
+_answered = set()
+
+
+class InFlightRequests:
+    """
+    WSGI obal počítající rozpracované požadavky pracovníka
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._active = 0
+        self._cond = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        with self._cond:
+            self._active += 1
+        try:
+            # Odpovědi OCR jsou malé JSON dokumenty - tělo se dočte ještě uvnitř počítání
+            result = self.app(environ, start_response)
+            try:
+                return list(result)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def wait_idle(self, timeout):
+        """
+        Počká na dokončení rozpracovaných požadavků
+
+        Returns:
+            True, pokud žádný požadavek neběží
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._active == 0, timeout)
+
+
+def freeze_shared_state():
+    """
+    Uklidí a zmrazí objekty hlavního procesu před forkem (copy-on-write)
+    """
+    gc.collect()
+    if hasattr(gc, 'freeze'):
+        gc.freeze()
+
+
+def warm_files(paths):
+    """
+    Načte soubory (např. traineddata) do page cache, kterou sdílí všechny procesy
+
+    Tesseract běží jako podproces pracovníka, jeho modely proto nejde sdílet
+    jako objekty Pythonu - sdílená page cache ale ušetří čtení z disku při
+    prvních požadavcích každého pracovníka.
+    """
+    warmed = 0
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            else:
+                while os.read(fd, 1 << 20):
+                    pass
+            warmed += 1
+        finally:
+            os.close(fd)
+    return warmed
+
+
+def _state_dir(master_pid):
+    return os.path.join(STATE_DIR, str(master_pid))
+
+
+def _write_json(path, data):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _answer_profile_requests():
+    """
+    Vzorkuje okna vyžádaná jiným pracovníkem (vlákno spuštěné po SIGUSR1)
+    """
+    directory = _state_dir(_master_pid)
+    pid = os.getpid()
+    for path in glob.glob(os.path.join(directory, 'request-*.json')):
+        request = _read_json(path)
+        if request is None or pid not in request["workers"]:
+            continue
+        with _answered_lock:
+            if request["id"] in _answered:
+                continue
+            _answered.add(request["id"])
+        try:
+            state = run_profile(request["seconds"], request["interval"]).to_state()
+        except ProfilerBusy as e:
+            state = {"error": str(e)}
+        try:
+            _write_json(os.path.join(directory, f"result-{request['id']}-{pid}.json"), state)
+        except OSError as e:
+            print(f"Varování: Nelze zapsat profil pracovníka {pid}: {str(e)}", file=sys.stderr)
+
+
+def profile_workers(seconds=None, interval=None):
+    """
+    Profil všech pracovníků pre-fork serveru (mimo něj jen vlastního procesu)
+
+    Returns:
+        Tuple (sloučený Profile, {"workers": počet, "pids": profilované, "missing": bez výsledku})
+
+    Raises:
+        ProfilerBusy: Pokud profilování v tomto procesu už běží
+    """
+    pid = os.getpid()
+    if _master_pid is None:
+        return run_profile(seconds, interval), {"workers": 1, "pids": [pid], "missing": []}
+
+    directory = _state_dir(_master_pid)
+    siblings = [worker for worker in (_read_json(os.path.join(directory, 'workers.json')) or [])
+                if worker != pid]
+    request_id = f"{pid}-{time.time_ns()}"
+    request_path = os.path.join(directory, f"request-{request_id}.json")
+    try:
+        _write_json(request_path, {"id": request_id, "seconds": parse_seconds(seconds),
+                                   "interval": interval, "workers": siblings})
+    except OSError as e:
+        print(f"Varování: Profil ostatních pracovníků nelze vyžádat: {str(e)}", file=sys.stderr)
+        siblings = []
+    for worker in siblings:
+        try:
+            os.kill(worker, signal.SIGUSR1)
+        except ProcessLookupError:
+            pass
+
+    try:
+        profiles = [run_profile(seconds, interval)]
+        pids, pending = [pid], set(siblings)
+        deadline = time.monotonic() + PROFILE_COLLECT_GRACE
+        while pending and time.monotonic() < deadline:
+            for worker in list(pending):
+                state = _read_json(os.path.join(directory, f"result-{request_id}-{worker}.json"))
+                if state is None:
+                    continue
+                pending.discard(worker)
+                if "error" not in state:
+                    profiles.append(Profile.from_state(state))
+                    pids.append(worker)
+            if pending:
+                time.sleep(0.05)
+    finally:
+        for path in [request_path] + glob.glob(os.path.join(directory, f"result-{request_id}-*.json")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    missing = [worker for worker in siblings if worker not in pids]
+    return Profile.merge(profiles), {"workers": len(siblings) + 1, "pids": pids, "missing": missing}
+
+
+def _serve_worker(app, listener, host, port):
+    """
+    Smyčka pracovníka - obsluhuje spojení ze sdíleného socketu až do SIGTERM
+    """
+    global _master_pid
+    _master_pid = os.getppid()
+    tracked = InFlightRequests(app)
+    server = make_server(host, port, tracked, threaded=True, fd=listener.fileno())
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        # shutdown() čeká na konec serve_forever, nesmí běžet v jeho vlákně
+        if not stopping.is_set():
+            stopping.set()
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    # Vzorkování běží mimo obsluhu signálu, aby neblokovalo přijímání spojení
+    signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(
+        target=_answer_profile_requests, daemon=True).start())
+
+    server.serve_forever()
+    if not tracked.wait_idle(GRACEFUL_TIMEOUT):
+        print(f"Varování: Pracovník {os.getpid()} ukončen s rozpracovanými požadavky", file=sys.stderr)
+    server.server_close()
+
+
+class PreforkServer:
+    """
+    Hlavní proces - drží socket a udržuje zadaný počet pracovníků
+    """
+
+    def __init__(self, app, host, port, workers, on_reload=None):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = max(1, workers)
+        self.on_reload = on_reload
+        self.generation = 0
+        self._children = {}
+        self._stopping = False
+        self._reload_requested = False
+
+    def _spawn(self):
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                _serve_worker(self.app, self.listener, self.host, self.port)
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                status = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(status)
+        self._children[pid] = (self.generation, time.monotonic())
+        self._write_workers()
+        return pid
+
+    def _write_workers(self):
+        # Pracovníci aktuální generace pro profilování napříč pracovníky
+        workers = [pid for pid, (generation, _) in self._children.items() if generation == self.generation]
+        try:
+            os.makedirs(_state_dir(os.getpid()), exist_ok=True)
+            _write_json(os.path.join(_state_dir(os.getpid()), 'workers.json'), workers)
+        except OSError as e:
+            print(f"Varování: Nelze zapsat seznam pracovníků: {str(e)}", file=sys.stderr)
+
+    def _signal(self, pids, signum):
+        for pid in pids:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self):
+        """
+        Vyzvedne ukončené pracovníky a nahradí ty z aktuální generace
+        """
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generation, started = self._children.pop(pid, (None, 0))
+            if self._stopping or generation != self.generation:
+                continue
+            self._write_workers()
+            code = os.waitstatus_to_exitcode(status) if hasattr(os, 'waitstatus_to_exitcode') else status
+            print(f"Varování: Pracovník {pid} skončil (kód {code}), spouštím náhradu", file=sys.stderr)
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(RESPAWN_DELAY)
+            self._spawn()
+
+    def _reload(self):
+        """
+        Řízený restart - nová generace převezme socket, stará doběhne
+        """
+        self._reload_requested = False
+        if self.on_reload is not None:
+            try:
+                self.on_reload()
+            except Exception as e:
+                print(f"Varování: Nové načtení konfigurace selhalo: {str(e)}", file=sys.stderr)
+        freeze_shared_state()
+
+        old = [pid for pid, (generation, _) in self._children.items() if generation == self.generation]
+        self.generation += 1
+        for _ in range(self.workers):
+            self._spawn()
+        self._signal(old, signal.SIGTERM)
+        print(f"Restart pracovníků (generace {self.generation}): {self.workers} nových, "
+              f"{len(old)} dokončuje požadavky", file=sys.stderr)
+
+    def _shutdown(self):
+        self._signal(list(self._children), signal.SIGTERM)
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT + 5
+        while self._children and time.monotonic() < deadline:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self._children.pop(pid, None)
+            else:
+                time.sleep(0.1)
+        self._signal(list(self._children), signal.SIGKILL)
+        self.listener.close()
+        shutil.rmtree(_state_dir(os.getpid()), ignore_errors=True)
+
+    def run(self):
+        """
+        Otevře socket, rozvětví pracovníky a obsluhuje signály až do ukončení
+        """
+        self.listener = socket.create_server((self.host, self.port), backlog=LISTEN_BACKLOG)
+        freeze_shared_state()
+
+        def request_stop(signum, frame):
+            self._stopping = True
+
+        def request_reload(signum, frame):
+            self._reload_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_reload)
+        # Pracovník si obsluhu SIGUSR1 nastaví až po forku - do té doby signál ignoruje
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
+        for _ in range(self.workers):
+            self._spawn()
+        print(f"Pre-fork server na http://{self.host}:{self.port} - {self.workers} pracovníků "
+              f"(hlavní proces {os.getpid()})", file=sys.stderr)
+
+        try:
+            while not self._stopping:
+                if self._reload_requested:
+                    self._reload()
+                self._reap()
+                time.sleep(POLL_INTERVAL)
+        finally:
+            self._shutdown()
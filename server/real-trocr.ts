@@ -28,27 +28,48 @@ interface OCRResult {
 let serverProcess: any = null;
 
 /**
- * Spustí TrOCR Python server, pokud ještě neběží
+ * Počká, až server načte a zahřeje model (/ready vrací 503 během načítání)
+ */
+async function waitUntilReady(): Promise<boolean> {
+  for (let i = 0; i < 30; i++) {
+    try {
+      const response = await fetch(`${TROCR_SERVER_URL}/ready`, { timeout: 2000 });
+      if (response.ok) {
+        return true;
+      }
+    } catch (error) {
+      // Server ještě nenaslouchá
+    }
+    // Zkusit znovu po krátké pauze
+    await new Promise(resolve => setTimeout(resolve, 2000));
+  }
+  return false;
+}
+
+/**
+ * Spustí TrOCR Python server, pokud ještě neběží, a počká na načtení modelu
  */
 async function ensureServerRunning(): Promise<boolean> {
+  // Proces už běží (spustil ho souběžný požadavek) - model ale ještě nemusí být načtený
   if (serverProcess) {
-    return true;
+    return waitUntilReady();
   }
   
-  console.log('Spouštím TrOCR Python server...');
-  
   try {
-    // Zkontrolujte, zda server už běží
+    // Zkontrolujte, zda server už běží - /health odpovídá hned po startu
+    // procesu, ještě během načítání modelu, proto se dál čeká na /ready
     try {
       const response = await fetch(`${TROCR_SERVER_URL}/health`, { timeout: 1000 });
       if (response.ok) {
-        console.log('TrOCR server už běží');
-        return true;
+        console.log('TrOCR server už běží, čekám na připravenost modelu');
+        return waitUntilReady();
       }
     } catch (error) {
       // Server není spuštěn, budeme ho muset spustit
     }
     
+    console.log('Spouštím TrOCR Python server...');
+    
     // Cesta k Python skriptu
     const scriptPath = path.join(process.cwd(), 'server', 'trocr_server.py');
     
@@ -87,18 +108,10 @@ async function ensureServerRunning(): Promise<boolean> {
       serverProcess = null;
     });
     
-    // Počkejte, až server začne reagovat
-    for (let i = 0; i < 10; i++) {
-      try {
-        const response = await fetch(`${TROCR_SERVER_URL}/health`, { timeout: 2000 });
-        if (response.ok) {
-          console.log('TrOCR server úspěšně spuštěn');
-          return true;
-        }
-      } catch (error) {
-        // Zkusit znovu po krátké pauze
-        await new Promise(resolve => setTimeout(resolve, 2000));
-      }
+    // Počkejte, až server načte a zahřeje model
+    if (await waitUntilReady()) {
+      console.log('TrOCR server úspěšně spuštěn');
+      return true;
     }
     
     console.error('Nepodařilo se spustit TrOCR server');
@@ -8,26 +8,19 @@ import sys
 import os
 import json
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageEnhance, ImageFilter
+from language_detection import resolve_language
+from text_postprocess import normalize_whitespace
+from ocr_batch import batch_main
+from resource_budget import cpu_budget
+from tesseract_batch import DEFAULT_CHUNK_SIZE, create_work_dir, remove_work_dir, run_tesseract_list, chunked
 
-# Kontrola vstupních parametrů
-if len(sys.argv) < 2:
-    print("Použití: python real_trocr.py <cesta_k_obrazku> [jazyk]")
-    sys.exit(1)
-
-# Získání vstupních parametrů
-image_path = sys.argv[1]
-language = sys.argv[2] if len(sys.argv) > 2 else 'eng'
-
-# Kontrola existence souboru
-if not os.path.exists(image_path):
-    result = {
-        "success": False,
-        "text": "",
-        "error": f"Soubor {image_path} nebyl nalezen"
-    }
-    print(json.dumps(result))
-    sys.exit(1)
+# Parametry Tesseractu pro tento engine
+TESSERACT_ARGS = ["--psm", "6", "--oem", "1"]
+
+# Počet vláken pro paralelní předzpracování v dávkovém režimu
+PREPROCESS_WORKERS = cpu_budget('real_trocr')
 
 def preprocess_image(image_path, output_path):
     """
@@ -36,84 +29,216 @@ def preprocess_image(image_path, output_path):
     try:
         # Otevření obrazu
         img = Image.open(image_path)
-        
+
         # Převod na stupně šedi
         img = img.convert('L')
-        
+
         # Zvýšení kontrastu
         enhancer = ImageEnhance.Contrast(img)
         img = enhancer.enhance(2.0)
-        
+
         # Zvýšení ostrosti
         enhancer = ImageEnhance.Sharpness(img)
         img = enhancer.enhance(1.5)
-        
+
         # Aplikace filtru pro odstranění šumu
         img = img.filter(ImageFilter.MedianFilter(size=3))
-        
+
         # Uložení předzpracovaného obrazu
         img.save(output_path)
         return True
-        
+
     except Exception as e:
         print(f"Chyba při předzpracování obrazu: {str(e)}", file=sys.stderr)
         return False
 
-try:
-    # Vytvoření dočasného souboru pro předzpracovaný obraz
-    output_path = image_path + "_processed.png"
-    
-    # Předzpracování obrazu
-    if not preprocess_image(image_path, output_path):
-        result = {
+def build_result(returncode, stdout, stderr, lang_param):
+    """
+    Sestaví výsledek z výstupu Tesseractu
+    """
+    # Kontrola chyb
+    if returncode != 0:
+        return {
             "success": False,
             "text": "",
-            "error": "Chyba při předzpracování obrazu"
+            "error": f"Tesseract vrátil chybu: {stderr}"
         }
-        print(json.dumps(result))
-        sys.exit(1)
-    
-    # Pro české texty přidat i podporu angličtiny jako zálohu
-    lang_param = f"{language}+eng" if language == 'ces' else language
-    
-    # Spuštění tesseract s optimalizovanými parametry
-    cmd = ["tesseract", output_path, "stdout", "-l", lang_param, "--psm", "6", "--oem", "1"]
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    stdout, stderr = process.communicate()
-    
-    # Odstranění dočasného souboru
+
+    # Zpracování výstupu
+    text = stdout.strip()
+
+    # Postprocessing textu
+    # Odstranění zbytečných zalomení řádků a mezer
+    text = normalize_whitespace(text)
+
+    return {
+        "success": True,
+        "text": text,
+        "confidence": 0.85,  # Přibližná hodnota důvěryhodnosti
+        "language": lang_param
+    }
+
+def recognize_image(image_path, language='eng', user_id=None):
+    """
+    Rozpozná text jednoho obrázku
+
+    Args:
+        image_path: Cesta k souboru s obrázkem
+        language: Jazyk pro OCR
+        user_id: Identifikátor uživatele pro cache zvoleného jazyka (volitelné)
+
+    Returns:
+        Dictionary s výsledkem rozpoznávání
+    """
+    # Kontrola existence souboru
+    if not os.path.exists(image_path):
+        return {
+            "success": False,
+            "text": "",
+            "error": f"Soubor {image_path} nebyl nalezen"
+        }
+
     try:
-        os.remove(output_path)
-    except:
-        pass
-    
-    # Kontrola chyb
-    if process.returncode != 0:
+        # Vytvoření dočasného souboru pro předzpracovaný obraz
+        output_path = image_path + "_processed.png"
+
+        # Předzpracování obrazu
+        if not preprocess_image(image_path, output_path):
+            return {
+                "success": False,
+                "text": "",
+                "error": "Chyba při předzpracování obrazu"
+            }
+
+        # Rozlišení jazyka na jediný model místo kombinovaného ces+eng
+        with Image.open(output_path) as sample_image:
+            lang_param, _ = resolve_language(sample_image, language, user_id)
+
+        # Spuštění tesseract s optimalizovanými parametry
+        cmd = ["tesseract", output_path, "stdout", "-l", lang_param, *TESSERACT_ARGS]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+
+        # Odstranění dočasného souboru
+        try:
+            os.remove(output_path)
+        except:
+            pass
+
+        result = build_result(process.returncode,
+                              stdout.decode('utf-8', errors='replace'),
+                              stderr.decode('utf-8', errors='replace'),
+                              lang_param)
+
+    except Exception as e:
         result = {
             "success": False,
             "text": "",
-            "error": f"Tesseract vrátil chybu: {stderr.decode('utf-8', errors='replace')}"
+            "error": f"Zpracování selhalo: {str(e)}"
         }
-    else:
-        # Zpracování výstupu
-        text = stdout.decode('utf-8', errors='replace').strip()
-        
-        # Postprocessing textu
-        # Odstranění zbytečných zalomení řádků a mezer
-        text = ' '.join([line.strip() for line in text.splitlines() if line.strip()])
-        
+
+    return result
+
+def recognize_images(image_paths, language='eng', user_id=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Rozpozná více obrázků najednou
+
+    Obrázky se předzpracují paralelně do pracovního adresáře na tmpfs
+    a Tesseract se spustí jednou na každý blok `chunk_size` obrázků.
+
+    Args:
+        image_paths: Seznam cest k obrázkům
+        language: Jazyk pro OCR
+        user_id: Identifikátor uživatele pro cache zvoleného jazyka (volitelné)
+        chunk_size: Počet obrázků na jedno spuštění Tesseractu
+
+    Returns:
+        Seznam výsledků ve stejném pořadí jako `image_paths`
+    """
+    results = [None] * len(image_paths)
+    work_dir = create_work_dir()
+
+    try:
+        jobs = []
+        for i, image_path in enumerate(image_paths):
+            if not os.path.exists(image_path):
+                results[i] = {
+                    "success": False,
+                    "text": "",
+                    "error": f"Soubor {image_path} nebyl nalezen"
+                }
+            else:
+                jobs.append((i, os.path.join(work_dir, f"page_{i}.png")))
+
+        # Paralelní předzpracování (PIL filtry uvolňují GIL)
+        with ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS) as executor:
+            preprocessed = list(executor.map(
+                lambda job: preprocess_image(image_paths[job[0]], job[1]), jobs))
+
+        ready = []
+        for job, success in zip(jobs, preprocessed):
+            if success:
+                ready.append(job)
+            else:
+                results[job[0]] = {
+                    "success": False,
+                    "text": "",
+                    "error": "Chyba při předzpracování obrazu"
+                }
+
+        if ready:
+            # Jazyk se rozliší jednou pro celou dávku
+            with Image.open(ready[0][1]) as sample_image:
+                lang_param, _ = resolve_language(sample_image, language, user_id)
+
+            for chunk in chunked(ready, chunk_size):
+                outputs = run_tesseract_list([path for _, path in chunk], lang_param, TESSERACT_ARGS, work_dir)
+                for (i, _), (returncode, stdout, stderr) in zip(chunk, outputs):
+                    results[i] = build_result(returncode, stdout, stderr, lang_param)
+
+    except Exception as e:
+        for i, result in enumerate(results):
+            if result is None:
+                results[i] = {
+                    "success": False,
+                    "text": "",
+                    "error": f"Zpracování selhalo: {str(e)}"
+                }
+    finally:
+        remove_work_dir(work_dir)
+
+    return results
+
+def main():
+    # Kontrola vstupních parametrů
+    if len(sys.argv) < 2:
+        print("Použití: python real_trocr.py <cesta_k_obrazku> [jazyk] [uzivatel]")
+        print("         python real_trocr.py --batch <vstup> [...] [--language jazyk] [--checkpoint soubor]")
+        sys.exit(1)
+
+    if sys.argv[1] == '--batch':
+        sys.exit(batch_main(sys.argv[2:], recognize_image, "Dávkové rozpoznávání textu (real_trocr)",
+                            recognize_pages=recognize_images))
+
+    # Získání vstupních parametrů
+    image_path = sys.argv[1]
+    language = sys.argv[2] if len(sys.argv) > 2 else 'eng'
+    user_id = sys.argv[3] if len(sys.argv) > 3 else None
+
+    # Kontrola existence souboru
+    if not os.path.exists(image_path):
         result = {
-            "success": True,
-            "text": text,
-            "confidence": 0.85  # Přibližná hodnota důvěryhodnosti
+            "success": False,
+            "text": "",
+            "error": f"Soubor {image_path} nebyl nalezen"
         }
-    
-except Exception as e:
-    result = {
-        "success": False,
-        "text": "",
-        "error": f"Zpracování selhalo: {str(e)}"
-    }
+        print(json.dumps(result))
+        sys.exit(1)
+
+    result = recognize_image(image_path, language, user_id)
+
+    # Vrácení výsledku jako JSON
+    print(json.dumps(result))
 
-# Vrácení výsledku jako JSON
-print(json.dumps(result))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
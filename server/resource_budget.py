@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Rozpočet CPU pro OCR enginy
+
+`cpu_count()` vrací počet jader hostitele, ne počet jader, která smí
+proces skutečně použít. V kontejneru s omezenou kvótou (cgroup) nebo
+s omezenou afinitou tak pool procesů, OpenMP vlákna Tesseractu a vlákna
+torch dohromady mnohonásobně převyšují dostupná jádra. Tento modul zjistí
+skutečně dostupná jádra (afinita, kvóta cgroup v2 i v1), rozdělí je mezi
+enginy běžící na stejném stroji a nastaví limity vláken tak, aby celkový
+počet vláken odpovídal rozpočtu. Obdobně určuje paměťový rozpočet z limitu
+cgroup a dostupné paměti (viz worker_pool.py).
+"""
+
+import os
+import sys
+import math
+
+# Ruční přepsání počtu dostupných jader
+CPU_BUDGET_OVERRIDE = os.environ.get('OCR_CPU_BUDGET')
+
+# Výchozí podíl jader pro jeden engine (pro enginy sdílející stroj,
+# přepisuje se per engine proměnnou OCR_CPU_SHARE_<ENGINE>)
+DEFAULT_CPU_SHARE = float(os.environ.get('OCR_CPU_SHARE', 1.0))
+
+# Proměnné prostředí omezující vlákna nativních knihoven (dědí je i podprocesy Tesseractu)
+THREAD_LIMIT_VARIABLES = ('OMP_THREAD_LIMIT', 'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS')
+
+CGROUP_V2_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_V1_QUOTA = '/sys/fs/cgroup/cpu/cpu.cfs_quota_us'
+CGROUP_V1_PERIOD = '/sys/fs/cgroup/cpu/cpu.cfs_period_us'
+CGROUP_V2_MEMORY_MAX = '/sys/fs/cgroup/memory.max'
+CGROUP_V1_MEMORY_LIMIT = '/sys/fs/cgroup/memory/memory.limit_in_bytes'
+PROC_MEMINFO = '/proc/meminfo'
+
+# Ruční přepsání paměťového rozpočtu (MB)
+MEMORY_BUDGET_OVERRIDE = os.environ.get('OCR_MEMORY_BUDGET_MB')
+
+# Podíl dostupné paměti, který smí enginy použít (zbytek je rezerva pro systém)
+MEMORY_SHARE = float(os.environ.get('OCR_MEMORY_SHARE', 0.8))
+
+# Limity cgroup v1 bez omezení jsou "nekonečno" zaokrouhlené na stránky
+_UNLIMITED_BYTES = 1 << 60
+
+
+def _read_first_line(path):
+    try:
+        with open(path, 'r') as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_limit():
+    """
+    Kvóta CPU z cgroup (v2 cpu.max nebo v1 cfs_quota_us / cfs_period_us)
+
+    Returns:
+        Počet jader jako desetinné číslo nebo None, pokud kvóta není nastavena
+    """
+    line = _read_first_line(CGROUP_V2_CPU_MAX)
+    if line:
+        parts = line.split()
+        if parts[0] != 'max' and len(parts) == 2:
+            try:
+                return int(parts[0]) / int(parts[1])
+            except (ValueError, ZeroDivisionError):
+                pass
+        return None
+
+    quota = _read_first_line(CGROUP_V1_QUOTA)
+    period = _read_first_line(CGROUP_V1_PERIOD)
+    try:
+        if quota and period and int(quota) > 0:
+            return int(quota) / int(period)
+    except (ValueError, ZeroDivisionError):
+        pass
+    return None
+
+
+def affinity_cpu_count():
+    """
+    Počet jader, na kterých smí proces běžet (afinita)
+    """
+    try:
+        return len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return os.cpu_count() or 1
+
+
+def available_cpus():
+    """
+    Počet jader, která má proces skutečně k dispozici
+    """
+    if CPU_BUDGET_OVERRIDE:
+        return max(1, int(CPU_BUDGET_OVERRIDE))
+
+    cpus = affinity_cpu_count()
+    quota = cgroup_cpu_limit()
+    if quota is not None:
+        # Částečné jádro kvóty se zaokrouhluje nahoru - vlákno by jinak zbytečně čekalo
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+
+def cpu_budget(engine=None):
+    """
+    Počet jader přidělených enginu
+
+    Args:
+        engine: Jméno enginu (např. 'optimized_trocr', 'kraken', 'trocr') - podíl
+                se čte z OCR_CPU_SHARE_<ENGINE>, jinak z OCR_CPU_SHARE
+
+    Returns:
+        Počet jader (alespoň 1)
+    """
+    share = DEFAULT_CPU_SHARE
+    if engine:
+        share = float(os.environ.get(f'OCR_CPU_SHARE_{engine.upper()}', share))
+    return max(1, int(available_cpus() * share))
+
+
+def plan_pool(engine=None, threads_per_worker=1):
+    """
+    Velikost poolu tak, aby pracovníci krát vlákna nepřesáhli rozpočet
+
+    Returns:
+        Tuple (počet pracovníků, vláken na pracovníka)
+    """
+    budget = cpu_budget(engine)
+    threads_per_worker = max(1, min(threads_per_worker, budget))
+    return max(1, budget // threads_per_worker), threads_per_worker
+
+
+def apply_thread_limits(threads):
+    """
+    Omezí vlákna nativních knihoven v aktuálním procesu a jeho podprocesech
+    """
+    for name in THREAD_LIMIT_VARIABLES:
+        os.environ[name] = str(threads)
+
+    # OpenCV má vlastní pool vláken
+    cv2 = sys.modules.get('cv2')
+    if cv2 is not None:
+        cv2.setNumThreads(threads)
+
+
+def init_worker(threads=1):
+    """
+    Inicializace pracovního procesu poolu (initializer pro ProcessPoolExecutor)
+    """
+    apply_thread_limits(threads)
+
+
+def configure_torch(threads):
+    """
+    Nastaví počet vláken torch (intra-op podle rozpočtu, inter-op jedno)
+    """
+    import torch
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Inter-op vlákna lze nastavit jen před první paralelní operací
+        pass
+
+
+def cgroup_memory_limit():
+    """
+    Paměťový limit z cgroup (v2 memory.max nebo v1 memory.limit_in_bytes)
+
+    Returns:
+        Limit v bajtech nebo None, pokud limit není nastaven
+    """
+    for path in (CGROUP_V2_MEMORY_MAX, CGROUP_V1_MEMORY_LIMIT):
+        line = _read_first_line(path)
+        if line and line != 'max':
+            try:
+                limit = int(line)
+            except ValueError:
+                continue
+            return limit if limit < _UNLIMITED_BYTES else None
+    return None
+
+
+def available_memory():
+    """
+    Paměť dostupná procesu v bajtech (MemAvailable omezená limitem cgroup)
+    """
+    available = None
+    try:
+        with open(PROC_MEMINFO, 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError):
+        pass
+
+    limit = cgroup_memory_limit()
+    if limit is not None:
+        available = limit if available is None else min(available, limit)
+    return available
+
+
+def memory_budget(engine=None):
+    """
+    Paměťový rozpočet enginu v bajtech
+
+    Args:
+        engine: Jméno enginu - podíl se čte z OCR_MEMORY_SHARE_<ENGINE>, jinak z OCR_MEMORY_SHARE
+
+    Returns:
+        Rozpočet v bajtech nebo None, pokud dostupnou paměť nelze zjistit
+    """
+    if MEMORY_BUDGET_OVERRIDE:
+        return int(float(MEMORY_BUDGET_OVERRIDE) * 1024 * 1024)
+
+    available = available_memory()
+    if available is None:
+        return None
+    share = MEMORY_SHARE
+    if engine:
+        share = float(os.environ.get(f'OCR_MEMORY_SHARE_{engine.upper()}', share))
+    return int(available * share)
+
+
+def describe_budget(engine=None):
+    """
+    Přehled rozpočtu pro diagnostické endpointy
+    """
+    return {
+        "affinity_cpus": affinity_cpu_count(),
+        "cgroup_cpu_limit": cgroup_cpu_limit(),
+        "available_cpus": available_cpus(),
+        "engine_budget": cpu_budget(engine),
+        "omp_thread_limit": os.environ.get('OMP_THREAD_LIMIT'),
+        "memory_budget": memory_budget(engine),
+    }
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Vzorkovací profiler běžících OCR serverů
+
+Při výkyvech latence v produkci je jediným vhledem do serverů výstup
+`print`. Profiler po zadanou dobu periodicky čte zásobníky všech vláken
+procesu (`sys._current_frames`), bez instrumentace kódu a bez restartu pod
+profilerem. Každý vzorek se zařadí do kategorie (dekódování, předzpracování,
+čekání na Tesseract, průchod modelem, serializace JSON, čekání ve frontě,
+nečinnost, ostatní) a výsledek se vrací ve formátu collapsed stacks
+(`kategorie;rámec;...;rámec počet`), který přímo zpracuje flamegraph.pl
+nebo speedscope.
+
+Čas podprocesů (Tesseract) se ve vláknech projeví jako čekání v kategorii
+`tesseract`, jejich spotřebované CPU se navíc hlásí z `os.times()`.
+"""
+
+import os
+import sys
+import hmac
+import time
+import ipaddress
+import threading
+import functools
+from collections import Counter
+
+# Výchozí interval vzorkování (sekundy)
+SAMPLE_INTERVAL = float(os.environ.get('OCR_PROFILER_INTERVAL', 0.005))
+
+# Nejdelší povolené okno profilování (sekundy)
+MAX_SECONDS = float(os.environ.get('OCR_PROFILER_MAX_SECONDS', 60))
+
+# Výchozí okno profilování (sekundy)
+DEFAULT_SECONDS = 10.0
+
+# Token pro přístup z jiných strojů - bez tokenu je endpoint dostupný jen lokálně
+DEBUG_TOKEN = os.environ.get('OCR_DEBUG_TOKEN', '')
+
+# Maximální hloubka zaznamenaného zásobníku
+MAX_DEPTH = 128
+
+CATEGORY_DECODE = 'decode'
+CATEGORY_PREPROCESS = 'preprocess'
+CATEGORY_TESSERACT = 'tesseract'
+CATEGORY_MODEL = 'model'
+CATEGORY_JSON = 'json'
+CATEGORY_QUEUE = 'queue'
+CATEGORY_IDLE = 'idle'
+CATEGORY_OTHER = 'other'
+
+# Funkce, ve kterých vlákno jen čeká na práci nebo spojení (testují se na listu zásobníku)
+_IDLE_FUNCTIONS = {
+    'wait', 'select', 'poll', 'accept', 'get', 'serve_forever', '_wait_for_tstate_lock',
+    'acquire', 'sleep', 'readinto', 'recv', 'recv_into',
+}
+_IDLE_MODULES = ('threading', 'selectors', 'socket', 'queue', 'socketserver')
+
+# Názvy funkcí předzpracování napříč enginy
+_PREPROCESS_FUNCTIONS = {
+    'orient_image', 'prepare_variant_image', 'build_montages', 'select_variants',
+    'load_variant_image', 'working_image',
+}
+
+_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """
+    Profilování už běží - souběžná okna by se navzájem zkreslovala
+    """
+
+
+def _module_name(code):
+    if code.co_filename.startswith('<'):
+        # Zmrazené moduly a dynamicky vytvořený kód ("<frozen importlib._bootstrap>")
+        return code.co_filename.strip('<>')
+    return os.path.splitext(os.path.basename(code.co_filename))[0]
+
+
+@functools.lru_cache(maxsize=4096)
+def _frame_label(code):
+    name = getattr(code, 'co_qualname', code.co_name)
+    return f"{_module_name(code)}:{name}"
+
+
+@functools.lru_cache(maxsize=4096)
+def classify_frame(code):
+    """
+    Kategorie jednoho rámce nebo None, pokud rámec kategorii neurčuje
+    """
+    path = code.co_filename.replace('\\', '/')
+    name = code.co_name
+
+    if _module_name(code) == 'admission':
+        return CATEGORY_QUEUE
+    if '/pytesseract/' in path or name in ('image_to_words', 'recognize_montage', 'recognize_attempt'):
+        return CATEGORY_TESSERACT
+    if '/torch/' in path or '/transformers/' in path:
+        if name in ('forward', '_call_impl', 'generate', '_sample', '_beam_search') or '/torch/nn/' in path:
+            return CATEGORY_MODEL
+    if name in ('speculative_generate', 'decode_image', 'stream_image'):
+        return CATEGORY_MODEL
+    if path.endswith(('/json/encoder.py', '/json/__init__.py')) or name in ('jsonify', 'write_event'):
+        return CATEGORY_JSON
+    if '/PIL/' in path or path.endswith('/cgi.py') or '/werkzeug/formparser' in path or 'multipart' in path:
+        return CATEGORY_DECODE
+    if 'preprocess' in name or name in _PREPROCESS_FUNCTIONS:
+        return CATEGORY_PREPROCESS
+    return None
+
+
+def classify_stack(codes):
+    """
+    Kategorie vzorku - rozhoduje rámec nejblíže listu, který kategorii určuje
+
+    Args:
+        codes: Kódové objekty rámců od kořene k listu
+    """
+    # Čekání uvnitř OCR (např. na výsledek podprocesu) se počítá do OCR
+    for code in reversed(codes):
+        category = classify_frame(code)
+        if category is not None:
+            return category
+
+    if codes and codes[-1].co_name in _IDLE_FUNCTIONS and _module_name(codes[-1]) in _IDLE_MODULES:
+        return CATEGORY_IDLE
+    return CATEGORY_OTHER
+
+
+class Profile:
+    """
+    Výsledek profilování - počty vzorků podle zásobníku
+    """
+
+    def __init__(self, stacks, samples, seconds, interval, cpu):
+        self.stacks = stacks
+        self.samples = samples
+        self.seconds = seconds
+        self.interval = interval
+        self.cpu = cpu
+
+    def categories(self, include_idle=False):
+        """
+        Podíl vzorků podle kategorie ({kategorie: {"samples", "share"}})
+        """
+        counts = Counter()
+        for stack, count in self.stacks.items():
+            if include_idle or stack[0] != CATEGORY_IDLE:
+                counts[stack[0]] += count
+        total = sum(counts.values()) or 1
+        return {category: {"samples": count, "share": round(count / total, 4)}
+                for category, count in counts.most_common()}
+
+    def collapsed(self, include_idle=False):
+        """
+        Collapsed stacks pro flamegraph.pl (jeden zásobník na řádek)
+        """
+        lines = [f"{';'.join(stack)} {count}"
+                 for stack, count in sorted(self.stacks.items())
+                 if include_idle or stack[0] != CATEGORY_IDLE]
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def to_state(self):
+        """
+        Úplný stav pro přenos mezi procesy (viz prefork.profile_workers)
+        """
+        return {
+            "stacks": [[list(stack), count] for stack, count in self.stacks.items()],
+            "samples": self.samples,
+            "seconds": self.seconds,
+            "interval": self.interval,
+            "cpu": self.cpu,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        stacks = Counter({tuple(stack): count for stack, count in state["stacks"]})
+        return cls(stacks, state["samples"], state["seconds"], state["interval"], state["cpu"])
+
+    @classmethod
+    def merge(cls, profiles):
+        """
+        Souhrnný profil více procesů - vzorky se sčítají, CPU se hlásí celkem i po procesech
+        """
+        stacks = Counter()
+        for profile in profiles:
+            stacks.update(profile.stacks)
+        cpu = {key: round(sum(profile.cpu.get(key, 0.0) for profile in profiles), 3)
+               for key in ("user", "system", "children")}
+        cpu["processes"] = [profile.cpu for profile in profiles]
+        return cls(stacks, sum(profile.samples for profile in profiles),
+                   max(profile.seconds for profile in profiles), profiles[0].interval, cpu)
+
+    def to_dict(self, include_idle=False):
+        return {
+            "seconds": round(self.seconds, 3),
+            "interval": self.interval,
+            "samples": self.samples,
+            "categories": self.categories(include_idle),
+            "cpu": self.cpu,
+            "collapsed": self.collapsed(include_idle),
+        }
+
+
+def _cpu_times():
+    times = os.times()
+    return times.user, times.system, times.children_user + times.children_system
+
+
+def sample(seconds, interval=SAMPLE_INTERVAL):
+    """
+    Vzorkuje zásobníky všech vláken procesu kromě volajícího
+
+    Args:
+        seconds: Délka okna
+        interval: Interval mezi vzorky
+
+    Returns:
+        Profile
+    """
+    own_thread = threading.get_ident()
+    stacks = Counter()
+    samples = 0
+    cpu_before = _cpu_times()
+    started = time.perf_counter()
+    deadline = started + seconds
+
+    while True:
+        now = time.perf_counter()
+        if now >= deadline:
+            break
+
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            codes = []
+            while frame is not None and len(codes) < MAX_DEPTH:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            codes.reverse()
+            stack = (classify_stack(codes),) + tuple(_frame_label(code) for code in codes)
+            stacks[stack] += 1
+        samples += 1
+
+        # Interval se měří od začátku vzorku, aby se frekvence neposouvala
+        time.sleep(max(0.0, interval - (time.perf_counter() - now)))
+
+    elapsed = time.perf_counter() - started
+    cpu_after = _cpu_times()
+    cpu = {
+        "user": round(cpu_after[0] - cpu_before[0], 3),
+        "system": round(cpu_after[1] - cpu_before[1], 3),
+        "children": round(cpu_after[2] - cpu_before[2], 3),
+        "pid": os.getpid(),
+    }
+    return Profile(stacks, samples, elapsed, interval, cpu)
+
+
+def parse_seconds(value):
+    """
+    Délka okna z parametru požadavku omezená na (0, MAX_SECONDS]
+    """
+    try:
+        seconds = float(value) if value not in (None, '') else DEFAULT_SECONDS
+    except (TypeError, ValueError):
+        seconds = DEFAULT_SECONDS
+    return min(max(seconds, 0.1), MAX_SECONDS)
+
+
+def run_profile(seconds=None, interval=None):
+    """
+    Spustí jedno okno profilování (v jednom okamžiku nejvýše jedno)
+
+    Raises:
+        ProfilerBusy: Pokud profilování už běží
+    """
+    if not _lock.acquire(blocking=False):
+        raise ProfilerBusy("Profilování už běží, zkuste to po jeho dokončení")
+    try:
+        try:
+            interval = float(interval) if interval else SAMPLE_INTERVAL
+        except ValueError:
+            interval = SAMPLE_INTERVAL
+        return sample(parse_seconds(seconds), max(interval, 0.001))
+    finally:
+        _lock.release()
+
+
+def is_authorized(client_host, headers):
+    """
+    Přístup k ladicím endpointům - s tokenem OCR_DEBUG_TOKEN odkudkoli,
+    bez tokenu jen z lokální smyčky
+
+    Args:
+        client_host: Adresa klienta
+        headers: Hlavičky požadavku (X-Debug-Token nebo Authorization: Bearer)
+    """
+    if DEBUG_TOKEN:
+        supplied = headers.get('X-Debug-Token') or ''
+        authorization = headers.get('Authorization') or ''
+        if authorization.startswith('Bearer '):
+            supplied = supplied or authorization[len('Bearer '):]
+        return hmac.compare_digest(supplied.encode(), DEBUG_TOKEN.encode())
+
+    try:
+        address = ipaddress.ip_address(client_host)
+    except ValueError:
+        return False
+    mapped = getattr(address, 'ipv4_mapped', None)
+    return (mapped or address).is_loopback
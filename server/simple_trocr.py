@@ -9,88 +9,230 @@ import os
 import json
 import subprocess
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image, ImageEnhance
+from language_detection import resolve_language
+from ocr_batch import batch_main
+from resource_budget import cpu_budget
+from tesseract_batch import DEFAULT_CHUNK_SIZE, create_work_dir, remove_work_dir, run_tesseract_list, chunked
 
-# Kontrola vstupních parametrů
-if len(sys.argv) < 2:
-    print("Použití: python simple_trocr.py <cesta_k_obrazku> [jazyk]")
-    sys.exit(1)
-
-# Získání vstupních parametrů
-image_path = sys.argv[1]
-language = sys.argv[2] if len(sys.argv) > 2 else 'eng'
-
-# Kontrola existence souboru
-if not os.path.exists(image_path):
-    result = {
-        "success": False,
-        "text": "",
-        "error": f"Soubor {image_path} nebyl nalezen"
-    }
-    print(json.dumps(result))
-    sys.exit(1)
+# Parametry Tesseractu pro tento engine
+TESSERACT_ARGS = ["--psm", "6"]
+
+# Počet vláken pro paralelní předzpracování v dávkovém režimu
+PREPROCESS_WORKERS = cpu_budget('simple_trocr')
 
 # Funkce pro vylepšení kvality obrázku
 def enhance_image(image):
     # Zvýšení kontrastu
     enhancer = ImageEnhance.Contrast(image)
     image = enhancer.enhance(1.5)
-    
+
     # Zvýšení ostrosti
     enhancer = ImageEnhance.Sharpness(image)
     image = enhancer.enhance(1.5)
-    
+
     return image
 
-try:
+def preprocess_image(image_path, output_path):
+    """
+    Načte obrázek, převede ho do stupňů šedi, vylepší a uloží do output_path
+
+    Returns:
+        Předzpracovaný obrázek (PIL Image)
+    """
     # Načtení a preprocessing obrázku
     img = Image.open(image_path)
-    
+
     # Konverze do šedotónového obrazu
     img = img.convert('L')
-    
+
     # Vylepšení kvality
     img = enhance_image(img)
-    
+
     # Uložení preprocessovaného obrazu
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
-    temp_path = temp_file.name
-    temp_file.close()
-    img.save(temp_path)
-    
-    # Pro české texty přidat i podporu angličtiny jako zálohu
-    lang_param = f"{language}+eng" if language == 'ces' else language
-    
-    # Spuštění Tesseract OCR
-    cmd = ["tesseract", temp_path, "stdout", "-l", lang_param, "--psm", "6"]
-    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    stdout, stderr = process.communicate()
-    
+    img.save(output_path)
+    return img
+
+def build_result(returncode, stdout, stderr, lang_param):
+    """
+    Sestaví výsledek z výstupu Tesseractu
+    """
     # Kontrola chyb
-    if process.returncode != 0:
+    if returncode != 0:
+        return {
+            "success": False,
+            "text": "",
+            "error": f"Tesseract vrátil chybu: {stderr}"
+        }
+
+    # Zpracování výstupu
+    return {
+        "success": True,
+        "text": stdout.strip(),
+        "confidence": 0.85,  # Pevná hodnota důvěryhodnosti - nelze snadno získat z tesseract stdout
+        "language": lang_param
+    }
+
+def recognize_image(image_path, language='eng', user_id=None):
+    """
+    Rozpozná text jednoho obrázku
+
+    Args:
+        image_path: Cesta k souboru s obrázkem
+        language: Jazyk pro OCR
+        user_id: Identifikátor uživatele pro cache zvoleného jazyka (volitelné)
+
+    Returns:
+        Dictionary s výsledkem rozpoznávání
+    """
+    # Kontrola existence souboru
+    if not os.path.exists(image_path):
+        return {
+            "success": False,
+            "text": "",
+            "error": f"Soubor {image_path} nebyl nalezen"
+        }
+
+    try:
+        # Uložení preprocessovaného obrazu
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.png')
+        temp_path = temp_file.name
+        temp_file.close()
+        img = preprocess_image(image_path, temp_path)
+
+        # Rozlišení jazyka na jediný model místo kombinovaného ces+eng
+        lang_param, _ = resolve_language(img, language, user_id)
+
+        # Spuštění Tesseract OCR
+        cmd = ["tesseract", temp_path, "stdout", "-l", lang_param, *TESSERACT_ARGS]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+
+        result = build_result(process.returncode,
+                              stdout.decode('utf-8', errors='replace'),
+                              stderr.decode('utf-8', errors='replace'),
+                              lang_param)
+
+        # Odstranění dočasného souboru
+        os.unlink(temp_path)
+
+    except Exception as e:
         result = {
             "success": False,
             "text": "",
-            "error": f"Tesseract vrátil chybu: {stderr.decode('utf-8', errors='replace')}"
+            "error": f"Zpracování selhalo: {str(e)}"
         }
-    else:
-        # Zpracování výstupu
-        text = stdout.decode('utf-8', errors='replace').strip()
+
+    return result
+
+def _preprocess_job(job):
+    image_path, output_path = job
+    try:
+        preprocess_image(image_path, output_path)
+        return None
+    except Exception as e:
+        return str(e)
+
+def recognize_images(image_paths, language='eng', user_id=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Rozpozná více obrázků najednou
+
+    Obrázky se předzpracují paralelně do pracovního adresáře na tmpfs
+    a Tesseract se spustí jednou na každý blok `chunk_size` obrázků.
+
+    Args:
+        image_paths: Seznam cest k obrázkům
+        language: Jazyk pro OCR
+        user_id: Identifikátor uživatele pro cache zvoleného jazyka (volitelné)
+        chunk_size: Počet obrázků na jedno spuštění Tesseractu
+
+    Returns:
+        Seznam výsledků ve stejném pořadí jako `image_paths`
+    """
+    results = [None] * len(image_paths)
+    work_dir = create_work_dir()
+
+    try:
+        jobs = []
+        for i, image_path in enumerate(image_paths):
+            if not os.path.exists(image_path):
+                results[i] = {
+                    "success": False,
+                    "text": "",
+                    "error": f"Soubor {image_path} nebyl nalezen"
+                }
+            else:
+                jobs.append((i, os.path.join(work_dir, f"page_{i}.png")))
+
+        # Paralelní předzpracování (PIL filtry uvolňují GIL)
+        with ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS) as executor:
+            errors = list(executor.map(_preprocess_job, [(image_paths[i], path) for i, path in jobs]))
+
+        ready = []
+        for job, error in zip(jobs, errors):
+            if error is None:
+                ready.append(job)
+            else:
+                results[job[0]] = {
+                    "success": False,
+                    "text": "",
+                    "error": f"Zpracování selhalo: {error}"
+                }
+
+        if ready:
+            # Jazyk se rozliší jednou pro celou dávku
+            with Image.open(ready[0][1]) as sample_image:
+                lang_param, _ = resolve_language(sample_image, language, user_id)
+
+            for chunk in chunked(ready, chunk_size):
+                outputs = run_tesseract_list([path for _, path in chunk], lang_param, TESSERACT_ARGS, work_dir)
+                for (i, _), (returncode, stdout, stderr) in zip(chunk, outputs):
+                    results[i] = build_result(returncode, stdout, stderr, lang_param)
+
+    except Exception as e:
+        for i, result in enumerate(results):
+            if result is None:
+                results[i] = {
+                    "success": False,
+                    "text": "",
+                    "error": f"Zpracování selhalo: {str(e)}"
+                }
+    finally:
+        remove_work_dir(work_dir)
+
+    return results
+
+def main():
+    # Kontrola vstupních parametrů
+    if len(sys.argv) < 2:
+        print("Použití: python simple_trocr.py <cesta_k_obrazku> [jazyk] [uzivatel]")
+        print("         python simple_trocr.py --batch <vstup> [...] [--language jazyk] [--checkpoint soubor]")
+        sys.exit(1)
+
+    if sys.argv[1] == '--batch':
+        sys.exit(batch_main(sys.argv[2:], recognize_image, "Dávkové rozpoznávání textu (simple_trocr)",
+                            recognize_pages=recognize_images))
+
+    # Získání vstupních parametrů
+    image_path = sys.argv[1]
+    language = sys.argv[2] if len(sys.argv) > 2 else 'eng'
+    user_id = sys.argv[3] if len(sys.argv) > 3 else None
+
+    # Kontrola existence souboru
+    if not os.path.exists(image_path):
         result = {
-            "success": True,
-            "text": text,
-            "confidence": 0.85  # Pevná hodnota důvěryhodnosti - nelze snadno získat z tesseract stdout
+            "success": False,
+            "text": "",
+            "error": f"Soubor {image_path} nebyl nalezen"
         }
-    
-    # Odstranění dočasného souboru
-    os.unlink(temp_path)
-    
-except Exception as e:
-    result = {
-        "success": False,
-        "text": "",
-        "error": f"Zpracování selhalo: {str(e)}"
-    }
+        print(json.dumps(result))
+        sys.exit(1)
+
+    result = recognize_image(image_path, language, user_id)
+
+    # Vrácení výsledku jako JSON
+    print(json.dumps(result))
 
-# Vrácení výsledku jako JSON
-print(json.dumps(result))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Dávkové spouštění Tesseractu přes seznam souborů
+
+Tesseract umí místo jednoho obrázku přijmout textový soubor se seznamem
+cest a zpracovat všechny obrázky jedním procesem - start procesu a načtení
+trénovacích dat (traineddata) se tak platí jednou za blok, ne za obrázek.
+Výstupy jednotlivých stránek odděluje znak konce stránky (form feed), podle
+kterého se výsledek rozdělí zpět na vstupní obrázky.
+
+Pracovní adresář se zakládá na tmpfs (/dev/shm), pokud je k dispozici.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+
+# Oddělovač stránek ve výstupu Tesseractu (výchozí hodnota page_separator)
+PAGE_SEPARATOR = '\f'
+
+# Výchozí počet obrázků na jedno spuštění Tesseractu
+DEFAULT_CHUNK_SIZE = int(os.environ.get('TESSERACT_CHUNK_SIZE', 16))
+
+# Adresář na tmpfs pro předzpracované obrázky
+TMPFS_DIR = os.environ.get('OCR_TMPFS_DIR', '/dev/shm')
+
+
+def create_work_dir(prefix='welldiary-tess-'):
+    """
+    Vytvoří pracovní adresář, pokud možno v paměti (tmpfs)
+    """
+    base_dir = TMPFS_DIR if os.path.isdir(TMPFS_DIR) and os.access(TMPFS_DIR, os.W_OK) else None
+    return tempfile.mkdtemp(prefix=prefix, dir=base_dir)
+
+
+def remove_work_dir(work_dir):
+    """
+    Odstraní pracovní adresář včetně obsahu
+    """
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_tesseract(image_path, lang, args=()):
+    """
+    Spustí Tesseract na jeden obrázek
+
+    Returns:
+        Tuple (návratový kód, text, chybový výstup)
+    """
+    cmd = ["tesseract", image_path, "stdout", "-l", lang, *args]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = process.communicate()
+    return (process.returncode,
+            stdout.decode('utf-8', errors='replace'),
+            stderr.decode('utf-8', errors='replace'))
+
+
+def run_tesseract_list(image_paths, lang, args=(), work_dir=None):
+    """
+    Rozpozná více obrázků jedním spuštěním Tesseractu
+
+    Args:
+        image_paths: Seznam cest k (předzpracovaným) obrázkům
+        lang: Jazyk pro Tesseract
+        args: Další parametry příkazové řádky (např. --psm 6)
+        work_dir: Adresář pro soubor se seznamem (výchozí je nový adresář na tmpfs)
+
+    Returns:
+        Seznam tuple (návratový kód, text, chybový výstup) ve stejném pořadí
+        jako `image_paths`
+    """
+    if not image_paths:
+        return []
+    if len(image_paths) == 1:
+        return [run_tesseract(image_paths[0], lang, args)]
+
+    own_work_dir = work_dir is None
+    work_dir = work_dir or create_work_dir()
+    list_path = os.path.join(work_dir, f"pages_{os.getpid()}_{id(image_paths)}.txt")
+
+    try:
+        with open(list_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(os.path.abspath(p) for p in image_paths) + '\n')
+
+        returncode, stdout, stderr = run_tesseract(list_path, lang, args)
+
+        pages = stdout.split(PAGE_SEPARATOR)
+        # Za poslední stránkou je také oddělovač
+        if pages and not pages[-1].strip():
+            pages = pages[:-1]
+
+        if returncode == 0 and len(pages) == len(image_paths):
+            return [(0, page, stderr) for page in pages]
+
+        # Nesouhlasí počet stránek (např. nečitelný obrázek) - výsledky nelze
+        # spolehlivě přiřadit, proto se blok zpracuje obrázek po obrázku
+        print(f"Varování: Dávkový Tesseract vrátil {len(pages)} stránek místo {len(image_paths)}, "
+              f"zpracovávám jednotlivě", file=sys.stderr)
+        return [run_tesseract(path, lang, args) for path in image_paths]
+    finally:
+        if own_work_dir:
+            remove_work_dir(work_dir)
+        elif os.path.exists(list_path):
+            os.remove(list_path)
+
+
+def chunked(items, chunk_size):
+    """
+    Rozdělí seznam na bloky dané velikosti
+    """
+    chunk_size = max(1, chunk_size)
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
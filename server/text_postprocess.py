@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Sdílený post-processing rozpoznaného textu
+
+Pravidla jsou zapsaná deklarativně a zkompilovaná jednou při importu.
+Znaková mapování (uvozovky, pomlčky, svislice, lomítka) běží přes jedinou
+`str.translate` tabulku a nezávislá regulární pravidla jsou sloučená do
+společných alternací. Pravidla, jejichž výsledek závisí na předchozím
+průchodu (záměny 0/1 za písmena, osamocená písmena a jednotlivé předpony),
+zůstávají samostatnými průchody ve stejném pořadí jako dřív, aby se
+výstup nezměnil.
+
+Dávkové API čistí všechny kandidáty (varianty předzpracování nebo celé
+stránky) jedním voláním - texty se spojí oddělovačem nového řádku, každý
+průchod proběhne jednou nad celým blokem a výsledek se zase rozdělí.
+Pravidla proto místo `\\s` používají `[^\\S\\n]`, aby oddělovač nikdy nepřekročila.
+"""
+
+import re
+import sys
+
+# Oddělovač textů v dávce - po normalizaci mezer se uvnitř textu nevyskytuje
+_BATCH_SEPARATOR = '\n'
+
+# Mezery bez oddělovače dávky
+_WS = r'[^\S\n]'
+
+# Znaková mapování (jeden průchod přes str.translate)
+CHARACTER_MAP = {
+    # Standardizace uvozovek a apostrofů (původní regulární výraz typografické
+    # uvozovky kvůli ztrátě kódování neobsahoval a nechával je beze změny)
+    '‘': "'", '’': "'", '`': "'", '´': "'",
+    '“': '"', '”': '"', '„': '"',
+    # Náhrada neobvyklých pomlček za standardní
+    '–': '-', '—': '-', '−': '-',
+    # Svislice často zaměněná za 'I', standardizace lomítek
+    '|': 'I', '\\': '/',
+}
+
+# Běžné české předpony, které OCR odděluje mezerou od zbytku slova
+CZECH_PREFIXES = ['ne', 'po', 'pro', 'pře', 'při', 'roz', 'vy', 'za']
+
+# Samostatná písmena, která v textu zůstávají (a, i, k, s, v, z, A, I, K, O, S, V, Z)
+_ISOLATED_LETTER = r'[b-hj-uw-yB-HJ-NPQ-UW-Y]'
+
+# Deklarativní pravidla v pořadí průchodů: (vzor, náhrada, příznaky).
+# Náhrada je řetězec, funkce, nebo slovník {pojmenovaná skupina: náhrada}
+# pro sloučené alternace.
+RULES = [
+    # Nahrazení po sobě jdoucích speciálních znaků mezerou
+    (r'[^\w\s\.\,\?\!]{2,}', ' ', 0),
+
+    # (zde proběhne CHARACTER_MAP)
+
+    # Oprava záměn číslic a písmen - postupně, '1' před nově vzniklým 'O'
+    # se také opraví ('10a' -> 'IOa')
+    (r'0([A-Za-z])', r'O\1', 0),
+    (r'([A-Za-z])0', r'\1O', 0),
+    (r'1([A-Za-z])', r'I\1', 0),
+
+    # Velké písmeno na začátku věty
+    (rf'([\.!?]{_WS}+)([a-z])', lambda m: m.group(1) + m.group(2).upper(), 0),
+
+    # Speciální opravy pro české znaky ('c v' -> 'č', 'e s' -> 'ě')
+    (rf'(?P<c>c{_WS}*v)|(?P<e>e{_WS}*s)', {'c': 'č', 'e': 'ě'}, 0),
+
+    # Mezery kolem interpunkce - bez mezery před, s mezerou za
+    (rf'(?P<before>{_WS}+(?=[,.!?:;]))|(?P<after>(?<=[,.!?:;])(?=[A-Za-z0-9]))',
+     {'before': '', 'after': ' '}, 0),
+
+    # Odstranění osamocených písmen
+    (rf'{_WS}+{_ISOLATED_LETTER}{_WS}+', ' ', 0),
+] + [
+    # Sloučení rozdělených předpon - každá předpona zvlášť, sloučená předpona
+    # už další nezačíná slovo ('ne po xyz' -> 'nepo xyz')
+    (rf'\b({prefix}){_WS}+', r'\1', re.IGNORECASE)
+    for prefix in CZECH_PREFIXES
+]
+
+
+def _compile_rule(pattern, replacement, flags):
+    compiled = re.compile(pattern, flags)
+
+    if isinstance(replacement, dict):
+        groups = list(replacement.items())
+
+        def replace(match):
+            for name, value in groups:
+                matched = match.group(name)
+                if matched is not None:
+                    # None znamená "ponechat obsah skupiny"
+                    return matched if value is None else value
+            return match.group(0)
+
+        return compiled, replace
+
+    return compiled, replacement
+
+
+_TRANSLATION_TABLE = str.maketrans(CHARACTER_MAP)
+_COMPILED_RULES = [_compile_rule(*rule) for rule in RULES]
+_SPECIAL_RUNS, _SPECIAL_RUNS_REPLACEMENT = _COMPILED_RULES[0]
+_NON_ALNUM = re.compile(r'[\W_]+')
+
+
+def normalize_whitespace(text):
+    """
+    Odstraní zbytečná zalomení řádků a nadbytečné mezery
+    """
+    if not text:
+        return ""
+    return ' '.join(text.split())
+
+
+def clean_texts(texts):
+    """
+    Vyčistí všechny texty jedním průchodem každého pravidla
+
+    Args:
+        texts: Seznam rozpoznaných textů (kandidáti variant nebo stránky)
+
+    Returns:
+        Seznam vyčištěných textů ve stejném pořadí
+    """
+    texts = list(texts)
+    if not texts:
+        return []
+
+    block = _BATCH_SEPARATOR.join(normalize_whitespace(t) for t in texts)
+
+    try:
+        block = _SPECIAL_RUNS.sub(_SPECIAL_RUNS_REPLACEMENT, block)
+        block = block.translate(_TRANSLATION_TABLE)
+        for pattern, replacement in _COMPILED_RULES[1:]:
+            block = pattern.sub(replacement, block)
+    except Exception as e:
+        print(f"Chyba při post-processingu textu: {str(e)}", file=sys.stderr)
+        return [normalize_whitespace(t) for t in texts]
+
+    return block.split(_BATCH_SEPARATOR)
+
+
+def clean_text(text):
+    """
+    Pokročilé post-processingové úpravy jednoho rozpoznaného textu
+
+    Args:
+        text: Rozpoznaný text z OCR
+
+    Returns:
+        Vyčištěný a vylepšený text
+    """
+    if not text:
+        return ""
+    return clean_texts([text])[0]
+
+
+def light_clean(text):
+    """
+    Levné přiblížení výsledku `clean_text` pro hodnocení kandidátů
+
+    Provede jen průchody, které mění délku textu a podíl alfanumerických
+    znaků (mezery, běhy speciálních znaků, znaková mapování).
+    """
+    if not text:
+        return ""
+    text = _SPECIAL_RUNS.sub(_SPECIAL_RUNS_REPLACEMENT, normalize_whitespace(text))
+    return text.translate(_TRANSLATION_TABLE)
+
+
+def quality_score(text, confidence):
+    """
+    Hodnocení kvality kandidáta podle důvěryhodnosti, délky a podílu
+    alfanumerických znaků - počítá se nad lehce vyčištěným textem
+
+    Args:
+        text: Rozpoznaný text kandidáta
+        confidence: Průměrná důvěryhodnost Tesseractu (0-100)
+
+    Returns:
+        Skóre kvality (vyšší je lepší)
+    """
+    text = light_clean(text)
+    if not text.strip():
+        return 0
+
+    total_count = len(text)
+    alpha_count = len(_NON_ALNUM.sub('', text))
+    char_ratio = alpha_count / total_count
+
+    # Hodnocení na základě počtu znaků (očekáváme alespoň 10 znaků v rukopisu)
+    text_length_score = min(total_count, 200) / 100
+
+    # Výpočet celkového skóre kvality s větší váhou pro důvěryhodnost
+    return (confidence * 0.6) + (text_length_score * 0.2) + (char_ratio * 100 * 0.2)
+
+
+def score_texts(texts, confidences):
+    """
+    Ohodnotí dávku kandidátů bez jejich plného vyčištění
+    """
+    return [quality_score(t, c) for t, c in zip(texts, confidences)]
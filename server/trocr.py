@@ -9,17 +9,38 @@ import os
 import json
 import argparse
 from PIL import Image
-from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+from ocr_batch import batch_main
+from trocr_models import ModelRegistry
+from resource_budget import cpu_budget
+from trocr_decoding import DEFAULT_DRAFT, DRAFT_TOKENS, decode_image, resolve_draft
+
+# Loaded models, reused across pages in batch mode
+_registry = ModelRegistry(torch_threads=cpu_budget('trocr'), restricted=False)
 
 def parse_args():
     parser = argparse.ArgumentParser(description='TrOCR Handwritten Text Recognition')
     parser.add_argument('image_path', help='Path to the image file')
     parser.add_argument('--language', default='eng', help='Language code (default: eng)')
     parser.add_argument('--model', default='microsoft/trocr-large-handwritten', 
-                        help='HuggingFace model to use (default: microsoft/trocr-large-handwritten)')
+                        help='HuggingFace model or alias small/base/large (default: microsoft/trocr-large-handwritten)')
+    add_decoding_args(parser)
     return parser.parse_args()
 
-def perform_trocr(image_path, language='eng', model_name='microsoft/trocr-large-handwritten'):
+def add_decoding_args(parser):
+    parser.add_argument('--draft-model', default=DEFAULT_DRAFT,
+                        help="Draft model for speculative decoding (alias, name or 'auto'; empty disables)")
+    parser.add_argument('--draft-tokens', type=int, default=DRAFT_TOKENS,
+                        help=f'Tokens proposed by the draft model per step (default: {DRAFT_TOKENS})')
+
+def load_model(model_name):
+    """
+    Load the processor and model once per process (accepts small/base/large aliases)
+    """
+    processor, model, _ = _registry.get(model_name)
+    return processor, model
+
+def perform_trocr(image_path, language='eng', model_name='microsoft/trocr-large-handwritten',
+                  draft_model=None, draft_tokens=DRAFT_TOKENS):
     try:
         # Check if image exists
         if not os.path.exists(image_path):
@@ -38,20 +59,21 @@ def perform_trocr(image_path, language='eng', model_name='microsoft/trocr-large-
             model_name = 'microsoft/trocr-large-handwritten'
         
         # Load model and processor
-        processor = TrOCRProcessor.from_pretrained(model_name)
-        model = VisionEncoderDecoderModel.from_pretrained(model_name)
+        processor, model, model_id = _registry.get(model_name)
         
-        # Process image
-        pixel_values = processor(images=image, return_tensors="pt").pixel_values
+        # Optional draft model: greedy output is identical, decoding is faster
+        draft = resolve_draft(_registry, model_id, draft_model)
         
         # Generate text
-        generated_ids = model.generate(pixel_values)
-        recognized_text = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+        # Greedy first, beam search only for low-confidence sequences
+        recognized_text, confidence, decoding = decode_image(image, processor, model, draft, draft_tokens)
         
         return {
             "success": True,
             "text": recognized_text,
-            "confidence": 0.95  # TrOCR doesn't provide confidence scores directly
+            "confidence": confidence["sequence"],
+            "token_confidences": confidence["tokens"],
+            "decoding": decoding
         }
     except Exception as e:
         return {
@@ -61,8 +83,21 @@ def perform_trocr(image_path, language='eng', model_name='microsoft/trocr-large-
         }
 
 def main():
+    # Batch mode: directory, glob, list file or multi-page TIFF/PDF -> JSONL
+    if len(sys.argv) > 1 and sys.argv[1] == '--batch':
+        model_parser = argparse.ArgumentParser(add_help=False)
+        model_parser.add_argument('--model', default='microsoft/trocr-large-handwritten')
+        add_decoding_args(model_parser)
+        model_args, batch_argv = model_parser.parse_known_args(sys.argv[2:])
+        sys.exit(batch_main(
+            batch_argv,
+            lambda path, language, user_id: perform_trocr(path, language, model_args.model,
+                                                          model_args.draft_model, model_args.draft_tokens),
+            "Batch TrOCR Handwritten Text Recognition"
+        ))
+    
     args = parse_args()
-    result = perform_trocr(args.image_path, args.language, args.model)
+    result = perform_trocr(args.image_path, args.language, args.model, args.draft_model, args.draft_tokens)
     print(json.dumps(result))
 
 if __name__ == "__main__":
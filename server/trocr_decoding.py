@@ -0,0 +1,545 @@
+#!/usr/bin/env python3
+"""
+Dekódování TrOCR se spekulativním (asistovaným) generováním
+
+Velký TrOCR model je přesný, ale autoregresivní dekódování na CPU je
+pomalé - každý token stojí jeden průchod celým dekodérem. Při
+spekulativním dekódování navrhne menší model se stejným slovníkem několik
+tokenů dopředu a velký model je ověří jediným průchodem. Přijme se
+nejdelší shodný prefix a první neshodný token se nahradí předpovědí
+velkého modelu, takže hladový (greedy) výstup je stejný, jako kdyby
+dekódoval jen velký model. Ověřené části KV cache se zachovají, zbytek
+se ořízne.
+
+Poznámka: trocr-small používá jiný tokenizer než base/large, proto je
+výchozím návrhovým modelem pro large model base. Kompatibilita slovníků
+se před použitím vždy ověří.
+
+Důvěra výsledku se počítá z pravděpodobností vygenerovaných tokenů
+(geometrický průměr přes sekvenci). Dekóduje se levně hladově, a jen když
+je důvěra sekvence pod TROCR_BEAM_CONFIDENCE, zopakuje se beam search nad
+už spočítanými výstupy enkodéru - obrázek se podruhé nekóduje.
+"""
+
+import os
+import sys
+import math
+import time
+import threading
+
+# Návrhový model (zkratka nebo název, 'auto' podle DEFAULT_DRAFT_MODELS, prázdné = vypnuto);
+# na serveru musí jít o zkratku nebo model z TROCR_ALLOWED_MODELS
+DEFAULT_DRAFT = os.environ.get('TROCR_DRAFT_MODEL', '')
+
+# Počet tokenů navržených v jednom kroku
+DRAFT_TOKENS = int(os.environ.get('TROCR_DRAFT_TOKENS', 4))
+
+# Návrhové modely se stejným tokenizerem (RoBERTa BPE) pro 'auto'
+DEFAULT_DRAFT_MODELS = {
+    'microsoft/trocr-large-handwritten': 'base',
+}
+
+# Důvěra sekvence (0-1), pod kterou se hladový výsledek zopakuje beam searchem (0 = nikdy)
+BEAM_CONFIDENCE = float(os.environ.get('TROCR_BEAM_CONFIDENCE', 0.6))
+
+# Šířka paprsku při eskalaci (1 = bez eskalace)
+BEAM_WIDTH = int(os.environ.get('TROCR_BEAM_WIDTH', 4))
+
+_DISABLED = ('', 'none', 'off', 'false', '0')
+
+_compatibility = {}
+
+
+def models_compatible(target, draft, target_processor, draft_processor):
+    """
+    Ověří, že návrhový model sdílí slovník a speciální tokeny s cílovým modelem
+    """
+    key = (id(target), id(draft))
+    if key not in _compatibility:
+        compatible = target.config.decoder.vocab_size == draft.config.decoder.vocab_size
+        for attr in ('decoder_start_token_id', 'eos_token_id', 'pad_token_id'):
+            compatible = compatible and getattr(target.config, attr, None) == getattr(draft.config, attr, None)
+        compatible = compatible and (target_processor.tokenizer.get_vocab()
+                                     == draft_processor.tokenizer.get_vocab())
+        _compatibility[key] = compatible
+    return _compatibility[key]
+
+
+def draft_disabled(draft_name):
+    """
+    Vypíná zadaný název spekulativní dekódování ('', 'none', 'off', ...)?
+    """
+    return (draft_name or '').strip().lower() in _DISABLED
+
+
+def resolve_draft(registry, model_id, draft_name=None):
+    """
+    Načte návrhový model z registru, pokud je požadován a kompatibilní
+
+    Args:
+        registry: ModelRegistry
+        model_id: Plný název cílového modelu
+        draft_name: Zkratka/název návrhového modelu, 'auto' nebo None (výchozí z prostředí)
+
+    Returns:
+        Tuple (processor, model, název) návrhového modelu nebo None
+    """
+    draft_name = DEFAULT_DRAFT if draft_name is None else draft_name
+    if draft_disabled(draft_name):
+        return None
+    if draft_name == 'auto':
+        draft_name = DEFAULT_DRAFT_MODELS.get(model_id)
+        if not draft_name:
+            return None
+
+    target_processor, target, _ = registry.get(model_id)
+    draft_processor, draft, draft_id = registry.get(draft_name)
+    if draft_id == model_id:
+        return None
+
+    if not models_compatible(target, draft, target_processor, draft_processor):
+        print(f"Varování: Návrhový model {draft_id} nemá stejný slovník jako {model_id}, "
+              f"dekóduji bez něj", file=sys.stderr)
+        return None
+    return draft_processor, draft, draft_id
+
+
+def _crop_cache(past, length):
+    """
+    Ořízne self-attention část KV cache dekodéru na `length` pozic
+    """
+    if past is None:
+        return None
+    if hasattr(past, 'crop'):
+        # EncoderDecoderCache / DynamicCache (novější transformers) - záporná
+        # hodnota odebere daný počet posledních pozic
+        remove = past.get_seq_length() - length
+        if remove > 0:
+            past.crop(-remove)
+        return past
+    # Starší formát: tuple vrstev (self_k, self_v, cross_k, cross_v)
+    return tuple((layer[0][:, :, :length], layer[1][:, :, :length]) + tuple(layer[2:]) for layer in past)
+
+
+def _decoder_step(model, encoder_outputs, input_ids, past):
+    import torch
+
+    outputs = model(encoder_outputs=encoder_outputs,
+                    decoder_input_ids=torch.tensor([input_ids], dtype=torch.long),
+                    past_key_values=past, use_cache=True)
+    return outputs.logits[0], outputs.past_key_values
+
+
+def speculative_generate(target, draft, pixel_values, draft_pixel_values=None,
+                         draft_tokens=DRAFT_TOKENS, max_new_tokens=None, on_tokens=None,
+                         encoder_outputs=None):
+    """
+    Hladové dekódování cílového modelu s návrhy od menšího modelu
+
+    Args:
+        target: Cílový (velký) VisionEncoderDecoderModel
+        draft: Návrhový model se stejným slovníkem
+        pixel_values: Vstup cílového modelu
+        draft_pixel_values: Vstup návrhového modelu (výchozí stejný jako cílový)
+        draft_tokens: Počet navržených tokenů v jednom kroku
+        max_new_tokens: Maximální počet generovaných tokenů (výchozí podle
+                        generation_config cílového modelu)
+        on_tokens: Volitelná funkce volaná se seznamem nově ověřených tokenů
+        encoder_outputs: Už spočítané výstupy enkodéru cílového modelu
+
+    Returns:
+        Tuple (tensor tokenů tvaru (1, n) jako z `generate`,
+               log-pravděpodobnosti vygenerovaných tokenů podle cílového modelu, metriky)
+    """
+    import torch
+
+    config = target.config
+    start_token = config.decoder_start_token_id
+    eos_token = config.eos_token_id if config.eos_token_id is not None else config.decoder.eos_token_id
+    if max_new_tokens is None:
+        max_new_tokens = max(1, target.generation_config.max_length - 1)
+    draft_tokens = max(1, draft_tokens)
+
+    metrics = {"drafted": 0, "accepted": 0, "target_passes": 0, "draft_passes": 0}
+
+    with torch.no_grad():
+        target_encoded = encoder_outputs if encoder_outputs is not None else target.encoder(
+            pixel_values=pixel_values)
+        draft_encoded = draft.encoder(
+            pixel_values=pixel_values if draft_pixel_values is None else draft_pixel_values)
+
+        tokens = [start_token]
+        token_logprobs = []
+        target_past, target_length = None, 0
+        draft_past, draft_length = None, 0
+        finished = False
+
+        while not finished and len(tokens) - 1 < max_new_tokens:
+            # Návrh: menší model generuje hladově několik tokenů
+            budget = min(draft_tokens, max_new_tokens - (len(tokens) - 1))
+            proposal = []
+            draft_input = tokens[draft_length:]
+            for _ in range(budget):
+                logits, draft_past = _decoder_step(draft, draft_encoded, draft_input, draft_past)
+                draft_length += len(draft_input)
+                metrics["draft_passes"] += 1
+                token = int(logits[-1].argmax())
+                proposal.append(token)
+                draft_input = [token]
+                if token == eos_token:
+                    break
+
+            # Ověření: jediný průchod velkého modelu přes všechny navržené tokeny
+            target_input = tokens[target_length:] + proposal
+            logits, target_past = _decoder_step(target, target_encoded, target_input, target_past)
+            metrics["target_passes"] += 1
+            predictions = logits.argmax(dim=-1).tolist()
+            log_probs = torch.log_softmax(logits.float(), dim=-1)
+
+            offset = len(target_input) - len(proposal) - 1
+            accepted = 0
+            while accepted < len(proposal) and predictions[offset + accepted] == proposal[accepted]:
+                accepted += 1
+
+            metrics["drafted"] += len(proposal)
+            metrics["accepted"] += accepted
+
+            new_tokens = proposal[:accepted]
+            if not (new_tokens and new_tokens[-1] == eos_token):
+                # Opravený (nebo při plné shodě další) token od velkého modelu
+                new_tokens.append(predictions[offset + accepted])
+
+            previous_length = len(tokens)
+            valid_length = previous_length + accepted
+            tokens.extend(new_tokens)
+            # Nový token i předpověděl cílový model na pozici offset + i
+            token_logprobs.extend(float(log_probs[offset + i, token]) for i, token in enumerate(new_tokens))
+
+            if eos_token in new_tokens:
+                tokens = tokens[:tokens.index(eos_token, len(tokens) - len(new_tokens)) + 1]
+                token_logprobs = token_logprobs[:len(tokens) - 1]
+                finished = True
+
+            if on_tokens is not None:
+                on_tokens(tokens[previous_length:max_new_tokens + 1])
+
+            # Zachová se jen cache ověřených pozic
+            target_past = _crop_cache(target_past, valid_length)
+            target_length = valid_length
+            draft_length = min(draft_length, valid_length)
+            draft_past = _crop_cache(draft_past, draft_length)
+
+        tokens = tokens[:max_new_tokens + 1]
+        token_logprobs = token_logprobs[:len(tokens) - 1]
+
+    metrics["generated"] = len(tokens) - 1
+    metrics["acceptance_rate"] = metrics["accepted"] / metrics["drafted"] if metrics["drafted"] else 0.0
+    return torch.tensor([tokens], dtype=torch.long), token_logprobs, metrics
+
+
+def sequence_confidence(token_logprobs):
+    """
+    Důvěra sekvence (0-1) - geometrický průměr pravděpodobností tokenů
+    """
+    if not token_logprobs:
+        return 0.0
+    return math.exp(sum(token_logprobs) / len(token_logprobs))
+
+
+def describe_confidence(processor, token_ids, token_logprobs):
+    """
+    Důvěra sekvence a jednotlivých tokenů pro odpověď API
+
+    Args:
+        processor: TrOCRProcessor (dekóduje tokeny na text)
+        token_ids: Tokeny včetně počátečního tokenu dekodéru
+        token_logprobs: Log-pravděpodobnosti vygenerovaných tokenů (bez počátečního)
+
+    Returns:
+        Dictionary {"sequence": důvěra, "tokens": [{"token", "confidence"}]} bez speciálních tokenů
+    """
+    generated = token_ids[1:len(token_logprobs) + 1]
+    pieces = processor.batch_decode([[token] for token in generated], skip_special_tokens=True)
+    return {
+        "sequence": round(sequence_confidence(token_logprobs), 4),
+        "tokens": [{"token": piece, "confidence": round(math.exp(logprob), 4)}
+                   for piece, logprob in zip(pieces, token_logprobs) if piece],
+    }
+
+
+def encode(model, pixel_values):
+    """
+    Výstupy enkodéru - spočítají se jednou a sdílí je hladový průchod i beam search
+    """
+    try:
+        import torch
+    except ImportError:
+        # Bez torch (zástupný model) nejsou gradienty, které by se vypínaly
+        return model.encoder(pixel_values=pixel_values)
+    with torch.no_grad():
+        return model.encoder(pixel_values=pixel_values)
+
+
+def scored_generate(model, encoder_outputs, num_beams=None, streamer=None):
+    """
+    Generování s log-pravděpodobnostmi vybraných tokenů
+
+    Args:
+        model: VisionEncoderDecoderModel
+        encoder_outputs: Výstupy z `encode`
+        num_beams: Šířka paprsku (None = podle generation_config modelu)
+        streamer: Volitelný streamer pro hladové generování
+
+    Returns:
+        Tuple (tokeny včetně počátečního, log-pravděpodobnosti vygenerovaných tokenů)
+    """
+    if num_beams is None:
+        num_beams = getattr(model.generation_config, 'num_beams', None) or 1
+
+    # generate() při beam searchi rozšíří výstupy enkodéru na místě - každé volání dostane vlastní obal
+    outputs = model.generate(encoder_outputs=type(encoder_outputs)(**encoder_outputs), num_beams=num_beams,
+                             streamer=streamer, output_scores=True, return_dict_in_generate=True)
+    token_ids = [int(token) for token in outputs.sequences[0]]
+
+    # Skóre beam searche už jsou log-softmax, hladové skóre jsou logity
+    transition = model.compute_transition_scores(
+        outputs.sequences, outputs.scores, getattr(outputs, 'beam_indices', None),
+        normalize_logits=num_beams == 1)
+    token_logprobs = transition[0].tolist()
+
+    # Kratší paprsek je doplněn pad tokeny se skóre 0
+    pad_token = getattr(model.generation_config, 'pad_token_id', None)
+    length = len(token_logprobs)
+    while length > 0 and token_ids[length] == pad_token:
+        length -= 1
+    return token_ids[:length + 1], token_logprobs[:length]
+
+
+def escalate_to_beam(model, encoder_outputs, token_ids, token_logprobs, metrics,
+                     threshold=BEAM_CONFIDENCE, beam_width=BEAM_WIDTH):
+    """
+    Zopakuje dekódování s nízkou důvěrou beam searchem nad stejnými výstupy enkodéru
+
+    Returns:
+        Tuple (tokeny, log-pravděpodobnosti) lepšího z obou výsledků
+    """
+    confidence = sequence_confidence(token_logprobs)
+    metrics["greedy_confidence"] = round(confidence, 4)
+    metrics["escalated"] = False
+    if beam_width <= 1 or confidence >= threshold:
+        return token_ids, token_logprobs
+
+    started = time.time()
+    beam_ids, beam_logprobs = scored_generate(model, encoder_outputs, num_beams=beam_width)
+    beam_confidence = sequence_confidence(beam_logprobs)
+    metrics.update({
+        "escalated": True,
+        "beam_width": beam_width,
+        "beam_confidence": round(beam_confidence, 4),
+        "beam_time": time.time() - started,
+    })
+    beam_stats.record(beam_confidence > confidence)
+    if beam_confidence > confidence:
+        return beam_ids, beam_logprobs
+    return token_ids, token_logprobs
+
+
+def decode_image(image, processor, model, draft=None, draft_tokens=DRAFT_TOKENS,
+                 beam_confidence=BEAM_CONFIDENCE, beam_width=BEAM_WIDTH):
+    """
+    Rozpozná text obrázku, se spekulativním dekódováním pokud je zadán návrhový model
+
+    Args:
+        image: PIL obrázek (RGB)
+        processor: TrOCRProcessor cílového modelu
+        model: Cílový model
+        draft: Tuple (processor, model, název) návrhového modelu nebo None
+        draft_tokens: Počet navržených tokenů v jednom kroku
+        beam_confidence: Důvěra, pod kterou se hladový výsledek zopakuje beam searchem
+        beam_width: Šířka paprsku při eskalaci (1 = bez eskalace)
+
+    Returns:
+        Tuple (text, důvěra podle `describe_confidence`, metriky dekódování)
+    """
+    pixel_values = processor(images=image, return_tensors="pt").pixel_values
+    started = time.time()
+    encoder_outputs = encode(model, pixel_values)
+
+    if draft is None:
+        token_ids, token_logprobs = scored_generate(model, encoder_outputs)
+        metrics = {"mode": "default"}
+    else:
+        draft_processor, draft_model, draft_id = draft
+        draft_pixel_values = draft_processor(images=image, return_tensors="pt").pixel_values
+        generated_ids, token_logprobs, metrics = speculative_generate(
+            model, draft_model, pixel_values, draft_pixel_values, draft_tokens, encoder_outputs=encoder_outputs)
+        token_ids = generated_ids[0].tolist()
+        metrics["mode"] = "speculative"
+        metrics["draft_model"] = draft_id
+        speculative_stats.record(metrics)
+
+    # Model s beam searchem v generation_config už paprsek použil
+    if metrics["mode"] == "speculative" or (getattr(model.generation_config, 'num_beams', None) or 1) == 1:
+        token_ids, token_logprobs = escalate_to_beam(model, encoder_outputs, token_ids, token_logprobs,
+                                                     metrics, beam_confidence, beam_width)
+
+    metrics["decode_time"] = time.time() - started
+    text = processor.batch_decode([token_ids], skip_special_tokens=True)[0]
+    return text, describe_confidence(processor, token_ids, token_logprobs), metrics
+
+
+def _queue_streamer(events):
+    """
+    Streamer pro `generate`, který posílá nové tokeny do fronty
+    """
+    # generate() volá jen put/end, základní třída z transformers není potřeba
+    class QueueStreamer:
+        def __init__(self):
+            self.prompt_seen = False
+
+        def put(self, value):
+            # První volání nese počáteční token dekodéru
+            if not self.prompt_seen:
+                self.prompt_seen = True
+                return
+            events.put(value.reshape(-1).tolist())
+
+        def end(self):
+            pass
+
+    return QueueStreamer()
+
+
+def stream_image(image, processor, model, draft=None, draft_tokens=DRAFT_TOKENS):
+    """
+    Rozpozná text obrázku a průběžně vrací dekódovaný text
+
+    Generování běží ve vlákně, nové tokeny se předávají frontou a po každém
+    kroku se dekóduje dosavadní text. Text končící nedokončeným vícebajtovým
+    znakem se pozdrží do dalšího kroku.
+
+    Args:
+        Stejné jako `decode_image`
+
+    Yields:
+        {"delta": přírůstek, "text": dosavadní text} a nakonec
+        {"done": True, "text": celý text, "decoding": metriky}
+    """
+    import queue
+
+    # Beam search nepodporuje streamování - výsledek se pošle najednou
+    if draft is None and (getattr(model.generation_config, 'num_beams', None) or 1) > 1:
+        text, confidence, metrics = decode_image(image, processor, model, None, draft_tokens)
+        yield {"delta": text, "text": text}
+        yield {"done": True, "text": text, "confidence": confidence, "decoding": metrics}
+        return
+
+    events = queue.Queue()
+    finished = object()
+    outcome = {}
+    pixel_values = processor(images=image, return_tensors="pt").pixel_values
+    started = time.time()
+    encoder_outputs = encode(model, pixel_values)
+
+    def generate():
+        try:
+            if draft is None:
+                outcome["tokens"] = scored_generate(model, encoder_outputs, streamer=_queue_streamer(events))
+                outcome["metrics"] = {"mode": "default"}
+            else:
+                draft_processor, draft_model, draft_id = draft
+                draft_pixel_values = draft_processor(images=image, return_tensors="pt").pixel_values
+                generated_ids, token_logprobs, metrics = speculative_generate(
+                    model, draft_model, pixel_values, draft_pixel_values, draft_tokens,
+                    on_tokens=events.put, encoder_outputs=encoder_outputs)
+                outcome["tokens"] = (generated_ids[0].tolist(), token_logprobs)
+                metrics["mode"] = "speculative"
+                metrics["draft_model"] = draft_id
+                speculative_stats.record(metrics)
+                outcome["metrics"] = metrics
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            events.put(finished)
+
+    worker = threading.Thread(target=generate, daemon=True)
+    worker.start()
+
+    token_ids = []
+    text = ""
+    while True:
+        item = events.get()
+        if item is finished:
+            break
+        token_ids.extend(item)
+        current = processor.batch_decode([token_ids], skip_special_tokens=True)[0]
+        if current != text and not current.endswith('\ufffd'):
+            delta = current[len(text):] if current.startswith(text) else current
+            text = current
+            yield {"delta": delta, "text": text}
+
+    worker.join()
+    if "error" in outcome:
+        raise outcome["error"]
+
+    # Při nízké důvěře se výsledek přepočítá beam searchem - závěrečný text
+    # pak může nahradit průběžně odeslaný
+    metrics = outcome["metrics"]
+    token_ids, token_logprobs = escalate_to_beam(model, encoder_outputs, *outcome["tokens"], metrics)
+    metrics["decode_time"] = time.time() - started
+    text = processor.batch_decode([token_ids], skip_special_tokens=True)[0]
+    yield {"done": True, "text": text, "confidence": describe_confidence(processor, token_ids, token_logprobs),
+           "decoding": metrics}
+
+
+class SpeculativeStats:
+    """
+    Souhrnné metriky spekulativního dekódování pro diagnostické endpointy
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {"requests": 0, "drafted": 0, "accepted": 0, "generated": 0, "target_passes": 0}
+
+    def record(self, metrics):
+        with self._lock:
+            self._totals["requests"] += 1
+            for key in ("drafted", "accepted", "generated", "target_passes"):
+                self._totals[key] += metrics.get(key, 0)
+
+    def describe(self):
+        with self._lock:
+            totals = dict(self._totals)
+        totals["acceptance_rate"] = totals["accepted"] / totals["drafted"] if totals["drafted"] else 0.0
+        # Kolik tokenů připadá na jeden průchod velkého modelu (1.0 = bez zrychlení)
+        totals["tokens_per_target_pass"] = (totals["generated"] / totals["target_passes"]
+                                            if totals["target_passes"] else 0.0)
+        return totals
+
+
+speculative_stats = SpeculativeStats()
+
+
+class BeamStats:
+    """
+    Souhrn eskalací na beam search pro diagnostické endpointy
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {"escalated": 0, "improved": 0}
+
+    def record(self, improved):
+        with self._lock:
+            self._totals["escalated"] += 1
+            self._totals["improved"] += int(improved)
+
+    def describe(self):
+        with self._lock:
+            totals = dict(self._totals)
+        totals["threshold"] = BEAM_CONFIDENCE
+        totals["beam_width"] = BEAM_WIDTH
+        return totals
+
+
+beam_stats = BeamStats()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Registr TrOCR modelů pro rezidentní server
+
+Modely se načítají líně podle jména (small/base/large, případně česky
+dotrénovaný model) a zůstávají v paměti v rámci nastaveného rozpočtu RAM.
+Při překročení rozpočtu se uvolní nejdéle nepoužitý model (LRU), takže
+přepínání mezi modely nenačítá model znovu od začátku. Váhy se načítají
+ze safetensors, které transformers mapuje do paměti (mmap) - spolu
+s `low_cpu_mem_usage` se tak model při studeném startu nealokuje dvakrát.
+
+Pro předvídatelný start lze model připnout na revizi (TROCR_MODEL_REVISION),
+stáhnout jeho snapshot do lokálního adresáře (`python trocr_models.py
+--snapshot base large`, adresář TROCR_SNAPSHOT_DIR) a načítat offline
+(TROCR_OFFLINE=1) bez síťových dotazů na hub při každém startu.
+"""
+
+import os
+import sys
+import gc
+import time
+import threading
+import argparse
+from collections import OrderedDict
+from resource_budget import configure_torch
+
+# Zkratky modelů použitelné v požadavcích
+MODEL_ALIASES = {
+    'small': 'microsoft/trocr-small-handwritten',
+    'base': 'microsoft/trocr-base-handwritten',
+    'large': 'microsoft/trocr-large-handwritten',
+}
+
+# Česky dotrénovaný model (název na HuggingFace nebo lokální cesta)
+CZECH_MODEL = os.environ.get('TROCR_CZECH_MODEL')
+if CZECH_MODEL:
+    MODEL_ALIASES['ces'] = CZECH_MODEL
+
+# Výchozí model serveru
+DEFAULT_MODEL = os.environ.get('TROCR_DEFAULT_MODEL', 'base')
+
+# Další modely, které smí server načíst na žádost klienta (názvy na HuggingFace
+# nebo lokální cesty oddělené čárkou) - kromě zkratek a výchozího modelu
+ALLOWED_MODELS = frozenset(
+    [name.strip() for name in os.environ.get('TROCR_ALLOWED_MODELS', '').split(',') if name.strip()]
+    + list(MODEL_ALIASES.values()) + [MODEL_ALIASES.get(DEFAULT_MODEL, DEFAULT_MODEL)])
+
+# Adresář lokálních snapshotů modelů (<adresář>/<organizace>--<model>)
+SNAPSHOT_DIR = os.environ.get(
+    'TROCR_SNAPSHOT_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+
+# Připnutá revize modelů z hubu (commit, tag nebo větev)
+MODEL_REVISION = os.environ.get('TROCR_MODEL_REVISION') or None
+
+# Načítání jen z lokálních souborů (snapshot nebo cache hubu), bez sítě
+OFFLINE = os.environ.get('TROCR_OFFLINE', '').lower() in ('1', 'true', 'yes')
+if OFFLINE:
+    # Čte se při importu transformers/huggingface_hub, který proběhne až později
+    os.environ.setdefault('HF_HUB_OFFLINE', '1')
+
+# Rozpočet RAM pro načtené modely
+MODEL_RAM_BUDGET_MB = int(os.environ.get('TROCR_MODEL_RAM_MB', 4096))
+
+# Zástupný model bez stahování vah (zátěžové testy, vývoj bez torch)
+# (trocr_stub.py, načítá se jen jako loader registru)
+STUB_MODEL = os.environ.get('TROCR_STUB_MODEL', '').lower() in ('1', 'true', 'yes')
+
+
+def resolve_model_name(name, language=None):
+    """
+    Převede zkratku modelu na název na HuggingFace (nebo lokální cestu)
+
+    Args:
+        name: Zkratka, plný název modelu nebo None pro výchozí model
+        language: Jazyk požadavku - pro 'ces' se bez explicitního modelu
+                  použije česky dotrénovaný model, pokud je nastaven
+
+    Returns:
+        Plný název modelu
+    """
+    if not name:
+        name = 'ces' if language == 'ces' and 'ces' in MODEL_ALIASES else DEFAULT_MODEL
+    return MODEL_ALIASES.get(name, name)
+
+
+class ModelNotAllowed(ValueError):
+    """
+    Model mimo zkratky a TROCR_ALLOWED_MODELS - server ho nesmí stáhnout ani načíst
+    """
+
+
+def is_allowed_model(name, language=None):
+    """
+    Smí se model načíst na žádost klienta (zkratka, výchozí nebo povolený model)?
+    """
+    return resolve_model_name(name, language) in ALLOWED_MODELS
+
+
+def _model_size(model):
+    size = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        size += tensor.numel() * tensor.element_size()
+    return size
+
+
+def snapshot_path(model_id):
+    """
+    Lokální adresář snapshotu modelu (nemusí existovat)
+    """
+    return os.path.join(SNAPSHOT_DIR, model_id.replace('/', '--'))
+
+
+def model_source(model_id):
+    """
+    Odkud načíst model - lokální snapshot, pokud existuje, jinak hub (nebo jeho cache)
+
+    Returns:
+        Tuple (cesta nebo název, argumenty from_pretrained)
+    """
+    path = snapshot_path(model_id)
+    if os.path.isfile(os.path.join(path, 'config.json')):
+        return path, {"local_files_only": True}
+    options = {"local_files_only": OFFLINE}
+    if MODEL_REVISION:
+        options["revision"] = MODEL_REVISION
+    return model_id, options
+
+
+def _load_model(model_id):
+    from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+
+    source, options = model_source(model_id)
+    processor = TrOCRProcessor.from_pretrained(source, **options)
+    try:
+        # Safetensors se mapují do paměti, low_cpu_mem_usage přeskočí
+        # náhodnou inicializaci vah, které by se stejně hned přepsaly
+        model = VisionEncoderDecoderModel.from_pretrained(
+            source, use_safetensors=True, low_cpu_mem_usage=True, **options)
+    except (OSError, ValueError):
+        # Model bez safetensors vah
+        model = VisionEncoderDecoderModel.from_pretrained(source, low_cpu_mem_usage=True, **options)
+    model.eval()
+    return processor, model
+
+
+def download_snapshot(name, revision=MODEL_REVISION):
+    """
+    Stáhne snapshot modelu z hubu do SNAPSHOT_DIR pro offline start
+
+    Returns:
+        Cesta ke snapshotu
+    """
+    from huggingface_hub import snapshot_download
+
+    model_id = resolve_model_name(name)
+    path = snapshot_path(model_id)
+    snapshot_download(repo_id=model_id, revision=revision, local_dir=path,
+                      ignore_patterns=['*.h5', '*.msgpack', '*.onnx', 'tf_model*', 'flax_model*'])
+    return path
+
+
+def _load_stub_model(model_id):
+    from trocr_stub import load_stub_model
+
+    return load_stub_model(model_id)
+
+
+class ModelRegistry:
+    """
+    Líně načítané TrOCR modely s LRU uvolňováním podle rozpočtu RAM
+    """
+
+    def __init__(self, budget_mb=MODEL_RAM_BUDGET_MB, loader=None, torch_threads=None, restricted=True):
+        """
+        Args:
+            budget_mb: Rozpočet RAM pro načtené modely
+            loader: Funkce (název modelu) -> (processor, model)
+            torch_threads: Počet vláken torch na jeden souběžný požadavek
+            restricted: Načítat jen povolené modely (viz is_allowed_model) - vypíná
+                        se jen pro lokální nástroje, kde model volí operátor
+        """
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.restricted = restricted
+        self._loader = loader or (_load_stub_model if STUB_MODEL else _load_model)
+        # Počet vláken torch na jeden souběžný požadavek (viz resource_budget)
+        self.torch_threads = torch_threads
+        self._torch_configured = False
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def get(self, name=None, language=None):
+        """
+        Vrátí (processor, model) pro daný model, v případě potřeby ho načte
+
+        Args:
+            name: Zkratka nebo plný název modelu (None pro výchozí)
+            language: Jazyk požadavku (viz `resolve_model_name`)
+
+        Returns:
+            Tuple (processor, model, plný název modelu)
+
+        Raises:
+            ModelNotAllowed: Model není povolen (omezený registr)
+        """
+        model_id = resolve_model_name(name, language)
+        if self.restricted and model_id not in ALLOWED_MODELS:
+            raise ModelNotAllowed(f"Model {model_id} není povolen (viz TROCR_ALLOWED_MODELS)")
+
+        with self._lock:
+            entry = self._models.get(model_id)
+            if entry is not None:
+                self._models.move_to_end(model_id)
+                return entry["processor"], entry["model"], model_id
+            load_lock = self._load_locks.setdefault(model_id, threading.Lock())
+
+        # Načítání mimo hlavní zámek - ostatní modely mezitím obsluhují požadavky
+        with load_lock:
+            with self._lock:
+                entry = self._models.get(model_id)
+                if entry is not None:
+                    self._models.move_to_end(model_id)
+                    return entry["processor"], entry["model"], model_id
+
+            if self.torch_threads and not self._torch_configured and not STUB_MODEL:
+                configure_torch(self.torch_threads)
+                self._torch_configured = True
+
+            print(f"Načítám TrOCR model {model_id}...", file=sys.stderr)
+            started = time.time()
+            try:
+                processor, model = self._loader(model_id)
+            except Exception:
+                # Zámky drží jen načtené nebo právě načítané modely
+                with self._lock:
+                    self._load_locks.pop(model_id, None)
+                raise
+            size = _model_size(model)
+            print(f"Model {model_id} načten za {time.time() - started:.2f} s "
+                  f"({size / 1024 / 1024:.0f} MB)", file=sys.stderr)
+
+            with self._lock:
+                self._models[model_id] = {"processor": processor, "model": model, "size": size}
+                self._evict(keep=model_id)
+
+        return processor, model, model_id
+
+    def _evict(self, keep):
+        evicted = False
+        while self.total_bytes() > self.budget_bytes and len(self._models) > 1:
+            model_id = next(iter(self._models))
+            if model_id == keep:
+                self._models.move_to_end(model_id)
+                continue
+            entry = self._models.pop(model_id)
+            self._load_locks.pop(model_id, None)
+            print(f"Uvolňuji model {model_id} ({entry['size'] / 1024 / 1024:.0f} MB) - "
+                  f"překročen rozpočet RAM", file=sys.stderr)
+            evicted = True
+        if evicted:
+            gc.collect()
+
+    def total_bytes(self):
+        return sum(entry["size"] for entry in self._models.values())
+
+    def is_loaded(self, name=None, language=None):
+        with self._lock:
+            return resolve_model_name(name, language) in self._models
+
+    def describe(self):
+        """
+        Přehled načtených modelů pro diagnostické endpointy
+        """
+        with self._lock:
+            return {
+                "budget_mb": self.budget_bytes / 1024 / 1024,
+                "torch_threads": self.torch_threads,
+                "used_mb": self.total_bytes() / 1024 / 1024,
+                "models": [
+                    {"name": model_id, "size_mb": entry["size"] / 1024 / 1024}
+                    for model_id, entry in self._models.items()
+                ],
+                "aliases": dict(MODEL_ALIASES),
+                "stub": STUB_MODEL,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Lokální snapshoty TrOCR modelů pro offline start serveru')
+    parser.add_argument('--snapshot', nargs='+', metavar='MODEL', required=True,
+                        help='Zkratky (small/base/large/ces) nebo názvy modelů ke stažení')
+    parser.add_argument('--revision', default=MODEL_REVISION, help='Revize modelu (výchozí TROCR_MODEL_REVISION)')
+    args = parser.parse_args()
+
+    for name in args.snapshot:
+        print(f"Snapshot {resolve_model_name(name)} uložen do {download_snapshot(name, args.revision)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,75 +1,85 @@
 #!/usr/bin/env python
 """
 TrOCR Server pro rozpoznávání rukopisu
-Používá model microsoft/trocr-base-handwritten
+Výchozí model je microsoft/trocr-base-handwritten, další modely (small/large,
+česky dotrénovaný) se volí parametrem `model` v požadavku. Endpoint
+/ocr/stream posílá text průběžně během generování (Server-Sent Events).
+Port naslouchá hned po spuštění, model se načítá a zahřívá na pozadí -
+/health hlásí, že proces běží, /ready až připravenost k rozpoznávání
+(viz trocr_startup.py).
 """
 
 import os
 import sys
 import json
 import traceback
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import parse_qs, urlparse
 import cgi
 import io
 from PIL import Image
 
-# Tyto importy je třeba nainstalovat pomocí pip
-from transformers import TrOCRProcessor, VisionEncoderDecoderModel
+from trocr_models import ModelRegistry, DEFAULT_MODEL, is_allowed_model
+from admission import AdmissionController, AdmissionRejected, parse_priority
+from resource_budget import cpu_budget, describe_budget
+from trocr_decoding import DRAFT_TOKENS, beam_stats, decode_image, draft_disabled, resolve_draft, speculative_stats, stream_image
+from sampling_profiler import ProfilerBusy, is_authorized, run_profile
+from trocr_startup import StartupTracker, start_background
 
 # Nastavení portu
 PORT = 5500
 
-# Globální instance pro sdílení napříč požadavky
-processor = None
-model = None
+# Omezená fronta požadavků před modelem (viz admission.py)
+admission = AdmissionController()
 
-def initialize_model():
-    """
-    Načte model a procesor pro TrOCR
-    """
-    global processor, model
-    print("Načítám TrOCR model...")
-    try:
-        processor = TrOCRProcessor.from_pretrained('microsoft/trocr-base-handwritten')
-        model = VisionEncoderDecoderModel.from_pretrained('microsoft/trocr-base-handwritten')
-        print("Model úspěšně načten!")
-        return True
-    except Exception as e:
-        print(f"Chyba při načítání modelu: {str(e)}")
-        traceback.print_exc()
-        return False
+# Registr modelů sdílený napříč požadavky - jádra rozpočtu se dělí mezi
+# souběžně běžící požadavky, aby torch nepřekročil dostupná jádra
+registry = ModelRegistry(torch_threads=max(1, cpu_budget('trocr') // admission.max_concurrent))
+
+# Průběh studeného startu (načtení a zahřátí výchozího modelu na pozadí)
+startup = StartupTracker()
 
-def recognize_text(image_path, language='eng'):
+def recognize_text(image_path, language='eng', model_name=None, draft_model=None, draft_tokens=DRAFT_TOKENS):
     """
     Rozpozná text z obrázku pomocí TrOCR
-    """
-    global processor, model
     
+    Args:
+        image_path: Cesta k obrázku
+        language: Jazyk textu
+        model_name: Zkratka (small/base/large/ces) nebo plný název modelu
+        draft_model: Návrhový model pro spekulativní dekódování ('auto', zkratka,
+                     prázdné vypne, None = výchozí z prostředí)
+        draft_tokens: Počet navržených tokenů v jednom kroku
+    """
     try:
-        # Kontrola, zda byl model načten
-        if processor is None or model is None:
-            if not initialize_model():
-                return {
-                    "success": False,
-                    "text": "",
-                    "error": "Model se nepodařilo inicializovat"
-                }
+        # Získání modelu z registru (načte se jen při prvním použití)
+        try:
+            processor, model, model_id = registry.get(model_name, language)
+            draft = resolve_draft(registry, model_id, draft_model)
+        except Exception as e:
+            print(f"Chyba při načítání modelu: {str(e)}")
+            traceback.print_exc()
+            return {
+                "success": False,
+                "text": "",
+                "error": "Model se nepodařilo inicializovat"
+            }
         
         # Otevření a předzpracování obrázku
         image = Image.open(image_path).convert("RGB")
         
-        # Zpracování obrázku
-        pixel_values = processor(images=image, return_tensors="pt").pixel_values
-        
-        # Generování textu
-        generated_ids = model.generate(pixel_values)
-        generated_text = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+        # Generování textu (s návrhovým modelem je hladový výstup stejný, jen rychlejší)
+        generated_text, confidence, decoding = decode_image(image, processor, model, draft, draft_tokens)
         
         return {
             "success": True,
             "text": generated_text,
-            "confidence": 0.95  # TrOCR neposkytuje přímo confidence score
+            "confidence": confidence["sequence"],
+            "token_confidences": confidence["tokens"],
+            "model": model_id,
+            "decoding": decoding
         }
     except Exception as e:
         print(f"Chyba při rozpoznávání textu: {str(e)}")
@@ -80,7 +90,151 @@ def recognize_text(image_path, language='eng'):
             "error": f"Chyba při rozpoznávání textu: {str(e)}"
         }
 
+def recognize_text_stream(image_path, language='eng', model_name=None, draft_model=None, draft_tokens=DRAFT_TOKENS):
+    """
+    Rozpozná text z obrázku a průběžně vrací dekódovaný text
+    
+    Args:
+        Stejné jako `recognize_text`
+    
+    Yields:
+        Průběžné události {"delta", "text"} a nakonec výsledek {"done": True, ...}
+    """
+    try:
+        processor, model, model_id = registry.get(model_name, language)
+        draft = resolve_draft(registry, model_id, draft_model)
+        image = Image.open(image_path).convert("RGB")
+        
+        for event in stream_image(image, processor, model, draft, draft_tokens):
+            if event.get("done"):
+                confidence = event.pop("confidence")
+                event.update({
+                    "success": True,
+                    "confidence": confidence["sequence"],
+                    "token_confidences": confidence["tokens"],
+                    "model": model_id
+                })
+            yield event
+    except Exception as e:
+        print(f"Chyba při rozpoznávání textu: {str(e)}")
+        traceback.print_exc()
+        yield {
+            "done": True,
+            "success": False,
+            "text": "",
+            "error": f"Chyba při rozpoznávání textu: {str(e)}"
+        }
+
 class TrOCRHandler(BaseHTTPRequestHandler):
+    def write_event(self, event, data):
+        """
+        Odešle jednu událost Server-Sent Events
+        """
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
+    
+    def send_event_stream(self, events, queue_wait):
+        """
+        Odešle průběžné výsledky jako Server-Sent Events
+        
+        Události `text` nesou přírůstek i dosavadní text, závěrečná událost
+        `result` celý text a časy (čekání ve frontě, čas do prvního textu, celkem).
+        """
+        started = time.time()
+        first_text = None
+        
+        self.send_response(200)
+        self.send_header('Content-type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('X-Accel-Buffering', 'no')
+        self.end_headers()
+        
+        try:
+            for event in events:
+                if event.get("done"):
+                    event.pop("done")
+                    event["queue_wait"] = queue_wait
+                    event["timings"] = {
+                        "queue_wait": queue_wait,
+                        "time_to_first_text": first_text,
+                        "total": time.time() - started
+                    }
+                    self.write_event("result", event)
+                else:
+                    if first_text is None:
+                        first_text = time.time() - started
+                    self.write_event("text", event)
+        except (BrokenPipeError, ConnectionResetError):
+            # Klient zavřel spojení - generování se dokončí, aby místo ve frontě
+            # odpovídalo skutečné zátěži modelu
+            for _ in events:
+                pass
+    
+
+    def send_profile(self, query):
+        """
+        Vzorkovací profil všech vláken serveru (collapsed stacks nebo JSON)
+        
+        Parametry: seconds (délka okna), interval, format=json, idle=1
+        (včetně nečinných vláken). Bez tokenu OCR_DEBUG_TOKEN jen lokálně.
+        """
+        def param(name):
+            return query.get(name, [None])[0]
+        
+        if not is_authorized(self.client_address[0], self.headers):
+            self.send_response(403)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({"error": "Přístup odepřen"}).encode())
+            return
+        
+        try:
+            profile = run_profile(param('seconds'), param('interval'))
+        except ProfilerBusy as e:
+            self.send_response(409)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps({"error": str(e)}).encode())
+            return
+        
+        include_idle = param('idle') == '1'
+        self.send_response(200)
+        if param('format') == 'json':
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            self.wfile.write(json.dumps(profile.to_dict(include_idle)).encode())
+        else:
+            self.send_header('Content-type', 'text/plain; charset=utf-8')
+            self.end_headers()
+            self.wfile.write(profile.collapsed(include_idle).encode())
+    
+    def send_not_ready(self):
+        """
+        Rychlé odmítnutí požadavku, dokud se výchozí model nenačte a nezahřeje
+        """
+        # Tělo se dočte, aby klient neodesílal nahrávku do zavřeného spojení
+        length = int(self.headers.get('Content-Length') or 0)
+        while length > 0:
+            chunk = self.rfile.read(min(length, 1 << 16))
+            if not chunk:
+                break
+            length -= len(chunk)
+        
+        retry_after = startup.retry_after()
+        self.send_response(503)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Retry-After', str(retry_after))
+        self.end_headers()
+        
+        response = {
+            "success": False,
+            "error": "Model se ještě načítá",
+            "retry_after": retry_after,
+            "startup": startup.describe()
+        }
+        
+        self.wfile.write(json.dumps(response).encode())
+    
     def do_GET(self):
         """
         Zpracování GET požadavků (jen pro kontrolu, zda server běží)
@@ -94,10 +248,31 @@ class TrOCRHandler(BaseHTTPRequestHandler):
             
             response = {
                 "status": "ok",
-                "message": "TrOCR server běží"
+                "message": "TrOCR server běží",
+                "ready": startup.is_ready(),
+                "startup": startup.describe(),
+                "models": registry.describe(),
+                "cpu": describe_budget('trocr'),
+                "speculative_decoding": speculative_stats.describe(),
+                "beam_escalation": beam_stats.describe()
             }
             
             self.wfile.write(json.dumps(response).encode())
+        elif parsed_path.path == "/ready":
+            # Připravenost pro orchestraci a klienty - 200 až po načtení a zahřátí modelu
+            self.send_response(200 if startup.is_ready() else 503)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            
+            self.wfile.write(json.dumps(startup.describe()).encode())
+        elif parsed_path.path == "/queue":
+            self.send_response(200)
+            self.send_header('Content-type', 'application/json')
+            self.end_headers()
+            
+            self.wfile.write(json.dumps(admission.stats()).encode())
+        elif parsed_path.path == "/debug/profile":
+            self.send_profile(parse_qs(parsed_path.query))
         else:
             self.send_response(404)
             self.send_header('Content-type', 'application/json')
@@ -105,7 +280,7 @@ class TrOCRHandler(BaseHTTPRequestHandler):
             
             response = {
                 "error": "Endpoint nenalezen",
-                "message": "Použijte /ocr pro rozpoznávání textu nebo /health pro kontrolu stavu"
+                "message": "Použijte /ocr (nebo /ocr/stream) pro rozpoznávání textu, /health pro kontrolu stavu, /ready pro připravenost modelu, /queue pro stav fronty nebo /debug/profile pro profil"
             }
             
             self.wfile.write(json.dumps(response).encode())
@@ -116,7 +291,12 @@ class TrOCRHandler(BaseHTTPRequestHandler):
         """
         parsed_path = urlparse(self.path)
         
-        if parsed_path.path == "/ocr":
+        if parsed_path.path in ("/ocr", "/ocr/stream"):
+            if not startup.is_ready():
+                self.send_not_ready()
+                return
+            
+            stream = parsed_path.path == "/ocr/stream"
             content_type, pdict = cgi.parse_header(self.headers.get('Content-Type', ''))
             
             if content_type == 'multipart/form-data':
@@ -143,19 +323,69 @@ class TrOCRHandler(BaseHTTPRequestHandler):
                 # Získání parametrů
                 image_item = form['image']
                 language = form.getvalue('language', 'eng')
+                model_name = form.getvalue('model')
+                draft_model = form.getvalue('draft_model')
+                draft_tokens = str(form.getvalue('draft_tokens', ''))
+                draft_tokens = int(draft_tokens) if draft_tokens.isdigit() else DRAFT_TOKENS
+                priority = parse_priority(self.headers.get('X-OCR-Priority') or form.getvalue('priority'))
                 
-                # Vytvoření dočasného souboru pro obrázek
-                image_path = f"/tmp/trocr_temp_{os.getpid()}.png"
-                
-                with open(image_path, 'wb') as f:
-                    f.write(image_item.file.read())
-                
-                # Rozpoznání textu
-                result = recognize_text(image_path, language)
+                # Klient smí zvolit jen povolené modely - jinak by server stáhl
+                # a načetl libovolný repozitář nebo lokální cestu
+                requested = [model_name]
+                if draft_model != 'auto' and not draft_disabled(draft_model):
+                    requested.append(draft_model)
+                rejected = [name for name in requested if name and not is_allowed_model(name, language)]
+                if rejected:
+                    self.send_response(400)
+                    self.send_header('Content-type', 'application/json')
+                    self.end_headers()
+                    
+                    response = {
+                        "success": False,
+                        "error": f"Model {rejected[0]} není povolen"
+                    }
+                    
+                    self.wfile.write(json.dumps(response).encode())
+                    return
                 
-                # Odstranění dočasného souboru
-                if os.path.exists(image_path):
-                    os.remove(image_path)
+                try:
+                    with admission.slot(priority) as queue_wait:
+                        # Vytvoření dočasného souboru pro obrázek (vlákna serveru
+                        # běží souběžně, proto je v názvu i identifikátor vlákna)
+                        image_path = f"/tmp/trocr_temp_{os.getpid()}_{threading.get_ident()}.png"
+                        
+                        with open(image_path, 'wb') as f:
+                            f.write(image_item.file.read())
+                        
+                        try:
+                            if stream:
+                                # Průběžné odesílání textu během generování
+                                self.send_event_stream(recognize_text_stream(
+                                    image_path, language, model_name, draft_model, draft_tokens), queue_wait)
+                                return
+                            
+                            # Rozpoznání textu
+                            result = recognize_text(image_path, language, model_name, draft_model, draft_tokens)
+                            result["queue_wait"] = queue_wait
+                        finally:
+                            # Odstranění dočasného souboru
+                            if os.path.exists(image_path):
+                                os.remove(image_path)
+                except AdmissionRejected as e:
+                    # Přetížení se projeví rychlým odmítnutím místo timeoutu
+                    self.send_response(e.status)
+                    self.send_header('Content-type', 'application/json')
+                    self.send_header('Retry-After', str(e.retry_after))
+                    self.end_headers()
+                    
+                    response = {
+                        "success": False,
+                        "error": str(e),
+                        "retry_after": e.retry_after
+                    }
+                    
+                    self.wfile.write(json.dumps(response).encode())
+                    return
                 
                 # Odeslání odpovědi
                 self.send_response(200)
@@ -182,7 +412,7 @@ class TrOCRHandler(BaseHTTPRequestHandler):
             response = {
                 "success": False,
                 "error": "Endpoint nenalezen",
-                "message": "Použijte /ocr pro rozpoznávání textu"
+                "message": "Použijte /ocr pro rozpoznávání textu nebo /ocr/stream pro průběžný výsledek"
             }
             
             self.wfile.write(json.dumps(response).encode())
@@ -192,11 +422,11 @@ def run_server(port=PORT):
     Spustí HTTP server na zadaném portu
     """
     server_address = ('', port)
-    httpd = HTTPServer(server_address, TrOCRHandler)
+    httpd = ThreadingHTTPServer(server_address, TrOCRHandler)
     print(f"Spouštím TrOCR server na portu {port}...")
     
-    # Inicializace modelu
-    initialize_model()
+    # Načtení a zahřátí modelu na pozadí - port mezitím odpovídá na /health a /ready
+    start_background(registry, startup, DEFAULT_MODEL)
     
     try:
         httpd.serve_forever()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Studený start TrOCR serveru s měřením fází a řízením připravenosti
+
+Server dřív před otevřením portu synchronně importoval torch a transformers
+a načítal model z hubu. Když načtení selhalo, první požadavek ho zkoušel
+znovu a čekal desítky sekund. Zde se HTTP server spustí hned a model se
+načítá ve vlákně na pozadí po fázích:
+
+    import  - import torch a transformers
+    model   - načtení výchozího modelu (lokální snapshot / offline cache, viz trocr_models)
+    warmup  - zkušební rozpoznání prázdné stránky, aby první skutečný
+              požadavek neplatil inicializaci alokátoru a jader torch
+
+Délky fází se vypíší jako metrika startu a vrací je endpoint /ready
+(200 až po zahřátí, do té doby 503 s průběhem). Selhání se opakuje na
+pozadí s rostoucím odstupem, požadavky mezitím dostanou rychlé 503.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import traceback
+from contextlib import contextmanager
+from PIL import Image
+
+from trocr_models import STUB_MODEL
+from trocr_decoding import decode_image
+
+# Počet zahřívacích průchodů po načtení modelu (0 = bez zahřátí)
+WARMUP_RUNS = int(os.environ.get('TROCR_WARMUP_RUNS', 1))
+
+# Odstup opakování po selhání načtení (sekundy, zdvojuje se do maxima)
+RETRY_INITIAL = 5.0
+RETRY_MAX = 60.0
+
+# Velikost vstupu TrOCR - zahřívací obrázek se nemusí zmenšovat
+WARMUP_SIZE = (384, 384)
+
+STATE_STARTING = 'starting'
+STATE_READY = 'ready'
+STATE_FAILED = 'failed'
+
+
+class StartupTracker:
+    """
+    Stav a délky fází startu (sdílené mezi vláknem načítání a HTTP vlákny)
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.state = STATE_STARTING
+        self.phase_name = None
+        self.phases = {}
+        self.attempts = 0
+        self.error = None
+        self.model_id = None
+        self.retry_at = None
+        self.ready_after = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        with self._lock:
+            self.phase_name = name
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases[name] = time.monotonic() - started
+
+    def mark_ready(self, model_id):
+        with self._lock:
+            self.state = STATE_READY
+            self.phase_name = None
+            self.error = None
+            self.model_id = model_id
+            self.ready_after = time.monotonic() - self.started
+
+    def mark_failed(self, error, retry_in):
+        with self._lock:
+            self.state = STATE_FAILED
+            self.error = str(error)
+            self.retry_at = time.monotonic() + retry_in
+
+    def is_ready(self):
+        return self.state == STATE_READY
+
+    def retry_after(self):
+        """
+        Doporučené čekání klienta v sekundách (pro hlavičku Retry-After)
+        """
+        with self._lock:
+            if self.state == STATE_FAILED and self.retry_at is not None:
+                return max(1, int(self.retry_at - time.monotonic()) + 1)
+        return 5
+
+    def describe(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "phase": self.phase_name,
+                "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+                "elapsed": round(time.monotonic() - self.started, 3),
+                "ready_after": round(self.ready_after, 3) if self.ready_after is not None else None,
+                "attempts": self.attempts,
+                "model": self.model_id,
+                "error": self.error,
+            }
+
+    def summary(self):
+        """
+        Jednořádková metrika startu pro log
+        """
+        info = self.describe()
+        phases = ', '.join(f"{name} {seconds:.2f} s" for name, seconds in info["phases"].items())
+        return (f"Start TrOCR serveru: {phases}, připraven za {info['ready_after']:.2f} s "
+                f"(pokus {info['attempts']}) {json.dumps(info)}")
+
+
+def import_runtime():
+    """
+    Import těžkých knihoven - mimo import modulu, aby port naslouchal hned
+    """
+    if STUB_MODEL:
+        return
+    import torch  # noqa: F401
+    import transformers  # noqa: F401
+
+
+def warm_up(processor, model, runs=WARMUP_RUNS):
+    """
+    Zkušební rozpoznání prázdné stránky (alokátor, jádra torch, cache generate)
+    """
+    image = Image.new('RGB', WARMUP_SIZE, 'white')
+    for _ in range(runs):
+        decode_image(image, processor, model)
+
+
+def start_background(registry, tracker, model_name=None, warmup_runs=WARMUP_RUNS):
+    """
+    Spustí načtení a zahřátí výchozího modelu ve vlákně na pozadí
+
+    Args:
+        registry: ModelRegistry serveru
+        tracker: StartupTracker pro /ready a /health
+        model_name: Model k načtení (None = výchozí)
+        warmup_runs: Počet zahřívacích průchodů
+
+    Returns:
+        Vlákno načítání
+    """
+    def run():
+        delay = RETRY_INITIAL
+        while True:
+            tracker.attempts += 1
+            try:
+                with tracker.phase('import'):
+                    import_runtime()
+                with tracker.phase('model'):
+                    processor, model, model_id = registry.get(model_name)
+                if warmup_runs > 0:
+                    with tracker.phase('warmup'):
+                        warm_up(processor, model, warmup_runs)
+                tracker.mark_ready(model_id)
+                print(tracker.summary(), file=sys.stderr)
+                return
+            except Exception as e:
+                tracker.mark_failed(e, delay)
+                print(f"Chyba při načítání modelu (pokus {tracker.attempts}), další pokus za {delay:.0f} s: "
+                      f"{str(e)}", file=sys.stderr)
+                traceback.print_exc()
+                time.sleep(delay)
+                delay = min(delay * 2, RETRY_MAX)
+
+    thread = threading.Thread(target=run, daemon=True, name="trocr-startup")
+    thread.start()
+    return thread
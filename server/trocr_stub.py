@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Zástupný TrOCR model pro zátěžové testy a vývoj bez stahování vah
+
+Načítá se jen přes loader registru (TROCR_STUB_MODEL=1, viz trocr_models).
+Napodobuje rozhraní TrOCRProcessor a VisionEncoderDecoderModel, které
+používá trocr_decoding: generate() se skóre pro compute_transition_scores,
+streamer, config se speciálními tokeny a jeden krok dekodéru s KV cache
+pro spekulativní dekódování. Hladový průchod i beam search běží bez torch,
+spekulativní dekódování torch potřebuje stejně jako se skutečným modelem.
+"""
+
+import os
+import math
+import time
+from types import SimpleNamespace
+import numpy as np
+
+# Počet generovaných tokenů, doba na token (sekundy) a pravděpodobnost tokenu
+STUB_TOKENS = int(os.environ.get('TROCR_STUB_TOKENS', 24))
+STUB_TOKEN_SECONDS = float(os.environ.get('TROCR_STUB_TOKEN_SECONDS', 0.02))
+STUB_CONFIDENCE = float(os.environ.get('TROCR_STUB_CONFIDENCE', 0.9))
+
+# Návrhový (malý) model je o tolik rychlejší na token
+DRAFT_SPEEDUP = 4
+
+WORDS = ('Dnes', 'jsem', 'spal', 'sedm', 'hodin', 'a', 'nálada', 'byla', 'dobrá')
+
+# Speciální tokeny za slovy zástupného textu
+EOS_TOKEN = len(WORDS)
+START_TOKEN = len(WORDS) + 1
+VOCAB_SIZE = len(WORDS) + 2
+
+
+class _StubTokenizer:
+    def get_vocab(self):
+        vocab = {word: token for token, word in enumerate(WORDS)}
+        vocab.update({'</s>': EOS_TOKEN, '<s>': START_TOKEN})
+        return vocab
+
+
+class StubProcessor:
+    """
+    Zástupce TrOCRProcessor - token i < len(WORDS) je i-té slovo zástupného textu
+    """
+
+    tokenizer = _StubTokenizer()
+
+    def __call__(self, images=None, return_tensors=None):
+        return SimpleNamespace(pixel_values=images.size if images is not None else (0, 0))
+
+    def batch_decode(self, sequences, skip_special_tokens=True):
+        return [' '.join(WORDS[int(token)] for token in sequence if int(token) < len(WORDS))
+                for sequence in sequences]
+
+
+class _StubCache:
+    """
+    KV cache dekodéru - pamatuje si jen počet zpracovaných pozic
+    """
+
+    def __init__(self, length=0):
+        self.length = length
+
+    def get_seq_length(self):
+        return self.length
+
+    def crop(self, length):
+        self.length = self.length + length if length < 0 else min(self.length, length)
+
+
+class StubModel:
+    """
+    Zástupce VisionEncoderDecoderModel - generuje pevný počet tokenů
+    s nastavitelnou dobou na token (uvolňuje GIL stejně jako torch)
+    a pevnou pravděpodobností tokenů (beam search o něco vyšší)
+    """
+
+    def __init__(self, tokens=STUB_TOKENS, token_seconds=STUB_TOKEN_SECONDS, confidence=STUB_CONFIDENCE):
+        self.tokens = tokens
+        self.token_seconds = token_seconds
+        self.confidence = confidence
+        self.config = SimpleNamespace(
+            decoder=SimpleNamespace(vocab_size=VOCAB_SIZE, eos_token_id=EOS_TOKEN),
+            decoder_start_token_id=START_TOKEN, eos_token_id=EOS_TOKEN, pad_token_id=None)
+        self.generation_config = SimpleNamespace(num_beams=1, max_length=tokens + 1, pad_token_id=None)
+
+    def parameters(self):
+        return []
+
+    def buffers(self):
+        return []
+
+    def encoder(self, pixel_values=None):
+        return {"last_hidden_state": pixel_values}
+
+    def _token_logprob(self, num_beams):
+        confidence = self.confidence if (num_beams or 1) == 1 else min(1.0, self.confidence + 0.05)
+        return math.log(confidence)
+
+    def generate(self, pixel_values=None, encoder_outputs=None, num_beams=1, streamer=None,
+                 output_scores=False, return_dict_in_generate=False, **kwargs):
+        if streamer is not None:
+            streamer.put(np.array([START_TOKEN]))
+        sequence = [START_TOKEN]
+        for position in range(self.tokens):
+            time.sleep(self.token_seconds * max(1, num_beams or 1))
+            sequence.append(position % len(WORDS))
+            if streamer is not None:
+                streamer.put(np.array([sequence[-1]]))
+        if streamer is not None:
+            streamer.end()
+        if not return_dict_in_generate:
+            return [sequence]
+
+        # Skóre nese rovnou log-pravděpodobnost tokenu (viz compute_transition_scores)
+        scores = [self._token_logprob(num_beams)] * self.tokens if output_scores else None
+        return SimpleNamespace(sequences=[sequence], scores=scores, beam_indices=None)
+
+    def compute_transition_scores(self, sequences, scores, beam_indices=None, normalize_logits=False):
+        return np.array([scores])
+
+    def __call__(self, encoder_outputs=None, decoder_input_ids=None, past_key_values=None, use_cache=True, **kwargs):
+        import torch
+
+        # Jeden krok dekodéru přes všechny vstupní pozice - vstup na pozici p
+        # předpovídá p-tý vygenerovaný token jako generate()
+        past = past_key_values if past_key_values is not None else _StubCache()
+        count = decoder_input_ids.shape[-1]
+        time.sleep(self.token_seconds)
+
+        rest = math.log((1 - self.confidence) / (VOCAB_SIZE - 1)) if self.confidence < 1 else -1e4
+        logits = torch.full((1, count, VOCAB_SIZE), rest)
+        for index in range(count):
+            logits[0, index, (past.length + index) % len(WORDS)] = self._token_logprob(1)
+        past.length += count
+        return SimpleNamespace(logits=logits, past_key_values=past)
+
+
+def load_stub_model(model_id):
+    """
+    Loader registru modelů - malý model je rychlejší, aby se dal použít jako návrhový
+    """
+    token_seconds = STUB_TOKEN_SECONDS / DRAFT_SPEEDUP if 'small' in model_id else STUB_TOKEN_SECONDS
+    return StubProcessor(), StubModel(token_seconds=token_seconds)
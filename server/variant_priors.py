@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Naučené preference variant předzpracování podle uživatele
+
+Rukopis, pero i fotoaparát téhož uživatele vyhrávají opakovaně se stejnou
+dvojicí varianta/orientace. Výsledky se proto ukládají do malého lokálního
+úložiště podle uživatele (nebo otisku zařízení z EXIF) a plánovač zkouší
+nejdříve historicky vítězné varianty. Pořadí se určuje Thompsonovým
+vzorkováním z Beta rozdělení, takže méně úspěšné varianty se občas
+vyzkouší také (explorace). Varianty, které u uživatele po dostatečném počtu
+pokusů nikdy nevyhrály, se vyřazují.
+"""
+
+import os
+import sys
+import json
+import fcntl
+import random
+import tempfile
+import threading
+from contextlib import contextmanager
+from PIL import Image
+
+# Úložiště výsledků
+PRIORS_PATH = os.environ.get(
+    'OCR_PRIORS_PATH',
+    os.path.join(tempfile.gettempdir(), 'welldiary-ocr', 'variant_priors.json')
+)
+
+# Počet stránek, od kterého je uživatel "zavedený" a zkouší se nejprve jen favorit
+MIN_PAGES = int(os.environ.get('OCR_PRIORS_MIN_PAGES', 5))
+
+# Počet pokusů bez výhry, po kterém se varianta vyřadí
+PRUNE_AFTER_TRIALS = int(os.environ.get('OCR_PRIORS_PRUNE_AFTER', 8))
+
+# Pravděpodobnost, že se do plánu vrátí jedna vyřazená varianta
+EXPLORATION_RATE = float(os.environ.get('OCR_PRIORS_EXPLORATION', 0.1))
+
+# Skóre kvality, při kterém se výsledek favorita přijme bez dalších variant
+ACCEPT_SCORE = float(os.environ.get('OCR_PRIORS_ACCEPT_SCORE', 60))
+
+# EXIF tagy výrobce a modelu zařízení
+_EXIF_MAKE = 0x010F
+_EXIF_MODEL = 0x0110
+
+# Zámek vláken procesu; mezi procesy (pool, pre-fork server) zamyká fcntl
+# zámek vedle úložiště, jinak by souběžné čtení-úprava-zápis ztrácelo výsledky
+_lock = threading.Lock()
+
+
+def arm_key(variant, orientation):
+    return f"{variant}:{orientation}"
+
+
+def device_fingerprint(image_path):
+    """
+    Otisk zařízení z EXIF (výrobce a model), pokud chybí identifikátor uživatele
+    """
+    try:
+        with Image.open(image_path) as image:
+            exif = image.getexif()
+            make = str(exif.get(_EXIF_MAKE, '')).strip()
+            model = str(exif.get(_EXIF_MODEL, '')).strip()
+    except Exception:
+        return None
+
+    if not make and not model:
+        return None
+    return f"device:{make} {model}".strip()
+
+
+@contextmanager
+def _store_lock():
+    """
+    Výhradní zámek úložiště napříč vlákny i procesy
+    """
+    with _lock:
+        try:
+            os.makedirs(os.path.dirname(PRIORS_PATH), exist_ok=True)
+            lock_file = open(f"{PRIORS_PATH}.lock", 'a')
+        except OSError as e:
+            # Bez zámku mezi procesy se v nejhorším ztratí souběžný výsledek
+            print(f"Varování: Nelze zamknout preference variant: {str(e)}", file=sys.stderr)
+            yield
+            return
+        with lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _load_store():
+    try:
+        with open(PRIORS_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_store(store):
+    try:
+        os.makedirs(os.path.dirname(PRIORS_PATH), exist_ok=True)
+        temp_path = f"{PRIORS_PATH}.{os.getpid()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(store, f)
+        os.replace(temp_path, PRIORS_PATH)
+    except OSError as e:
+        print(f"Varování: Nelze uložit preference variant: {str(e)}", file=sys.stderr)
+
+
+def load_priors(user_id):
+    """
+    Vrátí statistiky variant pro uživatele ({"pages": n, "arms": {klíč: {wins, trials}}})
+    """
+    if not user_id:
+        return {"pages": 0, "arms": {}}
+    return _load_store().get(user_id, {"pages": 0, "arms": {}})
+
+
+def plan_arms(user_id, arms, rng=random):
+    """
+    Seřadí dvojice (varianta, orientace) podle preferencí uživatele
+
+    Args:
+        user_id: Identifikátor uživatele nebo otisk zařízení
+        arms: Seznam dvojic (varianta, orientace) ve výchozím pořadí
+        rng: Zdroj náhody (pro testování)
+
+    Returns:
+        Tuple (seřazené dvojice, zda je uživatel zavedený)
+    """
+    priors = load_priors(user_id)
+    stats = priors.get("arms", {})
+
+    ranked = []
+    pruned = []
+    for index, arm in enumerate(arms):
+        entry = stats.get(arm_key(*arm), {"wins": 0, "trials": 0})
+        wins, trials = entry["wins"], entry["trials"]
+
+        if trials >= PRUNE_AFTER_TRIALS and wins == 0:
+            pruned.append(arm)
+            continue
+
+        # Thompsonovo vzorkování z Beta(výhry + 1, prohry + 1)
+        sample = rng.betavariate(wins + 1, trials - wins + 1)
+        ranked.append((-sample, index, arm))
+
+    ranked.sort()
+    ordered = [arm for _, _, arm in ranked]
+
+    # Občasná explorace vyřazených variant
+    if pruned and rng.random() < EXPLORATION_RATE:
+        ordered.append(rng.choice(pruned))
+
+    if not ordered:
+        ordered = list(arms)
+
+    return ordered, priors.get("pages", 0) >= MIN_PAGES
+
+
+def record_outcome(user_id, tried_arms, winner):
+    """
+    Zaznamená výsledek stránky - vyzkoušené varianty a vítěze
+
+    Args:
+        user_id: Identifikátor uživatele nebo otisk zařízení
+        tried_arms: Dvojice (varianta, orientace), které se na stránce spustily
+        winner: Vítězná dvojice nebo None, pokud žádná varianta nic nerozpoznala
+    """
+    if not user_id:
+        return
+
+    with _store_lock():
+        store = _load_store()
+        priors = store.setdefault(user_id, {"pages": 0, "arms": {}})
+        priors["pages"] += 1
+
+        for arm in tried_arms:
+            entry = priors["arms"].setdefault(arm_key(*arm), {"wins": 0, "trials": 0})
+            entry["trials"] += 1
+            if winner is not None and tuple(arm) == tuple(winner):
+                entry["wins"] += 1
+
+        _save_store(store)
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Pool pracovních procesů s paměťovým rozpočtem a recyklací pracovníků
+
+`ProcessPoolExecutor` nemá žádný limit paměti - každý pracovník drží
+plnou BGR i šedotónovou kopii obrázku a mezivýsledky PIL a dlouho běžící
+proces postupně roste fragmentací alokátorů OpenCV a Tesseractu. Tento
+pool proto:
+
+- sleduje RSS každého pracovníka (/proc/<pid>/statm) a špičku jeho
+  podprocesů Tesseractu (getrusage),
+- recykluje pracovníka po MAX_TASKS úlohách nebo po překročení stropu RSS,
+- spouští úlohu jen tehdy, když se její odhadovaná paměť (z rozměrů
+  obrázku) vejde do globálního rozpočtu spolu s ostatními běžícími
+  úlohami - jinak úloha počká,
+- hlásí špičkovou a ustálenou paměť celého poolu.
+
+Pád pracovníka (např. OOM kill) selže jen jeho úlohu, pracovník se
+nahradí novým a pool běží dál. Počáteční pracovníci se forkují hned při
+vytvoření poolu ve vytvářejícím vlákně (sdílí načtené moduly rodiče),
+náhradní vznikají za běhu řídicích vláken, proto přes forkserver - fork
+vícevláknového procesu může v potomkovi zanechat zamčené zámky. Rozhraní (`submit`, `map`, `shutdown`,
+context manager) odpovídá `concurrent.futures` executoru.
+"""
+
+import os
+import queue
+import pickle
+import resource
+import threading
+import statistics
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from PIL import Image
+from resource_budget import memory_budget
+
+# Počet úloh, po kterém se pracovník nahradí novým procesem
+MAX_TASKS = int(os.environ.get('OCR_WORKER_MAX_TASKS', 50))
+
+# Strop RSS pracovníka (MB), nad kterým se po dokončení úlohy recykluje
+RSS_CEILING_MB = float(os.environ.get('OCR_WORKER_RSS_CEILING_MB', 768))
+
+# Odhad paměti na pixel: plná BGR kopie po dekódování (3 B/px) a pracovní
+# kopie zmenšeného obrazu - šedá, mezivýsledky PIL, výsledek, otočení a
+# vnitřní obrazy Tesseractu (~12 B/px zmenšeného obrazu)
+DECODED_BYTES_PER_PIXEL = 3
+WORKING_BYTES_PER_PIXEL = 12
+
+# Počet posledních měření pro výpočet ustálené paměti
+STEADY_WINDOW = 100
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+class WorkerLost(Exception):
+    """
+    Pracovní proces skončil během úlohy (např. OOM kill)
+    """
+
+
+def process_rss(pid):
+    """
+    Aktuální RSS procesu v bajtech (0, pokud proces neexistuje)
+    """
+    try:
+        with open(f'/proc/{pid}/statm', 'r') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def estimate_image_footprint(image_path, max_dimension=None):
+    """
+    Odhad paměti jedné úlohy předzpracování a OCR podle rozměrů obrázku
+
+    Args:
+        image_path: Cesta k obrázku (čte se jen hlavička)
+        max_dimension: Maximální rozměr po zmenšení (None = bez zmenšení)
+
+    Returns:
+        Odhad v bajtech (0, pokud rozměry nelze zjistit)
+    """
+    try:
+        with Image.open(image_path) as image:
+            width, height = image.size
+    except Exception:
+        return 0
+
+    pixels = width * height
+    scale = 1.0
+    if max_dimension and max(width, height) > max_dimension:
+        scale = max_dimension / max(width, height)
+    return int(pixels * DECODED_BYTES_PER_PIXEL + pixels * scale * scale * WORKING_BYTES_PER_PIXEL)
+
+
+def _memory_report():
+    """
+    Paměť pracovníka po úloze - aktuální RSS a špičky (ru_maxrss je v kB)
+    """
+    return {
+        "rss": process_rss(os.getpid()),
+        "peak": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "children_peak": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+    }
+
+
+def _worker_main(conn, initializer, initargs):
+    """
+    Smyčka pracovního procesu - přijímá (funkce, argumenty), vrací (úspěch, výsledek, paměť)
+    """
+    if initializer is not None:
+        initializer(*initargs)
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message is None:
+            break
+
+        fn, args = message
+        try:
+            reply = (True, fn(*args))
+        except Exception as e:
+            reply = (False, e)
+
+        try:
+            conn.send(reply + (_memory_report(),))
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            conn.send((False, RuntimeError(f"Výsledek úlohy nelze přenést: {str(e)}"), _memory_report()))
+
+
+class _Worker:
+    """
+    Jeden pracovní proces a jeho statistiky
+    """
+
+    def __init__(self, context, initializer, initargs):
+        parent_conn, child_conn = context.Pipe()
+        self.conn = parent_conn
+        self.process = context.Process(target=_worker_main, args=(child_conn, initializer, initargs),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        self.rss = process_rss(self.process.pid)
+        self.peak = self.rss
+        self.children_peak = 0
+
+    def run(self, fn, args):
+        self.conn.send((fn, args))
+        try:
+            ok, value, memory = self.conn.recv()
+        except (EOFError, OSError):
+            raise WorkerLost(f"Pracovní proces {self.process.pid} skončil během úlohy "
+                             f"(kód {self.process.exitcode})")
+        self.tasks += 1
+        self.rss = memory["rss"]
+        self.peak = max(self.peak, memory["peak"])
+        self.children_peak = max(self.children_peak, memory["children_peak"])
+        return ok, value
+
+    def stop(self, timeout=5):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    Pool procesů s paměťovým rozpočtem, sledováním RSS a recyklací pracovníků
+    """
+
+    def __init__(self, max_workers, memory_budget_bytes=None, max_tasks=MAX_TASKS,
+                 rss_ceiling_mb=RSS_CEILING_MB, initializer=None, initargs=(), engine=None):
+        """
+        Args:
+            max_workers: Počet pracovních procesů
+            memory_budget_bytes: Globální rozpočet paměti (výchozí z resource_budget.memory_budget)
+            max_tasks: Počet úloh, po kterém se pracovník recykluje
+            rss_ceiling_mb: Strop RSS pracovníka pro recyklaci
+            initializer: Inicializace pracovního procesu
+            initargs: Argumenty inicializace
+            engine: Jméno enginu pro výchozí rozpočet
+        """
+        self.max_workers = max(1, max_workers)
+        self.budget = memory_budget_bytes if memory_budget_bytes is not None else memory_budget(engine)
+        self.max_tasks = max_tasks
+        self.rss_ceiling = int(rss_ceiling_mb * 1024 * 1024)
+        self._initializer = initializer
+        self._initargs = initargs
+        self._context = multiprocessing.get_context()
+        methods = multiprocessing.get_all_start_methods()
+        self._replacement_context = multiprocessing.get_context(
+            'forkserver' if 'forkserver' in methods else 'spawn')
+
+        self._tasks = queue.Queue()
+        self._cond = threading.Condition()
+        self._workers = [None] * self.max_workers
+        self._in_flight = {}
+        self._threads = []
+        self._shutdown = False
+
+        self._completed = 0
+        self._admission_waits = 0
+        self._recycled = {"tasks": 0, "memory": 0, "lost": 0}
+        self._peak_bytes = 0
+        self._worker_peak = 0
+        self._tesseract_peak = 0
+        self._totals = deque(maxlen=STEADY_WINDOW)
+
+        # Forkuje se dřív, než vzniknou řídicí vlákna poolu
+        for slot in range(self.max_workers):
+            self._workers[slot] = _Worker(self._context, initializer, initargs)
+
+    def _start_threads(self):
+        # Jedno řídicí vlákno na pracovníka - vybírá úlohy ze společné fronty
+        if not self._threads:
+            for slot in range(self.max_workers):
+                thread = threading.Thread(target=self._manage, args=(slot,), daemon=True,
+                                          name=f"worker-pool-{slot}")
+                thread.start()
+                self._threads.append(thread)
+
+    def _resident_bytes(self):
+        return sum(worker.rss for worker in self._workers if worker is not None)
+
+    def _admit(self, slot, footprint):
+        """
+        Počká, až se odhad úlohy vejde do rozpočtu (úloha bez ostatních běžících
+        se spustí vždy, aby velký obrázek nezablokoval pool)
+        """
+        with self._cond:
+            waited = False
+            while (self.budget is not None and self._in_flight
+                   and self._resident_bytes() + sum(self._in_flight.values()) + footprint > self.budget):
+                waited = True
+                self._cond.wait()
+            if waited:
+                self._admission_waits += 1
+            self._in_flight[slot] = footprint
+            self._peak_bytes = max(self._peak_bytes, self._resident_bytes() + sum(self._in_flight.values()))
+
+    def _release(self, slot):
+        with self._cond:
+            self._in_flight.pop(slot, None)
+            total = self._resident_bytes()
+            self._totals.append(total)
+            self._peak_bytes = max(self._peak_bytes, total)
+            self._cond.notify_all()
+
+    def _recycle(self, slot, reason):
+        worker = self._workers[slot]
+        self._workers[slot] = None
+        if worker is not None:
+            worker.stop()
+        with self._cond:
+            self._recycled[reason] += 1
+
+    def _manage(self, slot):
+        while True:
+            item = self._tasks.get()
+            if item is None:
+                break
+            future, fn, args, footprint = item
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            self._admit(slot, footprint)
+            try:
+                if self._workers[slot] is None:
+                    # Náhrada recyklovaného pracovníka - bez forku vícevláknového procesu
+                    self._workers[slot] = _Worker(self._replacement_context, self._initializer, self._initargs)
+                worker = self._workers[slot]
+                ok, value = worker.run(fn, args)
+            except WorkerLost as e:
+                self._recycle(slot, "lost")
+                future.set_exception(e)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                with self._cond:
+                    self._worker_peak = max(self._worker_peak, worker.peak)
+                    self._tesseract_peak = max(self._tesseract_peak, worker.children_peak)
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+                # Recyklace po počtu úloh nebo nad stropem paměti
+                if worker.tasks >= self.max_tasks:
+                    self._recycle(slot, "tasks")
+                elif worker.rss > self.rss_ceiling:
+                    self._recycle(slot, "memory")
+            finally:
+                with self._cond:
+                    self._completed += 1
+                self._release(slot)
+
+        if self._workers[slot] is not None:
+            self._workers[slot].stop()
+            self._workers[slot] = None
+
+    def submit(self, fn, *args, footprint=0):
+        """
+        Naplánuje úlohu
+
+        Args:
+            fn: Funkce spustitelná v pracovním procesu (musí jít serializovat)
+            footprint: Odhad paměti úlohy v bajtech (viz estimate_image_footprint)
+
+        Returns:
+            Future s výsledkem
+        """
+        if self._shutdown:
+            raise RuntimeError("Pool pracovníků je ukončen")
+        self._start_threads()
+        future = Future()
+        self._tasks.put((future, fn, args, footprint))
+        return future
+
+    def map(self, fn, *iterables, footprint=0, timeout=None):
+        """
+        Paralelní map - výsledky ve stejném pořadí jako vstupy
+        """
+        futures = [self.submit(fn, *args, footprint=footprint) for args in zip(*iterables)]
+
+        def results():
+            try:
+                for future in futures:
+                    yield future.result(timeout)
+            finally:
+                for future in futures:
+                    future.cancel()
+
+        return results()
+
+    def stats(self):
+        """
+        Přehled paměti a recyklace pro výpisy a diagnostiku
+        """
+        with self._cond:
+            workers = [{"pid": worker.process.pid, "tasks": worker.tasks, "rss": worker.rss,
+                        "peak": worker.peak, "children_peak": worker.children_peak}
+                       for worker in self._workers if worker is not None]
+            return {
+                "budget_bytes": self.budget,
+                "resident_bytes": self._resident_bytes(),
+                "peak_bytes": self._peak_bytes,
+                "worker_peak_bytes": self._worker_peak,
+                "tesseract_peak_bytes": self._tesseract_peak,
+                "steady_bytes": int(statistics.median(self._totals)) if self._totals else 0,
+                "completed": self._completed,
+                "admission_waits": self._admission_waits,
+                "recycled": dict(self._recycled),
+                "workers": workers,
+            }
+
+    def describe(self):
+        """
+        Jednořádkový souhrn paměti poolu
+        """
+        stats = self.stats()
+        mb = 1024 * 1024
+        budget = f"{stats['budget_bytes'] / mb:.0f} MB" if stats['budget_bytes'] else "bez limitu"
+        recycled = ', '.join(f"{reason} {count}" for reason, count in stats['recycled'].items())
+        return (f"Paměť pracovníků: špička {stats['peak_bytes'] / mb:.0f} MB, ustálená "
+                f"{stats['steady_bytes'] / mb:.0f} MB, největší pracovník {stats['worker_peak_bytes'] / mb:.0f} MB, "
+                f"Tesseract {stats['tesseract_peak_bytes'] / mb:.0f} MB, rozpočet {budget}, "
+                f"čekání na paměť {stats['admission_waits']}x, recyklace ({recycled})")
+
+    def shutdown(self, wait=True):
+        if self._shutdown:
+            return
+        self._shutdown = True
+        if not self._threads:
+            # Pool bez úloh - předem vytvořené pracovníky nemá kdo ukončit
+            for slot, worker in enumerate(self._workers):
+                if worker is not None:
+                    worker.stop()
+                    self._workers[slot] = None
+        for _ in self._threads:
+            self._tasks.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(wait=True)
+        return False
+
+
+class ThreadPool(ThreadPoolExecutor):
+    """
+    Pool vláken se stejným rozhraním jako WorkerPool
+
+    Vlákna sdílí paměť procesu, odhad paměti úloh se proto nepoužívá
+    a hlásí se RSS celého procesu.
+    """
+
+    def __init__(self, max_workers):
+        super().__init__(max_workers=max(1, max_workers), thread_name_prefix='ocr-thread')
+        self._totals = deque(maxlen=STEADY_WINDOW)
+
+    def submit(self, fn, *args, footprint=0, **kwargs):
+        return super().submit(self._measured, fn, *args, **kwargs)
+
+    def _measured(self, fn, *args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._totals.append(process_rss(os.getpid()))
+
+    def map(self, fn, *iterables, footprint=0, timeout=None, chunksize=1):
+        return super().map(fn, *iterables, timeout=timeout)
+
+    def stats(self):
+        memory = _memory_report()
+        return {
+            "budget_bytes": None,
+            "resident_bytes": memory["rss"],
+            "peak_bytes": memory["peak"],
+            "steady_bytes": int(statistics.median(self._totals)) if self._totals else memory["rss"],
+            "tesseract_peak_bytes": memory["children_peak"],
+        }
+
+    def describe(self):
+        stats = self.stats()
+        mb = 1024 * 1024
+        return (f"Paměť procesu (vlákna): špička {stats['peak_bytes'] / mb:.0f} MB, ustálená "
+                f"{stats['steady_bytes'] / mb:.0f} MB, Tesseract {stats['tesseract_peak_bytes'] / mb:.0f} MB")
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Porovnání režimů paralelizace optimized_trocr.py (OCR_EXECUTOR)
+
+Pro každý režim ('process' = pool procesů, 'thread' = pool vláken se
+sdíleným dekódovaným obrazem) spustí dávkové rozpoznávání stejného
+syntetického korpusu a změří celkový čas, čas do první hotové stránky,
+propustnost a průběh RSS celého stromu procesů (včetně Tesseractu).
+Režim se volí pro nasazení - výsledek na cílovém stroji rozhodne, který
+je výhodnější.
+
+Příklady:
+    python test-scripts/benchmark_executors.py --pages 20 --repeat 3
+    python test-scripts/benchmark_executors.py --modes thread --workers 4 --output executors.json
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from loadtest_ocr import ROOT_DIR, SERVER_DIR, RssSampler, generate_corpus, git_revision
+
+MODES = ('process', 'thread')
+
+
+def write_corpus(pages, directory):
+    for page in pages:
+        with open(os.path.join(directory, page['name']), 'wb') as f:
+            f.write(page['data'])
+
+
+def run_once(mode, corpus_dir, args):
+    """
+    Jedno dávkové spuštění v zadaném režimu
+
+    Returns:
+        Dictionary s časy, počtem stránek a RSS
+    """
+    env = dict(os.environ, OCR_EXECUTOR=mode)
+    if args.workers:
+        env['OCR_CPU_BUDGET'] = str(args.workers)
+    command = [sys.executable, os.path.join(SERVER_DIR, 'optimized_trocr.py'), '--batch', corpus_dir,
+               '--language', args.language, '--jobs', str(args.jobs)]
+
+    started = time.time()
+    process = subprocess.Popen(command, cwd=ROOT_DIR, env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, text=True)
+    sampler = RssSampler(process.pid, args.rss_interval, started)
+    sampler.start()
+
+    first_page = None
+    pages = failed = 0
+    for line in process.stdout:
+        if not line.startswith('{'):
+            continue
+        if first_page is None:
+            first_page = time.time() - started
+        pages += 1
+        if not json.loads(line).get('success'):
+            failed += 1
+    process.wait()
+    wall_time = time.time() - started
+    sampler.stop()
+
+    rss = [mb for _, mb in sampler.samples]
+    return {
+        'wall_time': round(wall_time, 3),
+        'first_page': round(first_page, 3) if first_page is not None else None,
+        'pages': pages,
+        'failed': failed,
+        'pages_per_second': round(pages / wall_time, 3) if wall_time > 0 else None,
+        'rss_peak_mb': max(rss, default=None),
+        'rss_mean_mb': round(statistics.mean(rss), 1) if rss else None,
+        'exit_code': process.returncode,
+    }
+
+
+def summarize(runs):
+    """
+    Medián metrik přes opakování
+    """
+    summary = {}
+    for key in ('wall_time', 'first_page', 'pages_per_second', 'rss_peak_mb', 'rss_mean_mb'):
+        values = [run[key] for run in runs if run[key] is not None]
+        summary[key] = round(statistics.median(values), 3) if values else None
+    summary['failed'] = sum(run['failed'] for run in runs)
+    return summary
+
+
+def print_table(results):
+    header = f"{'režim':<10}{'čas [s]':>10}{'1. strana [s]':>15}{'stran/s':>10}{'RSS špička':>12}{'RSS průměr':>12}"
+    print(header)
+    print('-' * len(header))
+    for mode, result in results.items():
+        s = result['summary']
+        cells = [s['wall_time'], s['first_page'], s['pages_per_second'], s['rss_peak_mb'], s['rss_mean_mb']]
+        text = [f"{value:.2f}" if value is not None else '-' for value in cells]
+        print(f"{mode:<10}{text[0]:>10}{text[1]:>15}{text[2]:>10}{text[3]:>12}{text[4]:>12}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Porovnání režimů paralelizace optimized_trocr (OCR_EXECUTOR)')
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=list(MODES), help='Porovnávané režimy')
+    parser.add_argument('--pages', type=int, default=12, help='Počet stránek syntetického korpusu')
+    parser.add_argument('--repeat', type=int, default=1, help='Počet opakování každého režimu')
+    parser.add_argument('--workers', type=int, help='Počet pracovníků pro oba režimy (OCR_CPU_BUDGET)')
+    parser.add_argument('--jobs', type=int, default=1, help='Současně zpracovávané stránky (--jobs dávky)')
+    parser.add_argument('--language', default='eng', help='Jazyk pro OCR')
+    parser.add_argument('--rss-interval', type=float, default=0.2, help='Interval vzorkování RSS v sekundách')
+    parser.add_argument('--output', help='Soubor pro JSON report')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = {}
+
+    with tempfile.TemporaryDirectory(prefix='welldiary-executors-') as corpus_dir:
+        write_corpus(generate_corpus(args.pages), corpus_dir)
+        print(f'Vygenerováno {args.pages} syntetických stránek', file=sys.stderr)
+
+        for mode in args.modes:
+            runs = []
+            for attempt in range(max(1, args.repeat)):
+                run = run_once(mode, corpus_dir, args)
+                print(f"{mode} #{attempt + 1}: {run['wall_time']:.2f} s, {run['pages']} stránek, "
+                      f"RSS špička {run['rss_peak_mb']} MB", file=sys.stderr)
+                runs.append(run)
+            results[mode] = {'runs': runs, 'summary': summarize(runs)}
+
+    print_table(results)
+
+    if args.output:
+        report = {
+            'version': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': {'platform': platform.platform(), 'cpus': os.cpu_count()},
+            'config': {'pages': args.pages, 'repeat': args.repeat, 'workers': args.workers,
+                       'jobs': args.jobs, 'language': args.language},
+            'results': results,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f'Report uložen do {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
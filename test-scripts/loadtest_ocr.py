@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+"""
+Zátěžový test Python OCR služeb (kraken_api.py, trocr_server.py)
+
+Spustí vybraný server (nebo použije už běžící na zadané adrese), vygeneruje
+syntetický korpus stránek deníku a zatěžuje endpoint /ocr s nastavitelnou
+souběžností a průběhem příchodů požadavků. Výsledkem je propustnost,
+latence p50/p95/p99, podíl chyb, timeoutů a odmítnutí (429/503), průběh
+RSS serveru v čase a strojově čitelný JSON report pro porovnání verzí.
+
+Příklady:
+    # TrOCR server se zástupným modelem (bez stahování vah), 4 souběžní klienti
+    python test-scripts/loadtest_ocr.py --target trocr --stub-model --concurrency 4 --duration 30
+
+    # Kraken API, Poissonovy příchody 2 požadavky/s
+    python test-scripts/loadtest_ocr.py --target kraken --pattern poisson --rate 2 --output report.json
+
+    # Už běžící server
+    python test-scripts/loadtest_ocr.py --url http://localhost:5500 --pattern burst --rate 8
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import socket
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from PIL import Image, ImageDraw, ImageFont
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_DIR = os.path.join(ROOT_DIR, 'server')
+
+# Servery, které umí harness spustit: skript, proměnné prostředí, endpoint stavu
+TARGETS = {
+    'kraken': {
+        'script': 'kraken_api.py',
+        'port': 5001,
+        'env': lambda port: {'FLASK_PORT': str(port)},
+        'args': lambda port: [],
+        'ready_path': '/queue',
+    },
+    'trocr': {
+        'script': 'trocr_server.py',
+        'port': 5500,
+        'env': lambda port: {},
+        'args': lambda port: [str(port)],
+        'ready_path': '/ready',
+    },
+}
+
+PATTERNS = ('closed', 'poisson', 'burst', 'ramp')
+
+# Řádky syntetických stránek deníku
+JOURNAL_LINES = [
+    'Datum: {day}.{month}.2024',
+    'Nálada: {mood}/10',
+    'Spánek: {sleep} hodin',
+    'Dnes jsem byl na procházce v parku.',
+    'Ráno běh 5 km, odpoledne práce na projektu.',
+    'Mood: {mood}/10, Sleep: {sleep} hours',
+    'Večer jsem četl knihu a šel brzy spát.',
+    'Cítil jsem se unavený, ale spokojený.',
+]
+
+
+def generate_corpus(count, seed=42):
+    """
+    Vygeneruje syntetické stránky deníku jako PNG data
+
+    Stránky se liší počtem řádků, velikostí, pootočením a šumem, aby
+    odpovídaly rozptylu skutečných nahrávek.
+    """
+    rng = random.Random(seed)
+    try:
+        font = ImageFont.truetype('DejaVuSans.ttf', 28)
+    except OSError:
+        font = ImageFont.load_default()
+
+    pages = []
+    for index in range(count):
+        width = rng.choice([800, 1200, 1600])
+        lines = rng.randint(3, 14)
+        height = 120 + lines * 60
+        image = Image.new('L', (width, height), 255)
+        draw = ImageDraw.Draw(image)
+        for line in range(lines):
+            text = rng.choice(JOURNAL_LINES).format(
+                day=rng.randint(1, 28), month=rng.randint(1, 12),
+                mood=rng.randint(1, 10), sleep=rng.choice([5, 6, 6.5, 7, 7.5, 8]))
+            draw.text((40 + rng.randint(0, 20), 60 + line * 60), text, fill=rng.randint(0, 60), font=font)
+
+        image = image.rotate(rng.uniform(-2, 2), fillcolor=255, expand=False)
+        noise = Image.effect_noise(image.size, rng.uniform(5, 20))
+        image = Image.blend(image, noise, 0.08)
+
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+        pages.append({'name': f'page_{index:03d}.png', 'data': buffer.getvalue(), 'lines': lines})
+    return pages
+
+
+def encode_multipart(fields, file_field, filename, data):
+    """
+    Sestaví tělo multipart/form-data (bez závislosti na requests)
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append((f'--{boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+                  f'filename="{filename}"\r\nContent-Type: image/png\r\n\r\n').encode())
+    parts.append(data)
+    parts.append(f'\r\n--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def send_request(url, page, language, priority, timeout):
+    """
+    Odešle jednu stránku na /ocr a vrátí záznam o požadavku
+    """
+    body, content_type = encode_multipart({'language': language}, 'image', page['name'], page['data'])
+    request = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': content_type,
+        'X-OCR-Priority': priority,
+    })
+
+    started = time.time()
+    record = {'start': started, 'page': page['name']}
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            payload = response.read()
+            record['status'] = response.status
+            try:
+                record['success'] = bool(json.loads(payload).get('success'))
+            except ValueError:
+                record['success'] = False
+    except urllib.error.HTTPError as e:
+        record['status'] = e.code
+        record['success'] = False
+        record['retry_after'] = e.headers.get('Retry-After')
+    except (socket.timeout, TimeoutError):
+        record['status'] = None
+        record['success'] = False
+        record['error'] = 'timeout'
+    except (urllib.error.URLError, ConnectionError) as e:
+        reason = getattr(e, 'reason', e)
+        record['status'] = None
+        record['success'] = False
+        record['error'] = 'timeout' if isinstance(reason, (socket.timeout, TimeoutError)) else 'connection'
+    record['latency'] = time.time() - started
+    return record
+
+
+def arrival_times(pattern, duration, rate, burst_size, ramp_to, seed=7):
+    """
+    Časy příchodů požadavků (v sekundách od startu) pro otevřené vzory
+
+    poisson - exponenciální rozestupy se střední frekvencí `rate`
+    burst   - dávky `burst_size` požadavků, průměrně `rate` požadavků/s
+    ramp    - frekvence lineárně roste z `rate` na `ramp_to`
+    """
+    rng = random.Random(seed)
+    times = []
+    if pattern == 'poisson':
+        t = rng.expovariate(rate)
+        while t < duration:
+            times.append(t)
+            t += rng.expovariate(rate)
+    elif pattern == 'burst':
+        interval = burst_size / rate
+        t = 0.0
+        while t < duration:
+            times.extend([t] * burst_size)
+            t += interval
+    elif pattern == 'ramp':
+        t = 0.0
+        while t < duration:
+            current = rate + (ramp_to - rate) * (t / duration)
+            times.append(t)
+            t += 1.0 / max(current, 1e-6)
+    return times
+
+
+def process_tree_rss(pid):
+    """
+    Součet RSS procesu a jeho potomků v MB (z /proc)
+    """
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'r') as f:
+                stat = f.read()
+            ppid = int(stat[stat.rindex(')') + 2:].split()[1])
+            children.setdefault(ppid, []).append(int(entry))
+        except (OSError, ValueError):
+            continue
+
+    total_kb = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        try:
+            with open(f'/proc/{current}/status', 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total_kb += int(line.split()[1])
+                        break
+        except OSError:
+            continue
+        stack.extend(children.get(current, []))
+    return total_kb / 1024
+
+
+class RssSampler(threading.Thread):
+    """
+    Periodicky zaznamenává RSS serveru (včetně podprocesů)
+    """
+
+    def __init__(self, pid, interval, started):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.started = started
+        self.samples = []
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.samples.append([round(time.time() - self.started, 2), round(process_tree_rss(self.pid), 1)])
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def start_server(target, port, stub_model, log_path):
+    """
+    Spustí server jako podproces se stejným pracovním adresářem jako aplikace
+    """
+    config = TARGETS[target]
+    env = dict(os.environ, **config['env'](port))
+    if stub_model:
+        env['TROCR_STUB_MODEL'] = '1'
+    log = open(log_path, 'w')
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(SERVER_DIR, config['script'])] + config['args'](port),
+        cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return process, log
+
+
+def wait_ready(base_url, ready_path, timeout, process=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'Server skončil s kódem {process.returncode}')
+        try:
+            with urllib.request.urlopen(base_url + ready_path, timeout=2) as response:
+                if response.status == 200:
+                    return
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f'Server na {base_url} nebyl připraven do {timeout} s')
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(fraction * (len(values) - 1)))))
+    return round(values[index], 4)
+
+
+def summarize(records, wall_time):
+    """
+    Souhrnné metriky běhu
+    """
+    ok = [r for r in records if r.get('status') == 200 and r.get('success')]
+    latencies = [r['latency'] for r in ok]
+    by_status = {}
+    for r in records:
+        key = str(r.get('status') or r.get('error'))
+        by_status[key] = by_status.get(key, 0) + 1
+
+    total = len(records)
+    timeouts = sum(1 for r in records if r.get('error') == 'timeout')
+    rejected = sum(1 for r in records if r.get('status') in (429, 503))
+    return {
+        'requests': total,
+        'succeeded': len(ok),
+        'throughput_rps': round(len(ok) / wall_time, 3) if wall_time else 0.0,
+        'error_rate': round((total - len(ok)) / total, 4) if total else 0.0,
+        'timeout_rate': round(timeouts / total, 4) if total else 0.0,
+        'rejection_rate': round(rejected / total, 4) if total else 0.0,
+        'latency': {
+            'mean': round(sum(latencies) / len(latencies), 4) if latencies else None,
+            'p50': percentile(latencies, 0.50),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'max': round(max(latencies), 4) if latencies else None,
+        },
+        'by_status': by_status,
+    }
+
+
+def timeline(records, started, bucket=1.0):
+    """
+    Počet dokončených požadavků, chyb a p95 latence po intervalech
+    """
+    buckets = {}
+    for r in records:
+        key = int((r['start'] + r['latency'] - started) // bucket)
+        buckets.setdefault(key, []).append(r)
+    rows = []
+    for key in sorted(buckets):
+        items = buckets[key]
+        ok = [r['latency'] for r in items if r.get('status') == 200 and r.get('success')]
+        rows.append({
+            't': round(key * bucket, 2),
+            'completed': len(ok),
+            'failed': len(items) - len(ok),
+            'p95': percentile(ok, 0.95),
+        })
+    return rows
+
+
+def run_load(url, corpus, args):
+    """
+    Zatěžuje server podle zvoleného vzoru a vrátí záznamy požadavků
+    """
+    records = []
+    lock = threading.Lock()
+    deadline = time.time() + args.duration
+    counter = iter(range(10 ** 9))
+
+    def next_page():
+        return corpus[next(counter) % len(corpus)]
+
+    def record(result):
+        with lock:
+            records.append(result)
+
+    if args.pattern == 'closed':
+        # Uzavřený systém - každý klient posílá další požadavek po dokončení předchozího
+        def client():
+            while time.time() < deadline:
+                record(send_request(url, next_page(), args.language, args.priority, args.timeout))
+
+        threads = [threading.Thread(target=client, daemon=True) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return records
+
+    # Otevřený systém - příchody nezávisí na rychlosti serveru, souběžnost
+    # klientů omezuje jen `max_in_flight`
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=args.max_in_flight) as executor:
+        for offset in arrival_times(args.pattern, args.duration, args.rate, args.burst_size, args.ramp_to):
+            delay = started + offset - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            future = executor.submit(send_request, url, next_page(), args.language, args.priority, args.timeout)
+            future.add_done_callback(lambda f: record(f.result()))
+    return records
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR,
+                              capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Zátěžový test OCR služeb (kraken_api, trocr_server)')
+    parser.add_argument('--target', choices=sorted(TARGETS), default='trocr', help='Server, který se spustí')
+    parser.add_argument('--url', help='Adresa už běžícího serveru (server se nespouští)')
+    parser.add_argument('--port', type=int, help='Port spouštěného serveru')
+    parser.add_argument('--stub-model', action='store_true',
+                        help='TrOCR server se zástupným modelem (TROCR_STUB_MODEL=1, bez stahování vah)')
+    parser.add_argument('--pattern', choices=PATTERNS, default='closed', help='Průběh příchodů požadavků')
+    parser.add_argument('--concurrency', type=int, default=4, help='Počet klientů pro vzor closed')
+    parser.add_argument('--rate', type=float, default=2.0, help='Požadavky za sekundu pro otevřené vzory')
+    parser.add_argument('--ramp-to', type=float, default=10.0, help='Koncová frekvence vzoru ramp')
+    parser.add_argument('--burst-size', type=int, default=8, help='Velikost dávky vzoru burst')
+    parser.add_argument('--max-in-flight', type=int, default=64, help='Maximum současných požadavků otevřených vzorů')
+    parser.add_argument('--duration', type=float, default=30.0, help='Délka zátěže v sekundách')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Timeout jednoho požadavku')
+    parser.add_argument('--pages', type=int, default=20, help='Počet stránek syntetického korpusu')
+    parser.add_argument('--language', default='eng', help='Jazyk posílaný v požadavcích')
+    parser.add_argument('--priority', default='interactive', help='Hlavička X-OCR-Priority')
+    parser.add_argument('--rss-interval', type=float, default=1.0, help='Interval vzorkování RSS v sekundách')
+    parser.add_argument('--startup-timeout', type=float, default=300.0, help='Čekání na start serveru')
+    parser.add_argument('--output', help='Soubor pro JSON report (jinak stdout)')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    config = TARGETS[args.target]
+    process = None
+    log = None
+
+    corpus = generate_corpus(args.pages)
+    print(f'Vygenerováno {len(corpus)} syntetických stránek', file=sys.stderr)
+
+    try:
+        if args.url:
+            base_url = args.url.rstrip('/')
+            wait_ready(base_url, config['ready_path'], args.startup_timeout)
+        else:
+            port = args.port or config['port']
+            base_url = f'http://127.0.0.1:{port}'
+            log_path = os.path.join(tempfile.gettempdir(), f'loadtest_{args.target}_{port}.log')
+            process, log = start_server(args.target, port, args.stub_model, log_path)
+            print(f'Spouštím {config["script"]} na portu {port} (log: {log_path})', file=sys.stderr)
+            wait_ready(base_url, config['ready_path'], args.startup_timeout, process)
+
+        started = time.time()
+        sampler = RssSampler(process.pid, args.rss_interval, started) if process else None
+        if sampler:
+            sampler.start()
+
+        records = run_load(base_url + '/ocr', corpus, args)
+        wall_time = time.time() - started
+
+        if sampler:
+            sampler.stop()
+        rss = sampler.samples if sampler else []
+
+        report = {
+            'version': git_revision(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'host': {'platform': platform.platform(), 'cpus': os.cpu_count()},
+            'config': {
+                'target': args.target if not args.url else args.url,
+                'stub_model': args.stub_model,
+                'pattern': args.pattern,
+                'concurrency': args.concurrency,
+                'rate': args.rate,
+                'ramp_to': args.ramp_to,
+                'burst_size': args.burst_size,
+                'duration': args.duration,
+                'timeout': args.timeout,
+                'pages': args.pages,
+                'language': args.language,
+                'priority': args.priority,
+            },
+            'wall_time': round(wall_time, 3),
+            'summary': summarize(records, wall_time),
+            'rss_mb': {
+                'peak': max((mb for _, mb in rss), default=None),
+                'final': rss[-1][1] if rss else None,
+                'samples': rss,
+            },
+            'timeline': timeline(records, started),
+        }
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if log is not None:
+            log.close()
+
+    summary = report['summary']
+    print(f"Požadavků: {summary['requests']}, úspěšných: {summary['succeeded']}, "
+          f"propustnost: {summary['throughput_rps']} req/s", file=sys.stderr)
+    print(f"Latence p50/p95/p99: {summary['latency']['p50']} / {summary['latency']['p95']} / "
+          f"{summary['latency']['p99']} s, chyby: {summary['error_rate']:.1%}, "
+          f"timeouty: {summary['timeout_rate']:.1%}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+        print(f'Report uložen do {args.output}', file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()